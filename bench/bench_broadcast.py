@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Рассылка всем через Broadcaster против FakeBot с задержкой ответа:
+скорость при разной параллельности и проверка «ровно один раз» —
+прогон обрывается на середине (как kill процесса: без flush), состояние
+поднимается из хранилища и журнала, рассылка продолжается.
+
+    python bench/bench_broadcast.py --users 2000 --latency 0.05 --concurrency 1 8 32
+    python bench/bench_broadcast.py --rate 25     # с лимитом Telegram
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import time
+
+import replay_season as rs
+
+bot = rs.bot
+
+
+def seed_users(count):
+    now = bot.BOT_END.isoformat()
+    bot.get_store().put_many([
+        dict(bot.DEFAULT_USER_STATE, user_id=user_id, last_feed_time=now)
+        for user_id in range(1, count + 1)
+    ])
+
+
+def restart(fake_bot, run_name):
+    """Как новый процесс: кэш и журнал заново, снимок + хвост журнала"""
+    bot._store.close()
+    bot._store = None
+    bot.STATE = bot.StateCache()
+    bot.JOURNAL = bot.EventJournal(bot.DATA_DIR / f"{run_name}-journal")
+    bot.STATE.preload()
+    replayed = bot.recover_from_journal()
+    bot.BROADCASTS = bot.Broadcaster(concurrency=bot.BROADCASTS.concurrency)
+    bot.BROADCASTS.start(fake_bot, bot.get_store().get_meta("broadcasts"))
+    return replayed
+
+
+async def throughput(users, concurrency, latency, rate):
+    run_name = f"broadcast-{concurrency}"
+    fake_bot = rs.FakeBot(latency=latency)
+    rs.reset_state(bot.VirtualClock(bot.BOT_END), fake_bot, run_name)
+    if rate:
+        bot.OUTBOX.bucket = bot.TokenBucket(rate, bot.GLOBAL_SEND_BURST)
+    bot.BROADCASTS = bot.Broadcaster(concurrency=concurrency)
+    bot.BROADCASTS.start(fake_bot)
+    seed_users(users)
+    started = time.perf_counter()
+    bot.check_bot_end()
+    await bot.BROADCASTS.drain()
+    elapsed = time.perf_counter() - started
+    await bot.OUTBOX.stop()
+    return len(fake_bot.sent) / elapsed, len(fake_bot.sent)
+
+
+async def crash_and_resume(users, latency):
+    run_name = "broadcast-crash"
+    fake_bot = rs.FakeBot(latency=latency)
+    rs.reset_state(bot.VirtualClock(bot.BOT_END), fake_bot, run_name)
+    bot.BROADCASTS = bot.Broadcaster(concurrency=16)
+    bot.BROADCASTS.start(fake_bot)
+    seed_users(users)
+
+    bot.check_bot_end()
+    task = bot.BROADCASTS._tasks["season_end"]
+    while len(fake_bot.sent) < users // 2 + 7:  # Посреди страницы
+        await asyncio.sleep(0.001)
+    task.cancel()  # Падение: без stop() и без flush
+    await asyncio.gather(task, return_exceptions=True)
+    before = len(fake_bot.sent)
+
+    replayed = restart(fake_bot, run_name)
+    await bot.BROADCASTS.drain()
+    relaunched = bot.check_bot_end()  # Повторный конец сезона — ничего не шлёт
+    await bot.BROADCASTS.drain()
+    await bot.OUTBOX.stop()
+
+    per_chat = {}
+    for _, _, chat_id, _ in fake_bot.sent:
+        per_chat[chat_id] = per_chat.get(chat_id, 0) + 1
+    duplicates = sum(1 for count in per_chat.values() if count > 1)
+    missing = users - len(per_chat)
+    return before, replayed, len(fake_bot.sent), duplicates, missing, relaunched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="ответ Bot API, с")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, default=0, help="сообщений/с на всех (0 — без лимита)")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    try:
+        print(f"пользователей: {args.users}, задержка ответа: {args.latency * 1e3:.0f} мс, "
+              f"лимит: {args.rate or 'нет'}")
+        print(f"{'параллельно':>12} {'сообщ./с':>10} {'доставлено':>11}")
+        for concurrency in args.concurrency:
+            rate, sent = asyncio.run(throughput(args.users, concurrency, args.latency, args.rate))
+            print(f"{concurrency:>12} {rate:>10.0f} {sent:>11}")
+
+        before, replayed, sent, duplicates, missing, relaunched = asyncio.run(
+            crash_and_resume(args.users, args.latency))
+        print(f"\nпадение посреди рассылки: до падения {before}, из журнала отметок {replayed}, "
+              f"всего отправлено {sent}")
+        print(f"повторов: {duplicates}, недоставлено: {missing}, повторный запуск: {relaunched}")
+    finally:
+        shutil.rmtree(os.environ["DATA_DIR"], ignore_errors=True)
+    return 1 if duplicates or missing or relaunched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Чек-ины: насколько разброс интервала разводит пользователей по тикам.
+
+Все пользователи встают в одну минуту (утреннее сообщение в 5:30 — общий
+якорь), дальше каждый живёт своей цепочкой чек-инов до конца рабочего дня;
+часть добытчиков отчитывается /done, и их интервал растёт. Для разных
+CHECKIN_JITTER — сколько минут дня с чек-инами, самый большой тик
+и сколько чек-инов за день получает пользователь.
+
+    python bench/bench_checkin.py --users 10000 --jitter 0 0.1 0.25
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-checkin-")  # Не трогать рабочий DATA_DIR
+for source in (ROOT / "data").glob("*.json"):
+    shutil.copy(source, os.environ["DATA_DIR"])
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+
+import storoz_bot as bot  # noqa: E402
+
+
+def simulate_day(users, active_share, rng):
+    """Тики (минуты) с чек-инами за день и число чек-инов на пользователя"""
+    schedule = bot.schedule_of({})
+    _, end = bot.checkin_settings()
+    day = int(schedule.zone.local(bot.BOT_START.timestamp()) // bot.DAY_SECONDS) + 3  # Будний день сезона
+    wakeup = schedule.zone.to_utc(day * bot.DAY_SECONDS + schedule.wakeup(day))
+    day_end = schedule.zone.to_utc(day * bot.DAY_SECONDS + end)
+    ticks = {}
+    per_user = []
+    for user_id in range(1, users + 1):
+        data = {"user_id": user_id, "checkin_backoff": 0}
+        bot.plan_checkin(data, wakeup)
+        feeds = sorted(rng.uniform(wakeup, day_end) for _ in range(3)) if rng.random() < active_share else []
+        sent = 0
+        while data["checkin_at"] < day_end:
+            if feeds and feeds[0] < data["checkin_at"]:
+                bot.checkin_activity(data, feeds.pop(0))
+                continue
+            ticks[data["checkin_at"]] = ticks.get(data["checkin_at"], 0) + 1
+            bot.checkin_sent(data, data["checkin_at"])
+            sent += 1
+        per_user.append(sent)
+    return ticks, per_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--jitter", type=float, nargs="+", default=[0.0, 0.1, bot.CHECKIN_JITTER])
+    parser.add_argument("--active", type=float, default=0.3, help="доля тех, кто трижды за день делает /done")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    interval, _ = bot.checkin_settings()
+    print(f"пользователей: {args.users}, интервал {interval // 60} мин, активных {args.active:.0%}")
+    print(f"{'разброс':>8} {'минут с чек-инами':>18} {'самый большой тик':>18} {'чек-инов на польз.':>19}")
+    for jitter in args.jitter:
+        bot.CHECKIN_JITTER = jitter
+        ticks, per_user = simulate_day(args.users, args.active, random.Random(args.seed))
+        mean = sum(per_user) / len(per_user)
+        print(f"{jitter:>8.0%} {len(ticks):>18} {max(ticks.values()):>18} "
+              f"{mean:>10.1f} ({min(per_user)}–{max(per_user)})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузка на обработчики через настоящий Application: синтетические Update
+тысяч пользователей проходят цепочку CommandHandler и MessageHandler
+(handle_text), Bot API отвечает StubRequest, часы виртуальные. Между
+обновлениями срабатывает main_timer — как в проде, таймер и команды
+делят один цикл событий.
+
+Для каждого обработчика и хранилища — пропускная и p50/p95/p99.
+Результаты можно сохранить и сравнить с прошлым прогоном:
+
+    python bench/bench_handlers.py --users 2000 --updates 20000
+    python bench/bench_handlers.py --save before.json
+    python bench/bench_handlers.py --compare before.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import replay_season as rs
+from stub_request import StubRequest
+from telegram import Update
+
+bot = rs.bot
+bot.BOT_TOKEN = bot.BOT_TOKEN or "123456:STUB"
+
+# Середина сезона, утро: впереди и команды, и все события таймера
+START = (bot.BOT_START + timedelta(days=3)).replace(hour=8, minute=0)
+
+# Вид обновления -> (текст, вес в потоке)
+MIX = {
+    "/status": ("/status", 3),
+    "/done": ("/done", 2),
+    "/done шифр": (None, 1),  # Шифр открытой цели пользователя — в момент отправки
+    "/tried": ("/tried", 1),
+    "текст: сделал": ("сделал, принёс добычу", 1),
+    "текст: болтовня": ("привет всем, кто сегодня идёт на охоту к реке", 4),
+}
+
+
+MIN_COMPARE_SAMPLES = 20
+
+
+def make_update(update_id, user_id, text, tg_bot):
+    message = {
+        "message_id": update_id,
+        "date": int(START.timestamp()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": update_id, "message": message}, tg_bot)
+
+
+def make_script(users, count, rng):
+    kinds = list(MIX)
+    weights = [weight for _, weight in MIX.values()]
+    return [(rng.randint(1, users), kind) for kind in rng.choices(kinds, weights, k=count)]
+
+
+async def timed(samples, name, coro):
+    started = time.perf_counter()
+    await coro
+    samples.setdefault(name, []).append(time.perf_counter() - started)
+
+
+async def run_backend(backend, args):
+    """Один прогон: свежее хранилище backend, те же пользователи и тот же поток"""
+    run_name = f"handlers-{backend}"
+    bot.STATE_BACKEND = backend
+    bot.STATE_JSON_FILE = bot.DATA_DIR / f"{run_name}.json"
+    clock = bot.VirtualClock(START)
+    app = bot.build_application(updater=False, request=StubRequest(args.latency))
+    samples = {}
+    async with app:
+        rs.reset_state(clock, app.bot, run_name)
+        context = SimpleNamespace(bot=app.bot, job_queue=None, args=None)
+        rng = random.Random(args.seed)
+
+        starts = [make_update(-user_id, user_id, "/start", app.bot) for user_id in range(1, args.users + 1)]
+        for update in starts:
+            await timed(samples, "/start", app.process_update(update))
+        await bot.OUTBOX.drain()
+
+        script = make_script(args.users, args.updates, rng)
+        updates = [
+            (kind, None if MIX[kind][0] is None else make_update(n, user_id, MIX[kind][0], app.bot), user_id)
+            for n, (user_id, kind) in enumerate(script, 1)
+        ]
+        wall_started = time.perf_counter()
+        next_tick = args.tick_every
+        for i in range(0, len(updates), args.concurrency):
+            window = []
+            for kind, update, user_id in updates[i:i + args.concurrency]:
+                if update is None:
+                    code = (rs.open_task_code(user_id) or ["G1"])[0]
+                    update = make_update(-i, user_id, f"/done {code}", app.bot)
+                window.append(timed(samples, kind, app.process_update(update)))
+            await asyncio.gather(*window)
+            if args.tick_every and i + len(window) >= next_tick:
+                next_tick += args.tick_every
+                # Сначала запись того, что накопили команды, потом тик (он сбрасывает уже своё)
+                await timed(samples, "flush_state", bot.flush_state())
+                clock.advance(timedelta(minutes=args.tick_minutes))
+                await timed(samples, "main_timer", bot.main_timer(context))
+                await bot.OUTBOX.drain()
+        wall = time.perf_counter() - wall_started
+        await bot.OUTBOX.stop()
+        await bot.flush_state()
+        bot.get_store().close()
+        bot._store = None
+    return samples, len(updates) / wall
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(samples):
+    report = {}
+    for name, values in samples.items():
+        values = sorted(values)
+        report[name] = {
+            "n": len(values),
+            "ops": len(values) / sum(values),
+            "p50": statistics.median(values),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1, help="обновлений одновременно")
+    parser.add_argument("--tick-every", type=int, default=200, help="main_timer через столько обновлений (0 — без)")
+    parser.add_argument("--tick-minutes", type=int, default=1, help="на сколько сдвигать часы к тику")
+    parser.add_argument("--latency", type=float, default=0.0, help="ответ Bot API, с")
+    parser.add_argument("--backends", nargs="+", default=["sqlite", "json"], choices=("sqlite", "json"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="сравнить p95 с сохранёнными результатами")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="допустимый рост p95 при --compare (доли мс шумят)")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = {}
+    try:
+        for backend in args.backends:
+            samples, rate = asyncio.run(run_backend(backend, args))
+            results[backend] = {"updates_per_second": rate, "handlers": summarize(samples)}
+    finally:
+        shutil.rmtree(os.environ["DATA_DIR"], ignore_errors=True)
+
+    print(f"пользователей: {args.users}, обновлений: {args.updates}, одновременно: {args.concurrency}, "
+          f"тик каждые {args.tick_every} обновлений")
+    for backend, result in results.items():
+        print(f"\n{backend}: {result['updates_per_second']:.0f} обновлений/с")
+        print(f"{'обработчик':>18} {'вызовов':>8} {'оп/с':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8}")
+        for name, r in result["handlers"].items():
+            print(f"{name:>18} {r['n']:>8} {r['ops']:>8.0f} {r['p50'] * 1e3:>8.3f} "
+                  f"{r['p95'] * 1e3:>8.3f} {r['p99'] * 1e3:>8.3f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for backend, result in results.items():
+            for name, r in result["handlers"].items():
+                before = baseline.get(backend, {}).get("handlers", {}).get(name)
+                if before is None or min(before["n"], r["n"]) < MIN_COMPARE_SAMPLES:
+                    continue  # По горстке замеров p95 — шум
+                if r["p95"] > before["p95"] * (1 + args.tolerance):
+                    regressions.append(f"{backend} {name}: p95 {before['p95'] * 1e3:.3f} → {r['p95'] * 1e3:.3f} мс")
+        print(f"\nсравнение с {args.compare} (допуск {args.tolerance:.0%}): "
+              f"{'без регрессий' if not regressions else 'РЕГРЕССИИ'}")
+        for line in regressions:
+            print(f"  ! {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Стоимость распознавания команды в свободном тексте на поток сообщений
+оживлённого группового чата: старые цепочки `in` против IntentMatcher.
+
+Большая часть сообщений — болтовня без команд, часть содержит синонимы,
+отрицания и перекрытия («попробовал, но не сделал»).
+
+    python bench/bench_intents.py --messages 200000
+"""
+
+import argparse
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-intents-")  # Не трогать рабочий DATA_DIR
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+
+import storoz_bot as bot  # noqa: E402
+
+CHATTER = (
+    "привет всем кто идёт сегодня на охоту вечером у костра мясо рыба "
+    "лес река завтра погода снег мороз дети дом работа отчёт встреча "
+    "созвон кофе обед ужин ну да нет ладно понял ок спасибо а где когда"
+).split()
+
+SAMPLES = [
+    ("сделал", "done"),
+    ("Сделала!", "done"),
+    ("всё готово, принёс добычу", "done"),
+    ("попробовал, но не сделал", "tried"),
+    ("не сделал пока", None),
+    ("не вышло сегодня", "tried"),
+    ("как племя?", "status"),
+    ("покажи статус", "status"),
+    ("задача готова", "done"),
+    ("я не готов", None),
+    ("готова выйти на охоту", None),
+    ("какой статус у задачи", None),
+    ("переделал отчёт", None),
+    ("привет, кто на охоту", None),
+]
+
+
+def legacy(text):
+    """Как handle_text работал раньше"""
+    text = text.lower().strip()
+    if "сделал" in text or "сделала" in text:
+        return "done"
+    elif "попробовал" in text or "попробовала" in text:
+        return "tried"
+    return None
+
+
+def make_messages(count, command_share, rng):
+    phrases = [phrase for phrase, _ in SAMPLES]
+    messages = []
+    for _ in range(count):
+        words = rng.choices(CHATTER, k=rng.randint(2, 30))
+        if rng.random() < command_share:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(phrases))
+        messages.append(" ".join(words))
+    return messages
+
+
+def measure(classify, messages):
+    started = time.perf_counter()
+    hits = 0
+    for text in messages:
+        if classify(text) is not None:
+            hits += 1
+    return time.perf_counter() - started, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--command-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    matcher = bot.IntentMatcher(ROOT / "data" / "intents.json")
+    matcher.refresh()
+
+    print(f"{'сообщение':<32} {'раньше':>8} {'теперь':>8} {'ожидается':>10}")
+    wrong = 0
+    for text, expected in SAMPLES:
+        actual = matcher.classify(text)
+        wrong += actual != expected
+        print(f"{text:<32} {str(legacy(text)):>8} {str(actual):>8} {str(expected):>10}")
+
+    messages = make_messages(args.messages, args.command_share, random.Random(args.seed))
+    words = sum(len(text.split()) for text in messages)
+    print(f"\nсообщений: {len(messages)}, слов в среднем: {words / len(messages):.1f}")
+    print(f"{'способ':>14} {'мкс/сообщ.':>11} {'сообщ./с':>12} {'команд':>8}")
+    for name, classify in (("цепочка in", legacy), ("IntentMatcher", matcher.classify)):
+        elapsed, hits = measure(classify, messages)
+        print(f"{name:>14} {elapsed / len(messages) * 1e6:>11.2f} "
+              f"{len(messages) / elapsed:>12.0f} {hits:>8}")
+    print(f"\nошибок классификации: {wrong}")
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Сколько вызовов Bot API стоит статус за день: каждый /status отдельным
+сообщением против закреплённого живого статуса, который правится пачкой
+раз в LIVE_STATUS_INTERVAL и только если текст изменился.
+
+Виртуальный день 07:00–23:00, каждый пользователь много раз смотрит
+/status и несколько раз делает /done или /tried.
+
+    python bench/bench_live_status.py --users 200 --checks 15 --actions 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sys
+from datetime import timedelta
+from types import SimpleNamespace
+
+import replay_season as rs
+
+bot = rs.bot
+
+
+def make_script(user_ids, checks, actions, start, rng):
+    """(минута от начала дня, user_id, команда)"""
+    minutes = 16 * 60
+    script = []
+    for user_id in user_ids:
+        script += [(rng.randrange(minutes), user_id, "status") for _ in range(checks)]
+        script += [(rng.randrange(minutes), user_id, rng.choice(("done", "tried"))) for _ in range(actions)]
+    script.sort()
+    return script
+
+
+async def run_day(user_ids, script, start, live):
+    bot.LIVE_STATUS = live
+    clock = bot.VirtualClock(start)
+    fake_bot = rs.FakeBot(clock=clock.now)
+    rs.reset_state(clock, fake_bot, f"live-{live}")
+    context = SimpleNamespace(bot=fake_bot, job_queue=None, args=None)
+    replies = []
+    commands = {"status": bot.cmd_status, "done": bot.cmd_done, "tried": bot.cmd_tried}
+
+    for user_id in user_ids:
+        await bot.cmd_start(rs.fake_update(user_id, replies), context)
+    start_replies = len(replies)
+    i = 0
+    for minute in range(16 * 60):
+        clock.set(start + timedelta(minutes=minute))
+        while i < len(script) and script[i][0] == minute:
+            _, user_id, command = script[i]
+            await commands[command](rs.fake_update(user_id, replies), context)
+            i += 1
+        if live:
+            await bot.live_status_job(context)  # Задача job_queue, раз в LIVE_STATUS_INTERVAL
+        await bot.OUTBOX.drain()
+    await bot.OUTBOX.stop()
+
+    calls = {}
+    for _, method, _, kwargs in fake_bot.sent:
+        calls[method] = calls.get(method, 0) + 1
+    return len(replies) - start_replies, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--checks", type=int, default=15, help="/status на пользователя за день")
+    parser.add_argument("--actions", type=int, default=4, help="/done и /tried на пользователя за день")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    start = (bot.BOT_START + timedelta(days=2)).replace(hour=7, minute=0)
+    user_ids = list(range(1, args.users + 1))
+    script = make_script(user_ids, args.checks, args.actions, start, random.Random(args.seed))
+    try:
+        results = {
+            "сообщением на /status": asyncio.run(run_day(user_ids, script, start, live=False)),
+            "живой статус": asyncio.run(run_day(user_ids, script, start, live=True)),
+        }
+    finally:
+        shutil.rmtree(os.environ["DATA_DIR"], ignore_errors=True)
+
+    print(f"пользователей: {args.users}, /status: {args.checks}, /done+/tried: {args.actions} на каждого за день")
+    print(f"{'':>22} {'ответы':>8} {'закрепы':>8} {'правки':>8} {'всего':>8} {'на польз.':>10}")
+    for name, (replies, calls) in results.items():
+        created = calls.get("pin_chat_message", 0)
+        edits = calls.get("edit_message_text", 0)
+        total = replies + created * 2 + edits
+        print(f"{name:>22} {replies:>8} {created:>8} {edits:>8} {total:>8} {total / args.users:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк очереди отправки: всплеск уведомлений (5:30 и :55) для N
+пользователей через Outbox и FakeBot, без сети.
+
+    python bench/bench_outbox.py --users 2000 --per-user 2 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-outbox-")  # Не трогать рабочий DATA_DIR
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+
+from storoz_bot import Outbox  # noqa: E402
+from fake_bot import FakeBot  # noqa: E402
+
+
+async def run(args):
+    bot = FakeBot(latency=args.latency, flood_every=args.flood_every)
+    outbox = Outbox(
+        global_rate=args.global_rate,
+        global_burst=args.global_burst,
+        chat_interval=args.chat_interval,
+        retry_base=0.05,
+    )
+    outbox.start(bot)
+
+    started = time.monotonic()
+    for n in range(args.per_user):
+        for user_id in range(1, args.users + 1):
+            outbox.send_message(user_id, f"сообщение {n}", kind="bench")
+    await outbox.drain()
+    elapsed = time.monotonic() - started
+    await outbox.stop()
+
+    # Проверка лимитов: интервал в чате и максимум за любую секунду
+    min_gap = min(
+        (b[0] - a[0] for sent in bot.by_chat().values() for a, b in zip(sent, sent[1:])),
+        default=0.0,
+    )
+    per_second = {}
+    for sent_at, *_ in bot.sent:
+        bucket = int((sent_at - started) // 1)
+        per_second[bucket] = per_second.get(bucket, 0) + 1
+    order_ok = all(
+        [m[2]["text"] for m in sent] == [f"сообщение {n}" for n in range(args.per_user)]
+        for sent in bot.by_chat().values()
+    )
+
+    total = args.users * args.per_user
+    print(f"сообщений:          {total}")
+    print(f"доставлено:         {outbox.sent} (повторов: {outbox.retried}, выброшено: {outbox.dropped})")
+    print(f"время:              {elapsed:.2f} с")
+    print(f"пропускная способность: {outbox.sent / elapsed:.1f} сообщ./с")
+    print(f"пик за секунду:     {max(per_second.values())} (лимит {args.global_rate} + пачка {args.global_burst})")
+    print(f"мин. интервал в чате: {min_gap:.3f} с (лимит {args.chat_interval})")
+    print(f"порядок в чатах:    {'ok' if order_ok else 'НАРУШЕН'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--per-user", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка FakeBot, с")
+    parser.add_argument("--flood-every", type=int, default=0, help="каждый N-й вызов — 429")
+    parser.add_argument("--global-rate", type=float, default=25)
+    parser.add_argument("--global-burst", type=float, default=5)
+    parser.add_argument("--chat-interval", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Профилирование по /profile: сколько стоят точки замера, когда оно выключено,
+и насколько замедляют тик режимы phases, sample и cprofile.
+
+1. Одна точка `with PROFILER.phase(...)` против пустого места — выключенный
+   и включённый профилировщик.
+2. Всплески таймера (утро 5:30, дофамин 6:55) на тысячах пользователей:
+   тик без профилирования и под каждым режимом; в конце — сводка по фазам,
+   как её получит администратор.
+
+    python bench/bench_profile.py --users 5000
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import timeit
+from datetime import timedelta
+from types import SimpleNamespace
+
+import replay_season as rs
+
+bot = rs.bot
+
+DAY = (bot.BOT_START + timedelta(days=2)).replace(hour=0, minute=0)
+BURSTS = (timedelta(hours=5, minutes=30), timedelta(hours=6, minutes=55))
+MODES = (None,) + bot.Profiler.MODES
+
+
+def hook_cost(number):
+    """Наносекунды на одну точку замера сверх пустого цикла"""
+    def run(stmt):
+        return min(timeit.repeat(stmt, globals={"PROFILER": bot.PROFILER}, number=number, repeat=5)) / number
+
+    empty = run("pass")
+    off = run("with PROFILER.phase('x'): pass")
+    bot.PROFILER.start("timer", 1)
+    on = run("with PROFILER.phase('x'): pass")
+    bot.PROFILER.finish()
+    return (off - empty) * 1e9, (on - empty) * 1e9
+
+
+def seed_users(count, moment):
+    bot.get_store().put_many([
+        dict(bot.DEFAULT_USER_STATE, user_id=user_id, weekday_wakeup="05:30",
+             current_date=moment.strftime("%Y-%m-%d"), last_feed_time=(moment - timedelta(hours=1)).isoformat())
+        for user_id in range(1, count + 1)
+    ])
+    bot.STATE.preload()
+    for data in bot.STATE.users.values():
+        bot.SCHEDULER.reschedule(data, moment)
+
+
+async def run_mode(mode, users):
+    clock = bot.VirtualClock(DAY + timedelta(hours=5))
+    fake_bot = rs.FakeBot()
+    rs.reset_state(clock, fake_bot, f"profile-{mode}")
+    seed_users(users, clock.now())
+    context = SimpleNamespace(bot=fake_bot, job_queue=None, args=None)
+    if mode is not None:
+        bot.PROFILER.start("timer", len(BURSTS), mode)
+    costs = []
+    for at in BURSTS:
+        clock.set(DAY + at)
+        started = time.perf_counter()
+        await bot.main_timer(context)
+        costs.append(time.perf_counter() - started)
+        await bot.OUTBOX.drain()
+    await bot.OUTBOX.stop()
+    bot.get_store().close()
+    bot._store = None
+    return costs, len(fake_bot.sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--number", type=int, default=200000, help="повторов для замера точки")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    try:
+        off, on = hook_cost(args.number)
+        print(f"точка замера: выключено {off:.0f} нс, включено {on:.0f} нс")
+
+        print(f"\nпользователей: {args.users}")
+        print(f"{'режим':>9} {'утро, мс':>9} {'дофамин, мс':>12} {'сообщений':>10}")
+        baseline = None
+        for mode in MODES:
+            costs, sent = asyncio.run(run_mode(mode, args.users))
+            baseline = baseline or costs
+            slower = " ".join(f"{cost / base:.2f}x" for cost, base in zip(costs, baseline))
+            print(f"{mode or 'выкл.':>9} {costs[0] * 1e3:>9.1f} {costs[1] * 1e3:>12.1f} {sent:>10}   {slower}")
+            if mode == "phases":
+                summary = sorted(bot.PROFILE_DIR.glob("timer-*.txt"))[-1].read_text(encoding="utf-8")
+        print(f"\n{summary}")
+    finally:
+        rs.shutil.rmtree(rs.os.environ["DATA_DIR"], ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
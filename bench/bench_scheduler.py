@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Стоимость тика планировщика в зависимости от числа пользователей:
+heap (UserScheduler) против columnar (HungerIndex на NumPy).
+
+Каждый тик: pop_due + пересчёт сработавших пользователей + peek;
+между тиками часть пользователей присылает /done.
+
+    python bench/bench_scheduler.py --users 10 1000 100000
+"""
+
+import argparse
+import atexit
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-scheduler-")  # Не трогать рабочий DATA_DIR
+for source in (ROOT / "data").glob("*.json"):
+    shutil.copy(source, os.environ["DATA_DIR"])
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+
+import storoz_bot as bot  # noqa: E402
+
+
+def make_users(count, start, rng):
+    users = []
+    for user_id in range(1, count + 1):
+        users.append({
+            "user_id": user_id,
+            "current_date": start.strftime("%Y-%m-%d"),
+            "morning_done": True,
+            "last_feed_time": (start - timedelta(minutes=rng.randint(0, 30 * 60))).isoformat(),
+            "hunger_notified": False,
+            "last_dopamine_hour": None,
+            "goodnight_sent": False,
+        })
+    return users
+
+
+def run(mode, count, ticks, feeds_per_tick, seed):
+    rng = random.Random(seed)
+    start = bot.BOT_START + timedelta(days=2, hours=8)
+    clock = bot.VirtualClock(start)
+    bot.set_clock(clock)
+    bot.SCHEDULER_MODE = mode
+    scheduler = bot.make_scheduler()
+    users = make_users(count, start, rng)
+    for data in users:
+        scheduler.reschedule(data)
+    scheduler.peek()
+
+    costs = []
+    fired = 0
+    for _ in range(ticks):
+        due = scheduler.peek()
+        if due is None:
+            break
+        clock.set(bot.datetime.fromtimestamp(due, bot.TIMEZONE))
+        now = clock.now()
+        since = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        began = time.perf_counter()
+        due_users = scheduler.pop_due(now)
+        for user_id in due_users:
+            data = users[user_id - 1]
+            data["hunger_notified"] = True
+            data["last_dopamine_hour"] = now.hour
+            scheduler.reschedule(data, since)
+        scheduler.peek()
+        costs.append(time.perf_counter() - began)
+        fired += len(due_users)
+        # Несколько /done между тиками
+        for user_id in rng.sample(range(1, count + 1), min(feeds_per_tick, count)):
+            data = users[user_id - 1]
+            data["last_feed_time"] = now.isoformat()
+            data["hunger_notified"] = False
+            scheduler.reschedule(data)
+    return costs, fired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--feeds-per-tick", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'пользователей':>14} {'планировщик':>12} {'тик, мс':>10} {'p99, мс':>10} {'событий/тик':>12}")
+    for count in args.users:
+        for mode in ("heap", "columnar"):
+            costs, fired = run(mode, count, args.ticks, args.feeds_per_tick, args.seed)
+            costs.sort()
+            print(f"{count:>14} {mode:>12} {statistics.mean(costs) * 1e3:>10.3f} "
+                  f"{costs[int(len(costs) * 0.99)] * 1e3:>10.3f} {fired / len(costs):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
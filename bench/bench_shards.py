@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Масштабирование по процессам: фронт (ShardRouter) раздаёт один и тот же
+поток обновлений 1, 2, 4… воркерам. Воркер — настоящее Application со всеми
+обработчиками бота, только запросы к Bot API отвечает StubRequest.
+Пропускная — от первого отданного обновления до последнего ответа.
+
+    python bench/bench_shards.py --users 400 --messages 10 --shards 1 2 4
+
+Ускорение упирается в число ядер: больше шардов, чем os.cpu_count(), не даёт ничего.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+if "--worker" not in sys.argv:  # Воркерам DATA_DIR задаёт фронт
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-shards-")
+os.environ.setdefault("BOT_TOKEN", "123456:STUB")
+
+import storoz_bot as bot  # noqa: E402
+from post_updates import make_updates  # noqa: E402
+from stub_request import StubRequest  # noqa: E402
+
+# Середина сезона: бот активен, команды делают настоящую работу
+MOMENT = bot.BOT_START.replace(hour=12) + timedelta(days=3)
+
+
+def worker(latency):
+    """Процесс-воркер: SHARD_INDEX, SHARDS и DATA_DIR задал фронт"""
+    bot.set_clock(bot.VirtualClock(MOMENT))
+    bot.configure_shard(int(os.environ["SHARD_INDEX"]), int(os.environ["SHARDS"]))
+    # Лимит Telegram на отправку здесь не меряем — он делится между шардами и не масштабируется
+    bot.OUTBOX = bot.Outbox(global_rate=1e9, global_burst=1e9, chat_interval=0)
+    request = StubRequest(latency)
+    app = bot.build_application(updater=False, request=request)
+
+    async def feed(app):
+        (bot.DATA_DIR / f"ready-{bot.SHARD_INDEX}").touch()
+        await bot.feed_from_stdin(app)
+
+    asyncio.run(bot.run_application(app, feed))
+    with open(bot.DATA_DIR / f"result-{bot.SHARD_INDEX}.json", "w", encoding="utf-8") as f:
+        json.dump({"last_call": request.last_call, "calls": request.calls}, f)
+
+
+def make_stream(users, messages, seed):
+    """Сначала /start каждого, потом вперемешку команды и болтовня"""
+    updates = make_updates(users, messages, seed)
+    starts = make_updates(users, 1, seed)
+    for user_id, update in enumerate(starts, 1):
+        update["update_id"] = -user_id
+        update["message"].update(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+    return [(update, json.dumps(update, ensure_ascii=False).encode("utf-8")) for update in starts + updates]
+
+
+async def run(shards, stream, data_dir, latency):
+    for source in (ROOT / "data").glob("*.json"):
+        shutil.copy(source, data_dir)
+    env = {"DATA_DIR": str(data_dir), "LOG_LEVEL": "WARNING", "METRICS_PORT": "0"}
+    router = bot.ShardRouter(shards, [sys.executable, __file__, "--worker", "--latency", str(latency)], env)
+    await router.start()
+    deadline = time.monotonic() + 60
+    while len(list(data_dir.glob("ready-*"))) < shards:
+        if time.monotonic() > deadline:
+            await router.stop(timeout=1)
+            raise RuntimeError("воркеры не поднялись за 60 с")
+        await asyncio.sleep(0.05)
+
+    started = time.time()
+    per_shard = [0] * shards
+    for update, raw in stream:
+        per_shard[await router.route(update, raw)] += 1
+    await router.stop()
+
+    results = []
+    for index in range(shards):
+        with open(data_dir / f"result-{index}.json", "r", encoding="utf-8") as f:
+            results.append(json.load(f))
+    finished = max(r["last_call"] or started for r in results)
+    replies = sum(r["calls"].get("sendMessage", 0) + r["calls"].get("sendPhoto", 0) for r in results)
+    return len(stream) / (finished - started), replies, per_shard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.latency)
+        return 0
+
+    logging.disable(logging.INFO)
+    stream = make_stream(args.users, args.messages, args.seed)
+    base = Path(os.environ["DATA_DIR"])
+    print(f"обновлений: {len(stream)}, пользователей: {args.users}, ядер: {os.cpu_count()}")
+    print(f"{'шардов':>7} {'обновл./с':>10} {'ускорение':>10} {'ответов':>8}  по шардам")
+    baseline = None
+    try:
+        for shards in args.shards:
+            data_dir = base / f"shards-{shards}"
+            data_dir.mkdir()
+            rate, replies, per_shard = asyncio.run(run(shards, stream, data_dir, args.latency))
+            baseline = baseline or rate
+            print(f"{shards:>7} {rate:>10.0f} {rate / baseline:>9.2f}x {replies:>8}  {per_shard}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    if max(args.shards) > (os.cpu_count() or 1):
+        print(f"\n! шардов больше, чем ядер ({os.cpu_count()}): ускорение здесь не покажется")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
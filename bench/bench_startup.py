@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Холодный старт бота: каждый замер — свежий интерпретатор.
+
+Этапы: импорт python-telegram-bot, импорт storoz_bot, загрузка справочников
+из JSON, чтение пользователей и хвоста журнала.
+
+    python bench/bench_startup.py --users 1000 --tail 100 --runs 7
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def child():
+    started = time.perf_counter()
+    import telegram.ext  # noqa: F401
+    telegram_done = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+    import storoz_bot as bot
+    import_done = time.perf_counter()
+    bot.load_catalogs()
+    catalogs_done = time.perf_counter()
+    bot.STATE.preload()
+    bot.recover_from_journal()
+    state_done = time.perf_counter()
+    print(json.dumps({
+        "telegram": telegram_done - started,
+        "storoz_bot": import_done - telegram_done,
+        "catalogs": catalogs_done - import_done,
+        "state": state_done - catalogs_done,
+        "total": state_done - started,
+    }))
+
+
+def seed(data_dir, users, tail):
+    for source in (ROOT / "data").glob("*.json"):
+        shutil.copy(source, data_dir)
+    os.environ["DATA_DIR"] = str(data_dir)
+    sys.path.insert(0, str(ROOT))
+    import storoz_bot as bot
+    now = bot.BOT_START.isoformat()
+    bot.get_store().put_many([
+        dict(bot.DEFAULT_USER_STATE, user_id=user_id, last_feed_time=now)
+        for user_id in range(1, users + 1)
+    ])
+    # Хвост журнала, не вошедший в снимок (события за последний интервал flush)
+    for user_id in range(1, min(tail, users) + 1):
+        bot.JOURNAL.append("done", user_id, bot.BOT_START.timestamp(), bot.BOT_START.timestamp())
+    bot.JOURNAL.close()
+    bot.get_store().close()
+
+
+def run(data_dir, runs):
+    env = dict(os.environ, DATA_DIR=str(data_dir), LOG_LEVEL="WARNING")
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child"],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tail", type=int, default=100, help="событий журнала после снимка")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    data_dir = Path(tempfile.mkdtemp(prefix="stoyanka-startup-"))
+    try:
+        seed(data_dir, args.users, args.tail)
+        r = run(data_dir, args.runs)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"пользователей: {args.users}, замеров: {args.runs} (медиана, мс)"
+          f"{', без кэша байткода' if sys.dont_write_bytecode else ''}")
+    print(f"{'telegram':>9} {'storoz_bot':>11} {'справочн.':>10} {'состояние':>10} {'всего':>8}")
+    print(f"{r['telegram'] * 1e3:>9.1f} {r['storoz_bot'] * 1e3:>11.1f} "
+          f"{r['catalogs'] * 1e3:>10.2f} {r['state'] * 1e3:>10.1f} {r['total'] * 1e3:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
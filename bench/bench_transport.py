@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Транспорт Bot API под всплесками уведомлений: утро (подъём в 5:30)
+и дофамин в :55 — у всех пользователей сразу. Бот — настоящее Application
+с профилем HTTP_PROFILE и настоящий main_timer; Bot API — заглушка
+stub_bot_api.py в отдельном процессе, по HTTP на localhost, с разбросом
+задержки. Всё время всплеска параллельно висит long polling getUpdates.
+
+Для каждого профиля и всплеска: пропускная, к какому моменту доставлена
+половина / 99% сообщений, время одного запроса (p50/p99) и сколько
+соединений открыл клиент.
+
+    python bench/bench_transport.py --users 2000 --latency 0.05 --jitter 0.5
+    python bench/bench_transport.py --profiles tuned lean --rate 25   # с лимитом Telegram
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import replay_season as rs
+
+bot = rs.bot
+TOKEN = "123456:STUB"
+STUB = Path(__file__).resolve().parent / "stub_bot_api.py"
+
+# Понедельник середины сезона: в 5:30 утро, в 6:55 первый дофамин
+DAY = (bot.BOT_START + timedelta(days=2)).replace(hour=0, minute=0)
+BURSTS = (("утро 5:30", timedelta(hours=5, minutes=30)), ("дофамин 6:55", timedelta(hours=6, minutes=55)))
+
+
+class TimedBot:
+    """Обёртка над Bot: время каждого send_* (начало, конец)"""
+
+    def __init__(self, tg_bot):
+        self._bot = tg_bot
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if not name.startswith("send_"):
+            return attr
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                self.calls.append((started, time.perf_counter()))
+        return timed
+
+
+def seed_users(count, moment):
+    users = [
+        dict(bot.DEFAULT_USER_STATE, user_id=user_id, weekday_wakeup="05:30",
+             current_date=moment.strftime("%Y-%m-%d"), last_feed_time=(moment - timedelta(hours=1)).isoformat())
+        for user_id in range(1, count + 1)
+    ]
+    bot.get_store().put_many(users)
+    bot.STATE.preload()
+    for data in bot.STATE.users.values():
+        bot.SCHEDULER.reschedule(data, moment)
+
+
+async def stub_stats(port):
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"http://127.0.0.1:{port}/stats")).json()
+
+
+async def poll_forever(tg_bot, timeout):
+    while True:
+        await tg_bot.get_updates(timeout=timeout)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_profile(profile, port, args):
+    bot.HTTP_PROFILE = profile
+    bot.BOT_API_URL = f"http://127.0.0.1:{port}/bot"
+    app = bot.build_application(updater=False)
+    clock = bot.VirtualClock(DAY + timedelta(hours=5))
+    results = []
+    async with app:
+        rs.reset_state(clock, app.bot, f"transport-{profile}")
+        timed_bot = TimedBot(app.bot)
+        await bot.OUTBOX.stop()
+        bot.OUTBOX = bot.Outbox(global_rate=args.rate or 1e9, global_burst=args.burst or 1e9,
+                                chat_interval=0, max_in_flight=args.in_flight)
+        bot.OUTBOX.start(timed_bot)
+        seed_users(args.users, clock.now())
+        context = SimpleNamespace(bot=app.bot, job_queue=None, args=None)
+        poller = asyncio.create_task(poll_forever(app.bot, args.poll_timeout))
+
+        for name, at in BURSTS:
+            clock.set(DAY + at)
+            before = await stub_stats(port)
+            dropped = bot.OUTBOX.dropped
+            timed_bot.calls = []
+            started = time.perf_counter()
+            await bot.main_timer(context)
+            await bot.OUTBOX.drain()
+            elapsed = time.perf_counter() - started
+            after = await stub_stats(port)
+            done = [end - started for _, end in timed_bot.calls]
+            rtt = [end - begin for begin, end in timed_bot.calls]
+            results.append({
+                "burst": name,
+                "sent": len(done),
+                "rate": len(done) / elapsed,
+                "done50": percentile(done, 0.5),
+                "done99": percentile(done, 0.99),
+                "rtt50": percentile(rtt, 0.5),
+                "rtt99": percentile(rtt, 0.99),
+                "connections": after["connections"] - before["connections"],
+                "failed": bot.OUTBOX.dropped - dropped,
+            })
+
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        await bot.OUTBOX.stop()
+        await bot.flush_state()
+        bot.get_store().close()
+        bot._store = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--profiles", nargs="+", default=list(bot.HTTP_PROFILES), choices=list(bot.HTTP_PROFILES))
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки (сигма логнормального)")
+    parser.add_argument("--rate", type=float, default=0, help="сообщений/с на всех (0 — без лимита)")
+    parser.add_argument("--burst", type=float, default=0, help="пачка TokenBucket (0 — без лимита)")
+    parser.add_argument("--in-flight", type=int, default=bot.SEND_MAX_IN_FLIGHT, help="окно запросов Outbox")
+    parser.add_argument("--poll-timeout", type=int, default=5, help="long polling getUpdates, с")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    bot.BOT_TOKEN = TOKEN
+    bot.HTTP2 = "0"  # Заглушка на localhost — только HTTP/1.1, даже если h2 установлен
+
+    stub = subprocess.Popen(
+        [sys.executable, str(STUB), "--port", "0", "--token", TOKEN,
+         "--latency", str(args.latency), "--jitter", str(args.jitter)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        port = int(stub.stdout.readline())
+        print(f"пользователей: {args.users}, задержка {args.latency * 1e3:.0f} мс (разброс {args.jitter}), "
+              f"окно Outbox: {args.in_flight}, лимит: {args.rate or 'нет'}, HTTP/2: {bot.http2_enabled()}")
+        print(f"{'профиль':>8} {'всплеск':>14} {'сообщ./с':>9} {'50% к, с':>9} {'99% к, с':>9} "
+              f"{'запрос p50':>11} {'запрос p99':>11} {'соедин.':>8} {'ошибок':>7}")
+        for profile in args.profiles:
+            for r in asyncio.run(run_profile(profile, port, args)):
+                print(f"{profile:>8} {r['burst']:>14} {r['rate']:>9.0f} {r['done50']:>9.2f} {r['done99']:>9.2f} "
+                      f"{r['rtt50'] * 1e3:>9.1f}мс {r['rtt99'] * 1e3:>9.1f}мс {r['connections']:>8} {r['failed']:>7}")
+        stats = asyncio.run(stub_stats(port))
+        print(f"\nзаглушка: {json.dumps(stats['calls'], ensure_ascii=False)}")
+    finally:
+        stub.terminate()
+        stub.wait()
+        rs.shutil.rmtree(rs.os.environ["DATA_DIR"], ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
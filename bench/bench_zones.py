@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Часовые пояса: таблицы переходов (ZoneTable) против zoneinfo.
+
+1. Сверка: смещение и перевод местного времени в UTC каждые 10 минут
+   на всём диапазоне таблицы (сезон ± год) — как datetime с fold=0,
+   включая весенний пропуск и осенний повтор.
+2. Сезон, сдвинутый на март (переходы на летнее время в США и Европе):
+   next_due_time и HungerIndex должны дать одни и те же моменты
+   (включая чек-ины, отложенные до подъёма).
+3. Скорость: перевод «местное -> UTC» через таблицу и через tz-aware datetime;
+   пересчёт next_due для пользователей из многих поясов.
+
+    python bench/bench_zones.py --users 20000
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-zones-")  # Не трогать рабочий DATA_DIR
+for source in (ROOT / "data").glob("*.json"):
+    shutil.copy(source, os.environ["DATA_DIR"])
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+
+import storoz_bot as bot  # noqa: E402
+
+ZONES = [
+    "Europe/Moscow", "Europe/Berlin", "Europe/London", "Europe/Dublin", "America/New_York",
+    "America/St_Johns", "America/Santiago", "Australia/Sydney", "Australia/Lord_Howe",
+    "Pacific/Chatham", "Asia/Kathmandu", "Asia/Kolkata", "Africa/Casablanca", "Asia/Almaty",
+]
+STEP = 600
+
+# Сезон с переходами: 8 марта — США, 29 марта — Европа, 5 апреля — Австралия и Чили
+DST_SEASON = (
+    datetime(2026, 3, 1, 0, 0, tzinfo=bot.TIMEZONE),
+    datetime(2026, 4, 12, 0, 0, tzinfo=bot.TIMEZONE),
+)
+
+
+def verify_tables():
+    mismatches = 0
+    transitions = 0
+    for name in ZONES:
+        table = bot.zone_table(name)
+        transitions += len(table.transitions) - 1
+        for ts in range(table.start, table.end, STEP):
+            expected = int(datetime.fromtimestamp(ts, table.zone).utcoffset().total_seconds())
+            mismatches += table.offset(ts) != expected
+            local = ts - ts % STEP  # Сетка местного времени, тоже по 10 минут
+            naive = bot.EPOCH_NAIVE + timedelta(seconds=local)
+            mismatches += table.to_utc(local) != naive.replace(tzinfo=table.zone).timestamp()
+    return transitions, mismatches
+
+
+def use_season(start, end):
+    bot.BOT_START, bot.BOT_END = start, end
+    bot._zone_tables.clear()
+    bot._schedules.clear()
+
+
+def make_users(count, rng):
+    start = bot.BOT_START.timestamp()
+    span = bot.BOT_END.timestamp() - start
+    users = []
+    for user_id in range(1, count + 1):
+        moment = datetime.fromtimestamp(start + rng.random() * span, bot.TIMEZONE)
+        data = {
+            "user_id": user_id,
+            "timezone": rng.choice(ZONES),
+            "weekday_wakeup": f"{rng.randint(4, 9):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+            "weekend_wakeup": f"{rng.randint(6, 11):02d}:{rng.choice((0, 30)):02d}",
+            "last_feed_time": (moment - timedelta(minutes=rng.randint(0, 30 * 60))).isoformat(),
+            "morning_done": rng.random() < 0.5,
+            "hunger_notified": rng.random() < 0.3,
+            "goodnight_sent": rng.random() < 0.2,
+            "summary_sent": rng.random() < 0.2,
+            "last_dopamine_hour": rng.choice((None, moment.hour)),
+            "checkin_at": rng.choice((None, int(moment.timestamp()) // 60 * 60 + rng.randint(-600, 1200) * 60)),
+        }
+        data["current_date"] = bot.user_now(data, moment).strftime("%Y-%m-%d")
+        users.append((moment, data))
+    return users
+
+
+def compare_schedulers(users):
+    index = bot.HungerIndex()
+    for moment, data in users:
+        index.reschedule(data, moment)
+    rows = bot.np.arange(index.size)
+    started = time.perf_counter()
+    vector = index._compute(rows, 0.0)
+    vector_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scalar = [bot.next_due_time(data, moment.timestamp()) for moment, data in users]
+    scalar_time = time.perf_counter() - started
+
+    differ = sum(
+        1 for expected, got in zip(scalar, vector.tolist())
+        if (expected if expected is not None else float("inf")) != got
+    )
+    return differ, scalar_time, vector_time
+
+
+def conversion_speed(count, rng):
+    table = bot.zone_table("Europe/Berlin")
+    start = bot.BOT_START.timestamp()
+    locals_ = [start + rng.randrange(0, 40 * bot.DAY_SECONDS, 60) for _ in range(count)]
+    started = time.perf_counter()
+    for local in locals_:
+        table.to_utc(local)
+    table_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for local in locals_:
+        (bot.EPOCH_NAIVE + timedelta(seconds=local)).replace(tzinfo=table.zone).timestamp()
+    datetime_time = time.perf_counter() - started
+    return table_time / count, datetime_time / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+
+    transitions, mismatches = verify_tables()
+    print(f"поясов: {len(ZONES)}, переходов в таблицах: {transitions}, "
+          f"расхождений с zoneinfo: {mismatches}")
+
+    use_season(*DST_SEASON)
+    users = make_users(args.users, rng)
+    differ, scalar_time, vector_time = compare_schedulers(users)
+    print(f"\nсезон {bot.BOT_START:%d.%m}–{bot.BOT_END:%d.%m}, пользователей: {args.users}")
+    print(f"next_due_time против HungerIndex: расхождений {differ}")
+    print(f"пересчёт всех: next_due_time {scalar_time * 1e3:.0f} мс, "
+          f"HungerIndex {vector_time * 1e3:.0f} мс")
+
+    table_cost, datetime_cost = conversion_speed(100000, rng)
+    print(f"\nместное -> UTC: таблица {table_cost * 1e6:.2f} мкс, datetime {datetime_cost * 1e6:.2f} мкс")
+    return 1 if mismatches or differ else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
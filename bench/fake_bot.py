@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Заглушка telegram.Bot для офлайн-прогонов: ничего не шлёт в сеть,
+записывает все вызовы и умеет имитировать задержку и 429 (RetryAfter).
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+
+
+class FakeBot:
+    def __init__(self, latency=0.0, flood_every=0, retry_after=1, clock=time.monotonic):
+        self.latency = latency          # Секунды на один вызов API
+        self.flood_every = flood_every  # Каждый N-й вызов отвечает 429 (0 — никогда)
+        self.retry_after = retry_after
+        self.clock = clock
+        self.calls = 0
+        self.sent = []                  # (время, метод, chat_id, kwargs)
+        self._message_id = 0
+
+    async def _call(self, method, chat_id, kwargs, **result):
+        self.calls += 1
+        call_no = self.calls
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and call_no % self.flood_every == 0:
+            raise RetryAfter(self.retry_after)
+        self._message_id += 1
+        self.sent.append((self.clock(), method, chat_id, kwargs))
+        return SimpleNamespace(message_id=self._message_id, chat_id=chat_id, **result)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call("send_message", chat_id, dict(kwargs, text=text))
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        # Как настоящий Bot API: в ответе есть file_id загруженной картинки
+        file_id = photo if isinstance(photo, str) else f"fake-file-{self.calls + 1}"
+        return await self._call(
+            "send_photo", chat_id, dict(kwargs, photo=photo),
+            photo=[SimpleNamespace(file_id=file_id)],
+        )
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return await self._call("edit_message_text", chat_id, dict(kwargs, text=text, message_id=message_id))
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        await self._call("pin_chat_message", chat_id, dict(kwargs, message_id=message_id))
+        return True
+
+    def by_chat(self):
+        chats = {}
+        for sent_at, method, chat_id, kwargs in self.sent:
+            chats.setdefault(chat_id, []).append((sent_at, method, kwargs))
+        return chats
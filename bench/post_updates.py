@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка вебхука без Telegram: записанные (или сгенерированные) обновления
+отправляются POST-запросами на локальный адрес с секретным заголовком.
+
+Против запущенного бота (UPDATE_MODE=webhook, WEBHOOK_SECRET=...):
+
+    python bench/post_updates.py --url http://127.0.0.1:8443/telegram --secret XXX \\
+        --file updates.jsonl
+
+Полностью офлайн — поднимает свой HttpServer с webhook_update и считает,
+сколько обновлений дошло до очереди приложения:
+
+    python bench/post_updates.py --serve --users 100 --messages 20 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TEXTS = ("/status", "/done", "/tried", "сделал", "попробовала, но не сделала", "привет всем")
+
+
+def make_updates(users, messages, seed):
+    rng = random.Random(seed)
+    update_id = itertools.count(1)
+    updates = []
+    for n in range(messages):
+        for user_id in range(1, users + 1):
+            text = rng.choice(TEXTS)
+            message = {
+                "message_id": n + 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+                "text": text,
+            }
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+            updates.append({"update_id": next(update_id), "message": message})
+    return updates
+
+
+def load_updates(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def post_all(url, secret, updates, concurrency):
+    """Каждый воркер держит одно keep-alive соединение"""
+    parts = urlsplit(url)
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(json.dumps(update, ensure_ascii=False).encode("utf-8"))
+    statuses = {}
+    latencies = []
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        try:
+            while not queue.empty():
+                body = queue.get_nowait()
+                started = time.perf_counter()
+                writer.write(
+                    f"POST {parts.path or '/'} HTTP/1.1\r\n"
+                    f"Host: {parts.netloc}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("utf-8") + body
+                )
+                await writer.drain()
+                status = (await reader.readline()).split()[1].decode()
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return statuses, latencies, time.perf_counter() - started
+
+
+async def serve_and_post(updates, concurrency):
+    import storoz_bot as bot
+    from telegram.ext import Application
+
+    app = Application.builder().token("123456:OFFLINE").updater(None).build()
+    server = bot.HttpServer("127.0.0.1", 0, {
+        ("POST", bot.WEBHOOK_PATH): lambda headers, body: bot.webhook_update(app, headers, body),
+    })
+    await server.start()
+    url = f"http://127.0.0.1:{server.port}{bot.WEBHOOK_PATH}"
+    try:
+        result = await post_all(url, bot.WEBHOOK_SECRET, updates, concurrency)
+        forbidden, _, _ = await post_all(url, "wrong-secret", updates[:1], 1)
+    finally:
+        await server.stop()
+    return result, app.update_queue.qsize(), forbidden
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--file", help="JSONL с записанными обновлениями")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", action="store_true", help="поднять вебхук в этом же процессе")
+    args = parser.parse_args()
+
+    updates = load_updates(args.file) if args.file else make_updates(args.users, args.messages, args.seed)
+    if args.serve:
+        (statuses, latencies, elapsed), queued, forbidden = asyncio.run(
+            serve_and_post(updates, args.concurrency))
+    else:
+        statuses, latencies, elapsed = asyncio.run(
+            post_all(args.url, args.secret, updates, args.concurrency))
+
+    latencies.sort()
+    print(f"обновлений:       {len(updates)}, соединений: {args.concurrency}")
+    print(f"ответы:           {statuses}")
+    print(f"пропускная:       {len(updates) / elapsed:.0f} запросов/с")
+    print(f"задержка:         p50 {statistics.median(latencies) * 1e3:.2f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} мс")
+    if args.serve:
+        print(f"в очереди:        {queued}")
+        print(f"чужой секрет:     {forbidden}")
+        return 0 if queued == len(updates) and "403" in forbidden else 1
+    return 0 if set(statuses) == {"200"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
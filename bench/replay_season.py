@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Ускоренный прогон всего сезона (BOT_START → BOT_END) на виртуальных часах.
+
+Пользователи делают /start в начале сезона, дальше по сценарию присылают
+/done и /tried. Таймер просыпается ровно к событиям планировщика, все
+исходящие сообщения пишутся в FakeBot с виртуальным временем. В конце —
+стоимость тика и проверка пропущенных и повторных уведомлений.
+
+    python bench/replay_season.py --users 50 --seed 1
+    python bench/replay_season.py --users 5 --reference   # сверка с поминутным опросом
+    python bench/replay_season.py --users 500 --scheduler columnar
+    python bench/replay_season.py --users 8 --reference --zones Asia/Kathmandu America/St_Johns
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-replay-")
+for source in (ROOT / "data").glob("*.json"):
+    shutil.copy(source, os.environ["DATA_DIR"])
+
+import logging  # noqa: E402
+
+import storoz_bot as bot  # noqa: E402
+from fake_bot import FakeBot  # noqa: E402
+
+SEASON_START = bot.BOT_START
+SEASON_END = bot.BOT_END
+
+
+def make_script(user_ids, seed):
+    """Сценарий: (момент, user_id, команда). Команды — только днём, с паузами 1–20 ч."""
+    rng = random.Random(seed)
+    events = []
+    for user_id in user_ids:
+        moment = SEASON_START
+        while True:
+            moment += timedelta(minutes=rng.randint(60, 20 * 60))
+            if moment >= SEASON_END:
+                break
+            if 7 <= moment.hour < 23:
+                events.append((moment, user_id, rng.choice(("done", "done", "tried"))))
+    events.sort(key=lambda event: (event[0], event[1]))
+    return events
+
+
+def fake_update(user_id, replies):
+    async def reply_text(text, **kwargs):
+        replies.append((user_id, text))
+
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(reply_text=reply_text),
+    )
+
+
+def classify(method, kwargs):
+    if method in ("edit_message_text", "pin_chat_message") or kwargs.get("text", "").startswith("📌"):
+        return "live"
+    if method == "send_photo":
+        return "summary" if kwargs["caption"].startswith("🏕") else "goodnight"
+    text = kwargs["text"]
+    if text.startswith("🏕"):
+        return "summary"
+    if "🏹 Твои цели" in text:
+        return "morning"
+    if text.startswith("🍖⚠️"):
+        return "warning"
+    if text.startswith("🔥🔥🔥"):
+        return "riot"
+    if text.startswith("🏁"):
+        return "bot_end"
+    if text.startswith("🌙"):
+        return "goodnight"
+    if text.startswith("👁"):
+        return "checkin"
+    return "dopamine"
+
+
+def reset_state(clock, fake_bot, run_name):
+    """Чистое состояние для прогона: своя база, кэш, планировщик и очередь"""
+    if bot._store is not None:
+        bot._store.close()
+        bot._store = None
+    bot.STATE_DB_FILE = bot.DATA_DIR / f"{run_name}.db"
+    bot.JOURNAL.close()
+    bot.JOURNAL = bot.EventJournal(bot.DATA_DIR / f"{run_name}-journal")
+    bot.set_clock(clock)
+    bot.CHECKIN_SPREAD = 0  # Разброс по минуте — в секундах настоящих часов, виртуальным он ни к чему
+    bot.STATE = bot.StateCache()
+    bot.SCHEDULER = bot.make_scheduler()
+    bot.OUTBOX = bot.Outbox(global_rate=1e9, global_burst=1e9, chat_interval=0)
+    bot.OUTBOX.start(fake_bot)
+    bot.PHRASES.refresh()
+    bot.TASKS = bot.TaskPool()
+    bot.SCORES = bot.ScoreBoard()
+    bot.LIVE = bot.LiveStatus()
+    bot.BROADCASTS = bot.Broadcaster()
+    bot.BROADCASTS.start(fake_bot)
+
+
+def open_task_code(user_id):
+    """Шифр первой незакрытой цели на сегодня — /done закрывает её"""
+    data = bot.STATE.cached(user_id) or {}
+    done = set(data.get("tasks_done") or ())
+    for task_id in data.get("tasks_today") or ():
+        if task_id not in done:
+            return [bot.TASKS.code(task_id)]
+    return None
+
+
+def start_events(user_ids, zones):
+    """/start каждого в начале сезона; если заданы пояса — сначала /timezone по кругу"""
+    events = []
+    for user_id in user_ids:
+        if zones:
+            events.append((SEASON_START, user_id, f"timezone {zones[user_id % len(zones)]}"))
+        events.append((SEASON_START, user_id, "start"))
+    return events
+
+
+async def run_commands(context, events, replies):
+    for _, user_id, command in events:
+        update = fake_update(user_id, replies)
+        if command.startswith("timezone "):
+            context.args = command.split()[1:]
+            await bot.cmd_timezone(update, context)
+            context.args = None
+        elif command == "start":
+            await bot.cmd_start(update, context)
+        elif command == "done":
+            context.args = open_task_code(user_id)
+            await bot.cmd_done(update, context)
+            context.args = None
+        else:
+            await bot.cmd_tried(update, context)
+    await bot.OUTBOX.drain()
+
+
+async def replay(user_ids, script, zones):
+    """Событийный прогон: таймер будится только к запланированным событиям"""
+    clock = bot.VirtualClock(SEASON_START)
+    fake_bot = FakeBot(clock=clock.now)
+    reset_state(clock, fake_bot, "replay")
+    context = SimpleNamespace(bot=fake_bot, job_queue=None)
+    replies = []
+
+    await run_commands(context, start_events(user_ids, zones), replies)
+    tick_costs = []
+    i = 0
+    while True:
+        due = bot.SCHEDULER.peek()
+        next_event = script[i][0].timestamp() if i < len(script) else None
+        if due is None and next_event is None:
+            break
+        if next_event is not None and (due is None or next_event <= due):
+            clock.set(script[i][0])
+            batch = []
+            while i < len(script) and script[i][0].timestamp() == next_event:
+                batch.append(script[i])
+                i += 1
+            await run_commands(context, batch, replies)
+            continue
+        clock.set(bot.datetime.fromtimestamp(due, bot.TIMEZONE))
+        started = time.perf_counter()
+        await bot.main_timer(context)
+        await bot.BROADCASTS.drain()
+        await bot.OUTBOX.drain()
+        tick_costs.append(time.perf_counter() - started)
+
+    await bot.OUTBOX.stop()
+    return fake_bot.sent, tick_costs
+
+
+async def reference(user_ids, script, zones):
+    """Поминутный опрос всех пользователей — как работал бот до планировщика"""
+    clock = bot.VirtualClock(SEASON_START)
+    fake_bot = FakeBot(clock=clock.now)
+    reset_state(clock, fake_bot, "reference")
+    context = SimpleNamespace(bot=fake_bot, job_queue=None)
+    replies = []
+
+    await run_commands(context, start_events(user_ids, zones), replies)
+    i = 0
+    moment = SEASON_START
+    end_sent = False
+    while moment < SEASON_END + timedelta(hours=1):
+        clock.set(moment)
+        batch = []
+        while i < len(script) and script[i][0] <= moment:
+            batch.append(script[i])
+            i += 1
+        await run_commands(context, batch, replies)
+        if bot.is_bot_active():
+            for user_id in user_ids:
+                await bot.process_user(context, user_id)
+        elif moment >= SEASON_END and not end_sent:
+            bot.check_bot_end()
+            await bot.BROADCASTS.drain()
+            end_sent = True
+        await bot.OUTBOX.drain()
+        moment += timedelta(minutes=1)
+
+    await bot.OUTBOX.stop()
+    return fake_bot.sent
+
+
+def check(sent):
+    """Повторы и уведомления не в свою минуту (по часам пользователя)"""
+    problems = []
+    seen = {}
+    for moment, method, chat_id, kwargs in sent:
+        kind = classify(method, kwargs)
+        moment = bot.user_now(bot.STATE.cached(chat_id) or {}, moment)
+        if kind in ("morning", "summary", "goodnight", "bot_end"):
+            key = (kind, chat_id, moment.date())
+        elif kind == "dopamine":
+            key = (kind, chat_id, moment.date(), moment.hour)
+            if moment.minute != 55:
+                problems.append(f"{chat_id}: дофамин в {moment:%m-%d %H:%M}")
+        elif kind == "checkin":
+            key = (kind, chat_id, moment.date(), moment.hour, moment.minute)
+        elif kind == "riot":
+            key = (kind, chat_id, moment.date(), moment.hour, moment.minute)
+            if moment.minute not in (0, 30):
+                problems.append(f"{chat_id}: бунт в {moment:%m-%d %H:%M}")
+        else:
+            continue
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] == 2:
+            problems.append(f"{chat_id}: повтор {kind} в {moment:%m-%d %H:%M}")
+    return problems
+
+
+def signature(sent):
+    return sorted((moment.strftime("%m-%d %H:%M"), chat_id, classify(method, kwargs))
+                  for moment, method, chat_id, kwargs in sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scheduler", choices=("heap", "columnar"), default="heap")
+    parser.add_argument("--reference", action="store_true",
+                        help="сверить с поминутным опросом (медленно)")
+    parser.add_argument("--zones", nargs="+", default=[],
+                        help="часовые пояса пользователей по кругу (по умолчанию — из settings.json)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    bot.SCHEDULER_MODE = args.scheduler
+
+    user_ids = list(range(1, args.users + 1))
+    script = make_script(user_ids, args.seed)
+
+    started = time.perf_counter()
+    sent, tick_costs = asyncio.run(replay(user_ids, script, args.zones))
+    elapsed = time.perf_counter() - started
+
+    kinds = {}
+    for _, method, _, kwargs in sent:
+        kind = classify(method, kwargs)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    season_minutes = int((SEASON_END - SEASON_START).total_seconds() // 60)
+
+    print(f"сезон:            {SEASON_START:%d.%m %H:%M} — {SEASON_END:%d.%m %H:%M}")
+    print(f"пользователей:    {args.users}, команд по сценарию: {len(script)}")
+    print(f"планировщик:      {args.scheduler}")
+    if args.zones:
+        print(f"пояса:            {', '.join(args.zones)}")
+    print(f"прогон:           {elapsed:.2f} с")
+    print(f"тиков таймера:    {len(tick_costs)} (поминутный опрос: {season_minutes})")
+    if tick_costs:
+        costs = sorted(tick_costs)
+        print(f"стоимость тика:   среднее {statistics.mean(costs) * 1e3:.3f} мс, "
+              f"p99 {costs[int(len(costs) * 0.99)] * 1e3:.3f} мс")
+    print(f"сообщений:        {len(sent)} {kinds}")
+
+    problems = check(sent)
+    if args.reference:
+        expected = signature(asyncio.run(reference(user_ids, script, args.zones)))
+        actual = signature(sent)
+        missing = sorted(set(expected) - set(actual))
+        extra = sorted(set(actual) - set(expected))
+        problems += [f"пропущено: {item}" for item in missing]
+        problems += [f"лишнее: {item}" for item in extra]
+        print(f"сверка с опросом: {'совпадает' if not missing and not extra else 'РАСХОЖДЕНИЯ'}")
+
+    for problem in problems[:20]:
+        print(f"  ! {problem}")
+    print(f"проблем:          {len(problems)}")
+    shutil.rmtree(os.environ["DATA_DIR"], ignore_errors=True)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Заглушка сервера Bot API на localhost: настоящий HTTP (keep-alive, пул
+соединений клиента работает как с api.telegram.org), ответы — как у
+StubRequest. Задержка ответа — latency с разбросом (логнормальным),
+getUpdates держит соединение timeout секунд и возвращает пустой список.
+GET /stats — вызовы по методам и число открытых клиентом соединений.
+
+    python bench/stub_bot_api.py --port 8081 --latency 0.05 --jitter 0.5
+    BOT_API_URL=http://127.0.0.1:8081/bot python storoz_bot.py
+
+Порт 0 — любой свободный; выбранный порт печатается первой строкой.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import storoz_bot as bot  # noqa: E402
+from stub_request import StubRequest  # noqa: E402
+
+METHODS = (
+    "getMe", "getUpdates", "deleteWebhook", "setWebhook", "sendMessage", "sendPhoto",
+    "editMessageText", "pinChatMessage",
+)
+
+
+class StubBotApi(bot.HttpServer):
+    idle_timeout = 600
+
+    def __init__(self, host, port, token, latency, jitter, seed=1):
+        self.answers = StubRequest()
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.connections = 0
+        routes = {("POST", f"/bot{token}/{method}"): self._api(method) for method in METHODS}
+        routes[("GET", "/stats")] = self._stats
+        super().__init__(host, port, routes)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await super()._handle(reader, writer)
+
+    def _delay(self) -> float:
+        if not self.latency:
+            return 0.0
+        return self.latency * (self.rng.lognormvariate(0, self.jitter) if self.jitter else 1.0)
+
+    def _api(self, method):
+        async def handler(headers, body):
+            params = {}
+            if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+                params = dict(parse_qsl(body.decode("utf-8")))
+            if method == "getUpdates":
+                await asyncio.sleep(float(params.get("timeout", 0)))
+            else:
+                await asyncio.sleep(self._delay())
+            self.answers.calls[method] = self.answers.calls.get(method, 0) + 1
+            result = [] if method == "getUpdates" else self.answers._result(method, params)
+            return "200 OK", json.dumps({"ok": True, "result": result}).encode("utf-8")
+        return handler
+
+    async def _stats(self, headers, body):
+        stats = {"calls": self.answers.calls, "connections": self.connections}
+        return "200 OK", json.dumps(stats).encode("utf-8")
+
+
+async def serve(args):
+    server = StubBotApi(args.host, args.port, args.token, args.latency, args.jitter)
+    await server.start()
+    print(server.port, flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default=os.environ.get("BOT_TOKEN", "123456:STUB"))
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки (сигма логнормального)")
+    args = parser.parse_args()
+    bot.logging.disable(bot.logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Заглушка транспорта python-telegram-bot: настоящий Bot и Application,
+но запросы к Bot API не уходят в сеть, а получают готовые ответы.
+Можно задать задержку «сети» на вызов — она не занимает процессор.
+
+    app = bot.build_application(updater=False, request=StubRequest())
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+
+
+class StubRequest(BaseRequest):
+    """Отвечает на getMe, sendMessage и sendPhoto правдоподобными объектами, на остальное — true"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}        # метод -> число вызовов
+        self.first_call = None
+        self.last_call = None  # time.time() последнего ответа (кроме getMe)
+        self._message_id = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "sendPhoto"):
+            message = {
+                "message_id": next(self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+            }
+            if method == "sendPhoto":
+                file_id = params.get("photo") if isinstance(params.get("photo"), str) else None
+                file_id = file_id or f"stub-file-{message['message_id']}"
+                message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                     "width": 1280, "height": 960}]
+                message["caption"] = params.get("caption", "")
+            else:
+                message["text"] = params.get("text", "")
+            return message
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if api_method != "getMe":
+            self.last_call = time.time()
+            self.first_call = self.first_call or self.last_call
+        body = {"ok": True, "result": self._result(api_method, params)}
+        return 200, json.dumps(body).encode("utf-8")
@@ -7,13 +7,35 @@
 """
 
 import os
+import re
 import json
+import hmac
+import hashlib
+import time
+import heapq
+import bisect
+import functools
 import random
+import signal
+import secrets
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import sys
+import sqlite3
+import threading
+import struct
+import zlib
+import weakref
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from pathlib import Path
 
 from telegram import Update
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -21,20 +43,22 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-import pytz
 
 # ============== НАСТРОЙКИ ==============
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
-DATA_DIR = Path("/app/data")
-TIMEZONE = pytz.timezone("Europe/Moscow")
+DATA_DIR = Path(os.environ.get("DATA_DIR", "/app/data"))
+TIMEZONE = ZoneInfo("Europe/Moscow")
 
 # Период работы
 BOT_START = datetime(2026, 1, 17, 16, 0, tzinfo=TIMEZONE)
 BOT_END = datetime(2026, 2, 14, 0, 0, tzinfo=TIMEZONE)
 
-# Расписание
+# Расписание. Пояс и подъём по умолчанию берутся из settings.json
+# (timezone, weekday_wakeup, weekend_wakeup), у каждого пользователя можно свои;
+# WAKEUP_* — если в настройках их нет
 WAKEUP_HOUR = 5
 WAKEUP_MINUTE = 30
+ZONE_TABLE_MARGIN = 366 * 24 * 3600  # Переходы смещений UTC считаются на сезон ± год
 SLEEP_HOUR = 23
 SLEEP_MINUTE = 0
 
@@ -46,230 +70,3246 @@ DOPAMINE_END_HOUR = 22
 HUNGER_WARNING_HOURS = 12  # Режим "Нехорошо"
 HUNGER_RIOT_HOURS = 24     # Режим "Бунт"
 
+# Чек-ины: короткие толчки в течение дня, с подъёма до конца рабочего дня.
+# Интервал и конец дня — из settings.json (checkin_interval_minutes, workday_end);
+# /done и /tried удваивают интервал (до 2^CHECKIN_MAX_BACKOFF), каждый чек-ин — снова сокращает
+CHECKIN_INTERVAL_MINUTES = 45
+CHECKIN_END = "22:30"
+CHECKIN_JITTER = 0.25       # Интервал ± четверть, у каждого пользователя свой разброс
+CHECKIN_MAX_BACKOFF = 3
+CHECKIN_SPREAD = 60         # Секунды: чек-ины одного тика уходят вразброс по минуте
+CHECKIN_TTL = 10 * 60
+
+# Очки дня — часы сытости: /done +12, /tried +4
+DONE_POINTS = 12
+TRIED_POINTS = 4
+
+# Исходящие уведомления: лимиты Telegram — ~30 сообщений/с на бота, 1/с на чат
+GLOBAL_SEND_RATE = 25       # Сообщений в секунду на всех (с запасом)
+GLOBAL_SEND_BURST = 5       # Сколько можно отправить разом одной пачкой
+CHAT_SEND_INTERVAL = 1.0    # Секунд между сообщениями в один чат
+SEND_MAX_RETRIES = 5
+SEND_RETRY_BASE = 1.0       # Секунды; удваивается с каждой попыткой
+SEND_MAX_IN_FLIGHT = 32     # Запросов отправки одновременно (по соединению из пула на каждый)
+DOPAMINE_TTL = 10 * 60      # Устаревшие уведомления не отправляем
+RIOT_TTL = 25 * 60
+
+# Живой статус: одно закреплённое сообщение, которое правится, а не шлётся заново
+LIVE_STATUS = os.environ.get("LIVE_STATUS", "1") == "1"
+LIVE_STATUS_INTERVAL = 60       # Секунды: не больше одной правки за интервал
+LIVE_STATUS_REFRESH = 10 * 60   # Секунды: пересчёт всех (голод растёт и без команд)
+
+# Рассылки всем (конец сезона, объявления)
+BROADCAST_PAGE = 200            # Пользователей за шаг курсора; прогресс пишется после каждого
+BROADCAST_CONCURRENCY = 16      # Одновременных запросов рассылки
+ADMIN_IDS = {int(uid) for uid in os.environ.get("ADMIN_IDS", "").split(",") if uid.strip()}
+
 # Картинка для сна
 GITHUB_RAW_BASE = "https://raw.githubusercontent.com/setar7788-ctrl/shifr_storozha_bot/main"
 NIGHT_IMAGE = f"{GITHUB_RAW_BASE}/для%20телефона.png"
 
-# Пути к файлам
-DATA_FILE = DATA_DIR / "stoyanka_data.json"
-PHRASES_FILE = DATA_DIR / "phrases.json"
+# Картинки лежат рядом с ботом; сжатые копии и file_id — в DATA_DIR
+ASSETS_DIR = Path(__file__).resolve().parent
+MEDIA_DIR = DATA_DIR / "media"
+MEDIA_MAX_SIDE = 1280       # Telegram всё равно ужимает фото до 1280 px
+MEDIA_JPEG_QUALITY = 85
+MEDIA_ASSETS = {
+    "night": {"file": "для телефона.png", "url": NIGHT_IMAGE},
+    "animal_1": {"file": "Leming.jpg"},
+    "animal_2": {"file": "Zayac.jpg"},
+    "animal_3": {"file": "Olen.jpg"},
+    "animal_4": {"file": "ovczebyk-ajstok.jpg"},
+    "animal_5": {"file": "zubr.jpg"},
+}
+
+# Пути к файлам
+DATA_FILE = DATA_DIR / "stoyanka_data.json"  # Старый формат: один пользователь
+STATE_DB_FILE = DATA_DIR / "stoyanka.db"
+STATE_JSON_FILE = DATA_FILE  # Хранилище STATE_BACKEND=json
+
+# Хранилище состояния: sqlite (по умолчанию) или json (один атомарный снимок)
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite")
+STATE_FLUSH_INTERVAL = 5  # Секунды: как часто сбрасывать изменения из команд
+
+# Журнал событий (кормления и отправленные уведомления): сегменты на дозапись
+JOURNAL_DIR = DATA_DIR / "journal"
+JOURNAL_SEGMENT_BYTES = 1 << 20  # ~25 тыс. событий в сегменте
+JOURNAL_KEEP_SEGMENTS = int(os.environ.get("JOURNAL_KEEP_SEGMENTS", "0"))  # 0 — хранить всю историю
+
+# Планировщик событий: heap (куча по пользователям) или columnar (массивы NumPy)
+SCHEDULER_MODE = os.environ.get("SCHEDULER", "heap")
+PHRASES_FILE = DATA_DIR / "phrases.json"
+PHRASES_KICK_FILE = DATA_DIR / "phrases_kick.json"              # Чек-ины, когда племя голодает
+PHRASES_MOTIVATION_FILE = DATA_DIR / "phrases_motivation.json"  # Чек-ины, когда племя сыто
+INTENTS_FILE = DATA_DIR / "intents.json"
+SETTINGS_FILE = DATA_DIR / "settings.json"
+ANIMALS_FILE = DATA_DIR / "animals.json"
+MEDIA_REGISTRY_FILE = DATA_DIR / "media_registry.json"
+TASKS_FILE = DATA_DIR / "tasks.json"
+REWARDS_FILE = DATA_DIR / "rewards.json"
+PHRASES_RELOAD_INTERVAL = 60  # Секунды между проверками mtime фраз
+
+# Утренние цели: доли категорий (2G/1P/1M) и префиксы шифров
+TASK_MIX = {"hero": 2, "papa": 1, "multimillionaire": 1}
+TASK_PREFIXES = {"hero": "G", "papa": "P", "multimillionaire": "M"}
+WEEKDAY_TASKS_COUNT = 4  # Если в settings.json не указано иное
+WEEKEND_TASKS_COUNT = 8
+
+# Метрики в формате Prometheus на локальном порту (0 — выключено, обычно 9108)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Профилирование по команде /profile (только ADMIN_IDS): итоги пишутся сюда
+PROFILE_DIR = DATA_DIR / "profiles"
+PROFILE_SAMPLE_INTERVAL = 0.005  # Секунды между снимками стека в режиме sample
+TELEGRAM_TEXT_LIMIT = 4096
+
+# Получение обновлений: polling (по умолчанию) или webhook со своим HTTP-сервером
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "polling")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")  # Публичный адрес; без него вебхук не регистрируется
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "16"))
+ALLOWED_UPDATES = ["message"]  # Обработчики смотрят только на сообщения
+
+# Шарды: SHARDS > 1 — фронт-процесс принимает обновления и раздаёт их воркерам по user_id
+SHARDS = int(os.environ.get("SHARDS", "1"))
+WORKER_INDEX = os.environ.get("SHARD_INDEX")  # Задаёт фронт своим воркерам
+SHARD_INDEX = 0  # Номер и число шардов этого процесса (см. configure_shard)
+SHARD_COUNT = 1
+POLL_TIMEOUT = 30  # Секунды long polling у фронта
+
+# Транспорт Bot API: пулы соединений и таймауты — отдельно для отправки и для getUpdates
+# (см. HTTP_PROFILES). По умолчанию — как в PTB: bench_transport не показал выигрыша
+# у tuned, он остаётся на выбор. HTTP2: auto — если установлен h2
+# (python-telegram-bot[http2]) и запросы идут в api.telegram.org
+HTTP_PROFILE = os.environ.get("HTTP_PROFILE", "ptb")
+HTTP2 = os.environ.get("HTTP2", "auto")
+TELEGRAM_API_URL = "https://api.telegram.org/bot"
+BOT_API_URL = os.environ.get("BOT_API_URL", TELEGRAM_API_URL)  # Свой сервер Bot API или заглушка
+
+# Диагностика каждого тика пишется на уровне DEBUG: LOG_LEVEL=DEBUG, чтобы увидеть
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=os.environ.get("LOG_LEVEL", "INFO").upper()
+)
+logger = logging.getLogger(__name__)
+
+
+# ============== HTTP-СЕРВЕР ==============
+class HttpServer:
+    """Минимальный HTTP/1.1-сервер на asyncio (метрики, вебхук) с keep-alive.
+    Маршрут: (метод, путь) -> async handler(headers, body) -> (статус, тело)"""
+
+    max_body = 1 << 20
+    idle_timeout = 60
+
+    def __init__(self, host: str, port: int, routes: dict):
+        self.host = host
+        self.port = port
+        self.routes = routes
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        paths = ", ".join(path for _, path in self.routes)
+        logger.info(f"HTTP-сервер: {self.host}:{self.port} ({paths})")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _read_line(self, reader) -> bytes:
+        return await asyncio.wait_for(reader.readline(), self.idle_timeout)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_line(reader)
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await self._read_line(reader)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = request.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length") or 0)
+                if length > self.max_body:
+                    status, body, keep_alive = "413 Payload Too Large", b"", False
+                else:
+                    payload = await reader.readexactly(length) if length else b""
+                    status, body = await self._dispatch(method, target.split("?")[0], headers, payload)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: text/plain; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("ascii") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, headers: dict, payload: bytes):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return "404 Not Found", b"not found\n"
+        try:
+            return await handler(headers, payload)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {method} {path}: {e}")
+            return "500 Internal Server Error", b""
+
+
+# ============== МЕТРИКИ ==============
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"
+                for key, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """Текущее значение, снимается функцией в момент запроса"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def render(self) -> list:
+        return [f"{self.name} {self.func()}"]
+
+
+class Histogram:
+    """Гистограмма длительностей: счётчики по корзинам, сумма и количество"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # метки -> [счётчики корзин (последняя — +Inf), сумма]
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+HANDLER_SECONDS = METRICS.add(Histogram(
+    "stoyanka_handler_seconds", "Время обработки команды", ("handler",)))
+HANDLER_ERRORS = METRICS.add(Counter(
+    "stoyanka_handler_errors_total", "Команды, завершившиеся исключением", ("handler",)))
+TICK_SECONDS = METRICS.add(Histogram(
+    "stoyanka_timer_tick_seconds", "Длительность тика main_timer"))
+TICK_USERS = METRICS.add(Counter(
+    "stoyanka_timer_due_users_total", "Пользователи, обработанные таймером"))
+STORAGE_SECONDS = METRICS.add(Histogram(
+    "stoyanka_storage_seconds", "Чтение и запись хранилища", ("op",)))
+STORAGE_ERRORS = METRICS.add(Counter(
+    "stoyanka_storage_errors_total", "Ошибки хранилища", ("op",)))
+SEND_SECONDS = METRICS.add(Histogram(
+    "stoyanka_send_seconds", "Время вызова Bot API при отправке", ("method",)))
+SEND_TOTAL = METRICS.add(Counter(
+    "stoyanka_send_total", "Исходящие уведомления по итогу", ("kind", "result")))
+EVENTS_TOTAL = METRICS.add(Counter(
+    "stoyanka_journal_events_total", "События, записанные в журнал", ("kind",)))
+WEBHOOK_TOTAL = METRICS.add(Counter(
+    "stoyanka_webhook_requests_total", "Запросы к вебхуку по итогу", ("result",)))
+LIVE_STATUS_TOTAL = METRICS.add(Counter(
+    "stoyanka_live_status_total", "Пересчёты живого статуса: правка или текст не изменился", ("result",)))
+METRICS.add(Gauge(
+    "stoyanka_outbox_pending", "Уведомления в очереди отправки", lambda: OUTBOX._pending))
+METRICS.add(Gauge(
+    "stoyanka_users_cached", "Пользователи в кэше состояния", lambda: len(STATE.users)))
+
+
+def instrumented(handler):
+    """Считает время и ошибки обработчика команды"""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        unit = PROFILER.begin("handlers", name) if PROFILER.target == "handlers" else None
+        try:
+            return await handler(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            if unit is not None:
+                PROFILER.end(unit)
+
+    return wrapper
+
+
+async def metrics_page(headers: dict, body: bytes):
+    return "200 OK", METRICS.render().encode("utf-8")
+
+
+METRICS_SERVER = HttpServer(METRICS_HOST, METRICS_PORT, {("GET", "/metrics"): metrics_page})
+
+
+async def start_metrics_server():
+    """Метрики не должны мешать боту: занятый порт (второй экземпляр на хосте) —
+    запись в лог и работа без /metrics"""
+    if not METRICS_PORT:
+        return
+    try:
+        await METRICS_SERVER.start()
+    except OSError as e:
+        logger.error(f"Метрики не запущены ({METRICS_HOST}:{METRICS_SERVER.port}): {e}")
+
+
+# ============== ПРОФИЛИРОВАНИЕ ==============
+class _NoPhase:
+    """Фаза при выключенном профилировании: вход и выход ничего не делают"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "wall", "cpu")
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class StackSampler:
+    """Семплирующий профилировщик: фоновый поток раз в interval снимает стек
+    потока цикла событий и считает одинаковые стеки (формат flamegraph)"""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        import threading
+
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def top(self, limit: int) -> list:
+        """Функции, на которых поток стоял чаще всего: (доля, функция)"""
+        leaves = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rpartition(";")[2]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        total = self.samples or 1
+        return [(count / total, leaf) for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:limit]]
+
+    def dump(self, path: Path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Профилирование по запросу: следующие N тиков main_timer или вызовов обработчиков.
+    
+    Точки замера — with PROFILER.phase("load") и т.п. на горячих путях.
+    Выключенный профилировщик отдаёт общий пустой контекст, и точка стоит
+    один вызов метода. Включённый копит время на стенных часах и
+    процессорное по фазам; режим cprofile добавляет cProfile, sample —
+    семплирование стека. Фазы внутри await захватывают и чужие задачи,
+    поэтому их процессорное время — оценка сверху."""
+
+    MODES = ("phases", "sample", "cprofile")
+
+    def __init__(self):
+        self.target = None  # "timer" или "handlers"; None — выключен
+        self.mode = None
+        self.left = 0
+        self.units = 0
+        self._open = set()  # Начатые и ещё не законченные замеры текущего запуска
+        self.chat_id = None
+        self.phases = {}    # фаза -> [вызовов, стена, CPU]
+        self._started = None
+        self._profile = None
+        self._sampler = None
+
+    def phase(self, name: str):
+        if self.target is None:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def add(self, name: str, wall: float, cpu: float):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += wall
+        stats[2] += cpu
+
+    def start(self, target: str, count: int, mode: str = "phases", chat_id: int = None):
+        if self.target is not None:
+            self.finish()
+        self.target = target
+        self.mode = mode
+        self.left = count
+        self.units = 0
+        self._open = set()  # Замеры прошлого запуска, ещё идущие, сюда не попадут
+        self.chat_id = chat_id
+        self.phases = {}
+        self._started = (time.perf_counter(), time.process_time())
+        if mode == "cprofile":
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif mode == "sample":
+            self._sampler = StackSampler()
+            self._sampler.start()
+        logger.info(f"Профилирование {target}: {count}, режим {mode}")
+
+    def begin(self, target: str, name: str):
+        """Начало тика или вызова обработчика; None — этот не замеряется"""
+        if self.target != target or self.left <= 0:
+            return None
+        self.left -= 1
+        unit = _Phase(self, name).__enter__()
+        self._open.add(unit)
+        return unit
+
+    def end(self, unit):
+        if unit not in self._open:
+            return  # Начат до перезапуска или после finish — не в счёт
+        self._open.discard(unit)
+        unit.__exit__(None, None, None)
+        self.units += 1
+        if self.left <= 0 and not self._open:
+            self.finish()  # Все N начаты и закончены
+
+    def finish(self) -> str:
+        """Останавливает замер, пишет файлы в PROFILE_DIR; возвращает сводку (и шлёт её заказчику)"""
+        if self.target is None:
+            return "Профилирование не запущено"
+        wall = time.perf_counter() - self._started[0]
+        cpu = time.process_time() - self._started[1]
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        base = PROFILE_DIR / f"{self.target}-{time.strftime('%Y%m%d-%H%M%S')}"
+        lines = [
+            f"Профиль {self.target} ({self.mode}): замеров {self.units} за {wall:.1f} с, CPU {cpu:.2f} с",
+            f"{'фаза':<22} {'вызовов':>8} {'стена, мс':>10} {'на вызов, мкс':>14} {'CPU, мс':>9}",
+        ]
+        for name, (calls, phase_wall, phase_cpu) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<22} {calls:>8} {phase_wall * 1e3:>10.1f} "
+                         f"{phase_wall / calls * 1e6:>14.1f} {phase_cpu * 1e3:>9.1f}")
+        if self._profile is not None:
+            self._profile.disable()
+            import io
+            import pstats
+
+            self._profile.dump_stats(f"{base}.pstats")
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats("tottime").print_stats(8)
+            lines.append("\nБольше всего собственного времени (cProfile):")
+            lines += [line for line in out.getvalue().splitlines() if line.strip()][-9:]
+            lines.append(f"Полностью: {base}.pstats")
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.dump(Path(f"{base}.folded"))
+            lines.append(f"\nЧаще всего на вершине стека ({self._sampler.samples} снимков):")
+            lines += [f"{share:>6.1%}  {leaf}" for share, leaf in self._sampler.top(8)]
+            lines.append(f"Стеки: {base}.folded")
+        summary = "\n".join(lines)
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+        logger.info(f"Профилирование {self.target} закончено: {base}.txt")
+        if self.chat_id is not None:
+            OUTBOX.send_message(self.chat_id, summary[:TELEGRAM_TEXT_LIMIT], kind="profile")
+        self.target = self.mode = None
+        self.left = 0
+        self._open = set()
+        self._profile = self._sampler = None
+        return summary
+
+
+PROFILER = Profiler()
+
+
+def profiled(target: str):
+    """Тик или вызов целиком — единица профилирования target; выключенный стоит одно сравнение"""
+    def decorate(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            unit = PROFILER.begin(target, name) if PROFILER.target == target else None
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                if unit is not None:
+                    PROFILER.end(unit)
+
+        return wrapper
+
+    return decorate
+
+
+# ============== РАБОТА С ДАННЫМИ ==============
+def ensure_data_dir():
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+
+DEFAULT_USER_STATE = {
+    "user_id": None,
+    "current_date": None,
+    "morning_done": False,
+    "last_feed_time": None,
+    "hunger_notified": False,  # Отправлено ли уведомление о режиме "Нехорошо"
+    "last_dopamine_hour": None,  # Последний час когда отправлен дофамин
+    "goodnight_sent": False,  # Отправлено ли пожелание сна сегодня
+    "summary_sent": False,  # Отправлен ли итог дня
+    "status_message_id": None,  # Закреплённое сообщение живого статуса
+    "status_text": None,  # Что в нём сейчас написано
+    "broadcasts": None,  # Номера рассылок, уже доставленных (или отвергнутых) этому пользователю
+    "timezone": None,  # Пояс IANA; None — из settings.json
+    "weekday_wakeup": None,  # Подъём в будни, "ЧЧ:ММ"; None — из settings.json
+    "weekend_wakeup": None,  # Подъём в выходные
+    "checkin_at": None,  # Следующий чек-ин, секунды эпохи (ровно минута); None — до утра или /start
+    "checkin_backoff": 0,  # Интервал чек-инов × 2^checkin_backoff
+}
+
+
+def atomic_write_json(path: Path, obj):
+    """Пишет во временный файл, делает fsync и переименовывает поверх —
+    при падении на диске остаётся либо старая, либо новая версия целиком"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")  # Шарды пишут одновременно
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class StateStore(ABC):
+    """Хранилище состояния: одна запись на каждого добытчика"""
+
+    @abstractmethod
+    def get(self, user_id: int):
+        ...
+
+    def put(self, data: dict):
+        self.put_many([data])
+
+    @abstractmethod
+    def put_many(self, records: list, meta: dict = None):
+        """Записи и служебные значения (meta) — одним атомарным шагом"""
+
+    @abstractmethod
+    def get_meta(self, key: str, default=None):
+        ...
+
+    @abstractmethod
+    def user_ids(self) -> list:
+        ...
+
+    def user_ids_after(self, cursor: int, limit: int) -> list:
+        """Страница user_id > cursor по возрастанию — курсор рассылки"""
+        return sorted(user_id for user_id in self.user_ids() if user_id > cursor)[:limit]
+
+    def items(self) -> list:
+        """Все записи: [(user_id, запись)]"""
+        return [(user_id, self.get(user_id)) for user_id in self.user_ids()]
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite в режиме WAL: строка на пользователя"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id INTEGER PRIMARY KEY,"
+            " last_feed_time TEXT,"
+            " data TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def get(self, user_id: int):
+        row = self.conn.execute(
+            "SELECT data FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put_many(self, records: list, meta: dict = None):
+        """Все записи — одной транзакцией"""
+        rows = [
+            (data["user_id"], data.get("last_feed_time"), json.dumps(data, ensure_ascii=False))
+            for data in records
+        ]
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO users (user_id, last_feed_time, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                "last_feed_time = excluded.last_feed_time, data = excluded.data",
+                rows,
+            )
+            if meta:
+                self.conn.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    [(key, json.dumps(value)) for key, value in meta.items()],
+                )
+
+    def get_meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def user_ids(self) -> list:
+        return [row[0] for row in self.conn.execute("SELECT user_id FROM users")]
+
+    def user_ids_after(self, cursor: int, limit: int) -> list:
+        return [row[0] for row in self.conn.execute(
+            "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (cursor, limit))]
+
+    def items(self) -> list:
+        """Один запрос на всех — для старта"""
+        return [
+            (user_id, json.loads(data))
+            for user_id, data in self.conn.execute("SELECT user_id, data FROM users")
+        ]
+
+    def close(self):
+        self.conn.close()
+
+
+class JsonSnapshotStore(StateStore):
+    """Все пользователи в одном stoyanka_data.json; каждый flush — атомарный снимок.
+    Подходит для небольших установок."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.users = {}
+        self.meta = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if "users" in raw:
+                self.users = {int(uid): record for uid, record in raw["users"].items()}
+                self.meta = raw.get("meta", {})
+            elif raw.get("user_id"):  # Старый формат: один пользователь
+                self.users = {raw["user_id"]: raw}
+
+    def get(self, user_id: int):
+        record = self.users.get(user_id)
+        return dict(record) if record is not None else None
+
+    def put_many(self, records: list, meta: dict = None):
+        for data in records:
+            self.users[data["user_id"]] = dict(data)
+        if meta:
+            self.meta.update(meta)
+        atomic_write_json(self.path, {
+            "meta": self.meta,
+            "users": {str(uid): r for uid, r in self.users.items()},
+        })
+
+    def get_meta(self, key: str, default=None):
+        return self.meta.get(key, default)
+
+    def user_ids(self) -> list:
+        return list(self.users)
+
+
+_store = None
+
+
+def get_store() -> StateStore:
+    global _store
+    if _store is None:
+        ensure_data_dir()
+        if STATE_BACKEND == "json":
+            _store = JsonSnapshotStore(STATE_JSON_FILE)
+        else:
+            _store = SQLiteStateStore(STATE_DB_FILE)
+        if SHARD_COUNT > 1:
+            problem = shard_count_mismatch(_store, SHARD_INDEX, SHARD_COUNT)
+            if problem:
+                _store.close()
+                _store = None
+                raise RuntimeError(problem)
+            import_unsharded(_store)  # Раньше старого файла: в общем хранилище данные свежее
+        if STATE_BACKEND != "json":
+            migrate_legacy_data(_store)
+    return _store
+
+
+def migrate_legacy_data(store: StateStore):
+    """Переносит старый однопользовательский stoyanka_data.json в хранилище"""
+    if not DATA_FILE.exists():
+        return
+    try:
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except Exception as e:
+        logger.error(f"Ошибка чтения старых данных: {e}")
+        return
+    user_id = legacy.get("user_id")
+    if user_id and owns_user(user_id) and store.get(user_id) is None:
+        data = dict(DEFAULT_USER_STATE)
+        data.update(legacy)
+        store.put(data)
+        logger.info(f"Старые данные перенесены для user_id={user_id}")
+
+
+def import_unsharded(store: StateStore):
+    """Первый запуск воркера: забирает своих пользователей из общего хранилища
+    однопроцессного режима. Журнал общего режима не переносится — перед
+    переходом на шарды бот должен остановиться штатно (с flush).
+    
+    Перенос и число шардов отмечаются в meta одной транзакцией с записями"""
+    if store.get_meta("unsharded_imported"):
+        return
+    if STATE_BACKEND == "json":
+        shared = JsonSnapshotStore(DATA_FILE) if DATA_FILE.exists() else None
+    else:
+        source = DATA_DIR / "stoyanka.db"
+        shared = SQLiteStateStore(source) if source.exists() else None
+    records = []
+    if shared is not None:
+        try:
+            records = [data for user_id, data in shared.items() if owns_user(user_id)]
+        finally:
+            shared.close()
+    store.put_many(records, {"unsharded_imported": True, "shard_count": SHARD_COUNT})
+    if records:
+        logger.info(f"Шард {SHARD_INDEX}: перенесено пользователей из общего хранилища: {len(records)}")
+
+
+def shard_store_files() -> dict:
+    """Файлы хранилищ шардов в DATA_DIR: номер шарда -> путь"""
+    pattern = re.compile(r"stoyanka_data-(\d+)\.json" if STATE_BACKEND == "json" else r"stoyanka-(\d+)\.db")
+    files = {}
+    for path in DATA_DIR.iterdir():
+        match = pattern.fullmatch(path.name)
+        if match:
+            files[int(match.group(1))] = path
+    return files
+
+
+def shard_count_mismatch(store: StateStore, index: int, count: int):
+    """Почему шард index нельзя открыть при SHARDS=count; None — можно.
+    Пользователь закреплён за шардом по user_id % SHARDS: после смены числа шардов
+    часть пользователей осталась бы в чужих файлах, а новые шарды взяли бы
+    устаревшие записи из общего хранилища. Переноса между шардами нет"""
+    stored = store.get_meta("shard_count")
+    if index < count and stored in (None, count):
+        return None
+    return (f"Хранилище шарда {index} создано при SHARDS={stored or '?'}, сейчас SHARDS={count}: "
+            f"верните прежнее число шардов")
+
+
+def check_shard_layout(count: int):
+    """Фронт до запуска воркеров: все существующие хранилища шардов — от того же SHARDS"""
+    for index, path in sorted(shard_store_files().items()):
+        store = JsonSnapshotStore(path) if STATE_BACKEND == "json" else SQLiteStateStore(path)
+        try:
+            problem = shard_count_mismatch(store, index, count)
+        finally:
+            store.close()
+        if problem:
+            return problem
+    return None
+
+
+_MISSING = object()
+
+
+class UserState(dict):
+    """Запись пользователя, которая помнит изменённые поля"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        if self.get(key, _MISSING) != value:
+            self.dirty.add(key)
+        super().__setitem__(key, value)
+
+    def touch(self, key):
+        """Поле изменено на месте (вложенный словарь или список)"""
+        self.dirty.add(key)
+
+
+class StateCache:
+    """Состояние в памяти с отложенной записью: изменения копятся
+    и уходят в хранилище одним flush за тик (или раз в STATE_FLUSH_INTERVAL)"""
+
+    def __init__(self):
+        self.users = {}
+        self.pending = set()  # user_id с несохранёнными изменениями
+
+    def cached(self, user_id: int):
+        return self.users.get(user_id)
+
+    def adopt(self, user_id: int, stored) -> UserState:
+        """Кладёт в кэш запись, прочитанную из хранилища (если её там ещё нет)"""
+        data = self.users.get(user_id)
+        if data is None:
+            data = UserState(DEFAULT_USER_STATE)
+            data["user_id"] = user_id
+            data.dirty.clear()
+            if stored:
+                dict.update(data, stored)
+            self.users[user_id] = data
+        return data
+
+    def get(self, user_id: int) -> UserState:
+        data = self.users.get(user_id)
+        if data is None:
+            data = self.adopt(user_id, get_store().get(user_id))
+        return data
+
+    def preload(self) -> list:
+        """Читает всех пользователей хранилища в кэш (при старте)"""
+        return [self.adopt(user_id, stored) for user_id, stored in get_store().items()]
+
+    def mark(self, data: UserState):
+        if data.dirty:
+            self.pending.add(data["user_id"])
+
+    def take_pending(self) -> list:
+        """Снимок изменённых записей для записи; флаги изменений сбрасываются"""
+        records = []
+        for user_id in self.pending:
+            data = self.users[user_id]
+            records.append(dict(data))
+            data.dirty.clear()
+        self.pending.clear()
+        return records
+
+    def restore_pending(self, records: list):
+        """Запись не удалась — вернуть пользователей в очередь на flush"""
+        self.pending.update(data["user_id"] for data in records)
+
+    def flush(self) -> int:
+        """Записывает все изменённые записи. Возвращает их количество."""
+        records = self.take_pending()
+        if records:
+            get_store().put_many(records)
+        return len(records)
+
+
+STATE = StateCache()
+
+# Всё блокирующее обращение к хранилищу — в одном отдельном потоке, по очереди
+_io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+
+
+async def run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, func, *args)
+
+
+# Блокировки пользователей: чтение-изменение-запись одного добытчика идут по очереди
+_user_locks = weakref.WeakValueDictionary()
+
+
+def user_lock(user_id: int) -> asyncio.Lock:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+    return lock
+
+
+async def aload_data(user_id: int):
+    """Запись из кэша; промах читается из хранилища не в цикле событий"""
+    with PROFILER.phase("load"):
+        data = STATE.cached(user_id)
+        if data is not None:
+            return data
+        started = time.perf_counter()
+        try:
+            stored = await run_io(get_store().get, user_id)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки данных: {e}")
+            STORAGE_ERRORS.inc("load")
+            stored = None
+        STORAGE_SECONDS.observe(time.perf_counter() - started, "load")
+        return STATE.adopt(user_id, stored)
+
+
+def save_data(data):
+    """Помечает запись для ближайшего flush; на диск сразу ничего не пишется"""
+    STATE.mark(data)
+
+
+def save_snapshot(records: list, journal_seq: int, meta: dict = None):
+    """Записи и позиция журнала, до которой они актуальны, — одной транзакцией"""
+    get_store().put_many(records, dict(meta or {}, journal_seq=journal_seq))
+    JOURNAL.snapshot_seq = journal_seq
+    JOURNAL.sync()
+    JOURNAL.compact()
+
+
+async def flush_state(meta: dict = None):
+    """meta — служебные значения, которые должны лечь вместе с записями (прогресс рассылки)"""
+    records = STATE.take_pending()
+    journal_seq = JOURNAL.seq
+    if not records and not meta and journal_seq == JOURNAL.snapshot_seq:
+        return
+    started = time.perf_counter()
+    with PROFILER.phase("save"):
+        try:
+            await run_io(save_snapshot, records, journal_seq, meta)
+            logger.debug(f"Сохранено записей: {len(records)}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения: {e}")
+            STORAGE_ERRORS.inc("save")
+            STATE.restore_pending(records)
+    STORAGE_SECONDS.observe(time.perf_counter() - started, "save")
+
+
+async def flush_state_job(context: ContextTypes.DEFAULT_TYPE):
+    await flush_state()
+
+
+# ============== СПРАВОЧНИКИ ==============
+CONFIG_SOURCES = {
+    "settings": (SETTINGS_FILE, dict),
+    "phrases": (PHRASES_FILE, dict),
+    "phrases_kick": (PHRASES_KICK_FILE, list),
+    "phrases_motivation": (PHRASES_MOTIVATION_FILE, list),
+    "intents": (INTENTS_FILE, dict),
+    "tasks": (TASKS_FILE, list),
+    "animals": (ANIMALS_FILE, list),
+    "rewards": (REWARDS_FILE, list),
+}
+
+
+def read_catalog(name: str, path: Path = None):
+    """Справочник name из JSON с проверкой типа; path — если файл не тот,
+    что в CONFIG_SOURCES (бенчи, другой DATA_DIR).
+
+    Пропавший или битый файл даёт None — справочник берёт свои значения
+    по умолчанию или оставляет прежние."""
+    source, kind = CONFIG_SOURCES[name]
+    source = Path(path) if path is not None else source
+    try:
+        with open(source, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка чтения {source.name}: {e}")
+        return None
+    if not isinstance(value, kind):
+        logger.error(f"{source.name}: ожидался {kind.__name__}, пропущен")
+        return None
+    return value
+
+
+_settings = None
+
+
+def get_settings() -> dict:
+    """settings.json, прочитанный один раз"""
+    global _settings
+    if _settings is None:
+        _settings = read_catalog("settings") or {}
+    return _settings
+
+
+# ============== ЖУРНАЛ СОБЫТИЙ ==============
+EVENT_KINDS = {
+    "done": 1,
+    "tried": 2,
+    "warning": 3,
+    "riot": 4,
+    "dopamine": 5,
+    "goodnight": 6,
+    "morning": 7,
+    "summary": 8,
+    "broadcast": 9,  # value — номер рассылки
+    "checkin": 10,
+    "task_done": 11,  # value — id задачи
+    "pin": 12,  # value — message_id нового закрепа статуса
+    "start": 13,
+}
+EVENT_NAMES = {code: name for name, code in EVENT_KINDS.items()}
+
+# Запись: seq, время (unix), user_id, вид, значение + crc32 этих полей
+_EVENT = struct.Struct("<QdqBd")
+_EVENT_CRC = struct.Struct("<I")
+EVENT_SIZE = _EVENT.size + _EVENT_CRC.size
+
+
+class EventJournal:
+    """Журнал событий только на дозапись: записи фиксированного размера
+    в сегментах <первый seq>.log.
+
+    Снимок состояния — это flush хранилища: вместе с записями в meta кладётся
+    journal_seq. При старте к снимку применяется только хвост журнала после
+    него, поэтому восстановление ограничено интервалом flush."""
+
+    def __init__(self, path: Path, segment_bytes: int = JOURNAL_SEGMENT_BYTES,
+                 keep_segments: int = JOURNAL_KEEP_SEGMENTS):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self.seq = 0  # Последнее записанное событие
+        self.snapshot_seq = 0  # Последнее событие, учтённое в хранилище
+        self._opened = False
+        self._fd = None
+        self._segment_size = 0
+        # append и ротация идут в цикле событий, sync — в потоке хранилища:
+        # без блокировки fsync может попасть в уже закрытый (или чужой) fd
+        self._fd_lock = threading.Lock()
+
+    @staticmethod
+    def _decode(raw: bytes):
+        if len(raw) != EVENT_SIZE:
+            return None
+        body, crc = raw[:_EVENT.size], raw[_EVENT.size:]
+        if _EVENT_CRC.unpack(crc)[0] != zlib.crc32(body):
+            return None
+        return _EVENT.unpack(body)
+
+    def _segments(self) -> list:
+        return sorted((int(p.stem), p) for p in self.path.glob("*.log") if p.stem.isdigit())
+
+    def open(self):
+        """Находит конец журнала; оборванную при сбое последнюю запись отрезает"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._opened = True
+        segments = self._segments()
+        if not segments:
+            return
+        first, last = segments[-1]
+        size = last.stat().st_size
+        good = size - size % EVENT_SIZE
+        record = None
+        with open(last, "rb") as f:
+            while good:
+                f.seek(good - EVENT_SIZE)
+                record = self._decode(f.read(EVENT_SIZE))
+                if record is not None:
+                    break
+                good -= EVENT_SIZE
+        if good != size:
+            logger.warning(f"Журнал {last.name}: отрезано {size - good} байт битого хвоста")
+            os.truncate(last, good)
+        self.seq = record[0] if record is not None else first - 1
+        if good < self.segment_bytes:
+            self._fd = os.open(last, os.O_WRONLY | os.O_APPEND)
+            self._segment_size = good
+
+    def _rotate(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        segment = self.path / f"{self.seq + 1:020d}.log"
+        self._fd = os.open(segment, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment_size = 0
+
+    def append(self, kind: str, user_id: int, ts: float, value: float = 0.0) -> int:
+        """Одна запись — один write() в конец сегмента"""
+        if not self._opened:
+            self.open()
+        with self._fd_lock:
+            if self._fd is None or self._segment_size >= self.segment_bytes:
+                self._rotate()
+            self.seq += 1
+            body = _EVENT.pack(self.seq, ts, user_id, EVENT_KINDS[kind], value)
+            os.write(self._fd, body + _EVENT_CRC.pack(zlib.crc32(body)))
+            self._segment_size += EVENT_SIZE
+            return self.seq
+
+    def read(self, after_seq: int = 0):
+        """События с seq > after_seq: (seq, время, user_id, вид, значение)"""
+        segments = self._segments()
+        start = 0
+        for i, (first, _) in enumerate(segments):
+            if first <= after_seq + 1:
+                start = i
+        for _, segment in segments[start:]:
+            with open(segment, "rb") as f:
+                while True:
+                    record = self._decode(f.read(EVENT_SIZE))
+                    if record is None:
+                        break
+                    if record[0] > after_seq:
+                        seq, ts, user_id, kind, value = record
+                        yield seq, ts, user_id, EVENT_NAMES.get(kind), value
+
+    def sync(self):
+        """fsync текущего сегмента. Под блокировкой берётся только копия fd,
+        чтобы append не ждал диска; старый сегмент fsync-ит сама ротация"""
+        with self._fd_lock:
+            if self._fd is None:
+                return
+            fd = os.dup(self._fd)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def compact(self):
+        """Удаляет старые сегменты, целиком вошедшие в снимок (если задан лимит)"""
+        if not self.keep_segments:
+            return
+        segments = self._segments()
+        covered = [
+            path for (_, path), (next_first, _) in zip(segments, segments[1:])
+            if next_first - 1 <= self.snapshot_seq
+        ]
+        for path in covered[:-self.keep_segments]:
+            path.unlink()
+            logger.info(f"Журнал: сегмент {path.name} удалён")
+
+    def close(self):
+        with self._fd_lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+
+
+JOURNAL = EventJournal(JOURNAL_DIR)
+
+
+def record_event(kind: str, data, value: float = 0.0):
+    JOURNAL.append(kind, data["user_id"], now_msk().timestamp(), value)
+    EVENTS_TOTAL.inc(kind)
+
+
+def apply_event(data, kind: str, ts: float, value: float):
+    """Повторяет изменение состояния, которое сопровождало событие.
+    Цели дня в журнал не пишутся: их список остаётся таким, как в снимке.
+    Пояс и время подъёма тоже: это строки, они сразу сбрасываются в хранилище."""
+    moment = datetime.fromtimestamp(ts, schedule_of(data).zone.zone)
+    reset_daily_if_needed(data, moment.strftime("%Y-%m-%d"))
+    if kind in ("done", "tried"):
+        data["last_feed_time"] = datetime.fromtimestamp(value, TIMEZONE).isoformat()
+        data["hunger_notified"] = False
+        add_score(data, DONE_POINTS if kind == "done" else TRIED_POINTS, moment)
+        checkin_activity(data, ts)
+    elif kind == "warning":
+        data["hunger_notified"] = True
+    elif kind == "dopamine":
+        data["last_dopamine_hour"] = int(value)
+    elif kind == "goodnight":
+        data["goodnight_sent"] = True
+    elif kind == "summary":
+        data["summary_sent"] = True
+    elif kind == "morning":
+        data["morning_done"] = True
+        if not data.get("last_feed_time"):
+            data["last_feed_time"] = moment.isoformat()
+        plan_checkin(data, ts)
+    elif kind == "broadcast":
+        mark_broadcast(data, int(value))
+    elif kind == "checkin":
+        checkin_sent(data, ts)
+    elif kind == "task_done":
+        task = TASKS.find(str(int(value)))
+        if task is not None:
+            TASKS.mark_done(data, task)
+    elif kind == "pin":
+        data["status_message_id"] = int(value)
+        data["status_text"] = None  # Текст не журналируется: закреп перепишется при первом пересчёте
+    elif kind == "start":
+        if not data.get("last_feed_time"):
+            data["last_feed_time"] = moment.isoformat()
+        if data.get("checkin_at") is None:
+            plan_checkin(data, ts)
+
+
+def recover_from_journal() -> int:
+    """Догоняет снимок хвостом журнала (при старте, в потоке хранилища)"""
+    JOURNAL.open()
+    JOURNAL.snapshot_seq = get_store().get_meta("journal_seq", 0)
+    JOURNAL.seq = max(JOURNAL.seq, JOURNAL.snapshot_seq)
+    count = 0
+    for _, ts, user_id, kind, value in JOURNAL.read(JOURNAL.snapshot_seq):
+        data = STATE.get(user_id)
+        apply_event(data, kind, ts, value)
+        STATE.mark(data)
+        count += 1
+    return count
+
+
+# ============== ФРАЗЫ ==============
+DEFAULT_PHRASES = {
+    "hunter_morning": [
+        "Вставай, Добытчик. Племя ждёт.",
+        "Новый день. Новая охота.",
+        "Солнце встало. Пора на охоту."
+    ],
+    "tribe_fed": [
+        "Племя сыто. Ты — молодец.",
+        "Еда есть. Племя благодарит.",
+        "Добыча принята. Все сыты."
+    ],
+    "tribe_tried": [
+        "Попытка засчитана. +4 часа.",
+        "Не вышло, но ты пытался.",
+        "Племя видит твои усилия."
+    ],
+    "tribe_hungry_warning": [
+        "Племя голодает. Где еда?",
+        "12 часов без добычи. Неси еду!",
+        "Люди ждут. Охотник, действуй!"
+    ],
+    "tribe_riot": [
+        "БУНТ! Племя в ярости!",
+        "24 часа голода! Люди злятся!",
+        "Охотник провалился! БУНТ!"
+    ],
+    "dopamine_common": [
+        "☀️ Момент покоя. Ты справляешься.",
+        "🌿 Вдохни. Всё идёт как надо.",
+        "💪 Племя сыто. Ты — хороший добытчик."
+    ],
+    "dopamine_rare": [
+        "🌟 Редкая удача! Найден мёд диких пчёл!",
+        "🎯 Твой бросок точен. Племя гордится.",
+        "🔥 Огонь горит ярко. Всё хорошо."
+    ],
+    "dopamine_legendary": [
+        "⚡ ЛЕГЕНДА! Духи предков улыбаются тебе!",
+        "🏆 Великий охотник! Песни сложат о тебе!",
+        "✨ Невероятно! Такое бывает раз в жизни!"
+    ],
+    "goodnight": [
+        "Спокойной ночи, охотник."
+    ],
+    "checkin_kick": [
+        "Племя голодает. Чем ты сейчас занят?"
+    ],
+    "checkin_motivation": [
+        "Хороший темп. Не сбавляй."
+    ],
+    "bot_end": [
+        "Сезон охоты окончен. Пора делать нового бота."
+    ]
+}
+
+# Редкость дофамина: 70% - обычные, 25% - редкие, 5% - легендарные
+DEFAULT_DOPAMINE_WEIGHTS = {
+    "dopamine_common": 70,
+    "dopamine_rare": 25,
+    "dopamine_legendary": 5,
+}
+
+
+class AliasSampler:
+    """Выбор элемента по весам за O(1) — таблица псевдонимов (метод Воуза)"""
+
+    def __init__(self, items: list, weights: list):
+        n = len(items)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.items = list(items)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        if rng.random() < self.prob[i]:
+            return self.items[i]
+        return self.items[self.alias[i]]
+
+
+class PhraseCatalog:
+    """Фразы в памяти: файлы разбираются один раз и перечитываются только при смене mtime.
+    pools — категории, которые лежат отдельным файлом-списком: категория -> (имя в CONFIG_SOURCES, файл)"""
+
+    def __init__(self, path: Path, pools: dict = None):
+        self.path = path
+        self.pools = pools or {}
+        self.mtime = None
+        self.phrases = dict(DEFAULT_PHRASES)
+        self.dopamine = AliasSampler(
+            list(DEFAULT_DOPAMINE_WEIGHTS), list(DEFAULT_DOPAMINE_WEIGHTS.values())
+        )
+
+    def refresh(self) -> bool:
+        """Перечитать файлы, если они изменились. Возвращает True при перезагрузке."""
+        paths = [self.path] + [path for _, path in self.pools.values()]
+        mtime = tuple(self._mtime(path) for path in paths)
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        raw = {}
+        if mtime[0] is not None:
+            raw = read_catalog("phrases", self.path)
+            if raw is None:  # Файл битый: оставляем прежние фразы
+                return False
+        raw = dict(raw)
+        for (category, (name, path)), pool_mtime in zip(self.pools.items(), mtime[1:]):
+            if pool_mtime is not None:
+                raw[category] = read_catalog(name, path) or self.phrases.get(category)  # Битый — прежний список
+        self._apply(raw)
+        logger.info(f"Фразы загружены: {len(self.phrases)} категорий")
+        return True
+
+    @staticmethod
+    def _mtime(path: Path):
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _apply(self, raw: dict):
+        phrases = dict(DEFAULT_PHRASES)
+        for category, items in raw.items():
+            if category == "dopamine_weights":
+                continue
+            if not isinstance(items, list) or not items or not all(
+                isinstance(item, str) and item.strip() for item in items
+            ):
+                logger.warning(f"Категория фраз '{category}' некорректна и пропущена")
+                continue
+            phrases[category] = items
+        
+        weights = raw.get("dopamine_weights", DEFAULT_DOPAMINE_WEIGHTS)
+        valid = isinstance(weights, dict) and weights and all(
+            category in phrases and isinstance(w, (int, float)) and w > 0
+            for category, w in weights.items()
+        )
+        if not valid:
+            logger.warning("dopamine_weights некорректны, беру 70/25/5")
+            weights = DEFAULT_DOPAMINE_WEIGHTS
+        
+        self.phrases = phrases
+        self.dopamine = AliasSampler(list(weights), list(weights.values()))
+
+    def pick(self, category: str):
+        items = self.phrases.get(category)
+        if items:
+            return random.choice(items)
+        return None
+
+    def pick_dopamine(self):
+        return self.pick(self.dopamine.sample())
+
+
+PHRASES = PhraseCatalog(PHRASES_FILE, {
+    "checkin_kick": ("phrases_kick", PHRASES_KICK_FILE),
+    "checkin_motivation": ("phrases_motivation", PHRASES_MOTIVATION_FILE),
+})
+
+
+def get_phrase(category: str) -> str:
+    with PROFILER.phase("phrase"):
+        return PHRASES.pick(category) or "..."
+
+
+def get_dopamine_phrase() -> str:
+    """Получить дофаминовую фразу с учётом редкости"""
+    with PROFILER.phase("phrase"):
+        return PHRASES.pick_dopamine() or "☀️ Хороший момент."
+
+
+def load_catalogs():
+    """Все справочники при старте"""
+    PHRASES.refresh()
+    INTENTS.refresh()
+    TASKS.load()
+    SCORES.load()
+    MEDIA.load()
+
+
+async def reload_catalogs(context: ContextTypes.DEFAULT_TYPE):
+    """Подхватывает правки фраз и intents.json без перезапуска"""
+    await asyncio.to_thread(PHRASES.refresh)
+    await asyncio.to_thread(INTENTS.refresh)
+
+
+# ============== РАСПОЗНАВАНИЕ КОМАНД ==============
+DEFAULT_INTENTS = {
+    "intents": {
+        "done": ["сделал", "сделала"],
+        "tried": ["попробовал", "попробовала"],
+    },
+    "negations": ["не"],
+    "negation_window": 2,
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+_INTENT_END = None  # Ключ конца фразы в узле графа (слова — всегда строки)
+
+
+def normalize_tokens(text: str) -> list:
+    """Слова в нижнем регистре, ё → е, без пунктуации"""
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+class IntentMatcher:
+    """Синонимы команд из intents.json, собранные в один префиксный граф по словам.
+
+    Сообщение разбирается за один проход: с каждого слова берётся самая длинная
+    фраза из графа. Фраза с отрицанием в negation_window словах перед ней
+    не считается («попробовал, но не сделал» → tried). Если осталось несколько
+    команд, побеждает та, что раньше в файле.
+
+    До разбора на слова сообщение проверяется на опорные слова — самое длинное
+    слово каждой фразы. В болтовне их обычно нет, и такое сообщение
+    отсеивается несколькими поисками подстроки без токенизации."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.mtime = None
+        self._compile(DEFAULT_INTENTS)
+
+    def refresh(self) -> bool:
+        """Перечитать файл, если он изменился. Возвращает True при перезагрузке."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        raw = DEFAULT_INTENTS
+        if mtime is not None:
+            raw = read_catalog("intents", self.path)
+            if raw is None:  # Файл битый: оставляем прежние команды
+                return False
+        self._compile(raw)
+        logger.info(f"Команды загружены: {len(self.priority)} намерений")
+        return True
+
+    def _compile(self, raw: dict):
+        root = {}
+        priority = {}
+        anchors = set()
+        for intent, phrases in raw.get("intents", {}).items():
+            if not isinstance(phrases, list) or not all(isinstance(p, str) for p in phrases):
+                logger.warning(f"Команда '{intent}' некорректна и пропущена")
+                continue
+            priority[intent] = len(priority)
+            for phrase in phrases:
+                tokens = normalize_tokens(phrase)
+                if not tokens:
+                    continue
+                anchors.add(max(tokens, key=len))
+                node = root
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(_INTENT_END, intent)
+        self.root = root
+        self.priority = priority
+        # «сделал» уже покрывает «сделала»: лишние поиски не нужны
+        self.anchors = tuple(sorted(
+            anchor for anchor in anchors
+            if not any(other != anchor and other in anchor for other in anchors)
+        ))
+        self.negations = frozenset(
+            token for word in raw.get("negations", []) for token in normalize_tokens(word)
+        )
+        self.negation_window = int(raw.get("negation_window", 2))
+
+    def matches(self, text: str) -> list:
+        """Найденные фразы: (начало, конец, намерение, с отрицанием)"""
+        return self._matches(normalize_tokens(text))
+
+    def _matches(self, tokens: list) -> list:
+        root = self.root
+        found = []
+        i = 0
+        n = len(tokens)
+        while i < n:
+            node = root.get(tokens[i])
+            if node is None:  # Обычная болтовня: одно обращение к словарю на слово
+                i += 1
+                continue
+            best = (i + 1, node[_INTENT_END]) if _INTENT_END in node else None
+            j = i + 1
+            while j < n:
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if _INTENT_END in node:
+                    best = (j, node[_INTENT_END])
+            if best is None:
+                i += 1
+                continue
+            end, intent = best
+            window = tokens[max(0, i - self.negation_window):i]
+            negated = any(token in self.negations for token in window)
+            found.append((i, end, intent, negated))
+            i = end
+        return found
+
+    def classify(self, text: str):
+        """Намерение сообщения или None"""
+        lowered = text.lower().replace("ё", "е")
+        for anchor in self.anchors:
+            if anchor in lowered:
+                break
+        else:
+            return None
+        best = None
+        for _, _, intent, negated in self._matches(_TOKEN_RE.findall(lowered)):
+            if negated:
+                continue
+            if best is None or self.priority[intent] < self.priority[best]:
+                best = intent
+        return best
+
+
+INTENTS = IntentMatcher(INTENTS_FILE)
+
+
+# ============== ЗАДАЧИ ==============
+class OpenTasks:
+    """Невыполненные задачи одного пользователя по категориям.
+    Список + позиция в нём: закрытие задачи — O(1), без перестройки индекса"""
+
+    def __init__(self, by_category: dict, done: set):
+        self.ids = {}
+        self.pos = {}
+        for category, ids in by_category.items():
+            items = [task_id for task_id in ids if task_id not in done]
+            self.ids[category] = items
+            for i, task_id in enumerate(items):
+                self.pos[task_id] = i
+
+    def remove(self, task_id: int, category: str):
+        i = self.pos.pop(task_id, None)
+        if i is None:
+            return
+        items = self.ids[category]
+        last = items.pop()
+        if last != task_id:
+            items[i] = last
+            self.pos[last] = i
+
+    def draw(self, category: str, k: int, stats: dict, rng, taken: set) -> list:
+        """k разных задач категории, которых нет в taken.
+
+        Случайная задача принимается с вероятностью 1 / (1 + пропусков):
+        часто пропускаемые выпадают реже, но из пула не исчезают.
+        В среднем O(k) попыток, весь пул не перебирается."""
+        items = self.ids.get(category, [])
+        if k <= 0 or not items:
+            return []
+        if k + len(taken) >= len(items):
+            rest = [task_id for task_id in items if task_id not in taken]
+            if k >= len(rest):
+                taken.update(rest)
+                return rest
+        chosen = []
+        attempts = 0
+        while len(chosen) < k:
+            task_id = items[rng.randrange(len(items))]
+            if task_id in taken:
+                continue
+            attempts += 1
+            skipped = stats.get(str(task_id), (0, 0))[1]
+            # После 20 попыток на задачу берём любую — чтобы не крутиться вечно
+            if rng.random() * (1 + skipped) < 1 or attempts > 20 * k:
+                taken.add(task_id)
+                chosen.append(task_id)
+        return chosen
+
+
+class TaskPool:
+    """Пул задач из tasks.json: читается один раз, индексируется по категориям.
+
+    Счётчики по пользователю лежат в его записи и только по выданным задачам:
+    task_stats {id: [выдано, пропущено]}, tasks_today, tasks_done."""
+
+    def __init__(self):
+        self.tasks = None  # id -> задача
+        self.by_category = {}  # категория -> id задач, не закрытых в tasks.json
+        self._open = {}  # user_id -> OpenTasks
+
+    def load(self):
+        items = read_catalog("tasks") or []
+        tasks = {}
+        by_category = {category: [] for category in TASK_MIX}
+        for task in items:
+            if task.get("category") not in TASK_PREFIXES or "id" not in task or not task.get("text"):
+                logger.warning(f"Задача {task.get('id')} некорректна и пропущена")
+                continue
+            tasks[task["id"]] = task
+            if not task.get("is_done"):
+                by_category[task["category"]].append(task["id"])
+        self.tasks = tasks
+        self.by_category = by_category
+        self._open.clear()
+        logger.info(f"Задач загружено: {len(tasks)}")
+
+    def _ensure_loaded(self):
+        if self.tasks is None:
+            self.load()
+
+    def code(self, task_id: int) -> str:
+        return f"{TASK_PREFIXES[self.tasks[task_id]['category']]}{task_id}"
+
+    def find(self, code: str):
+        """Задача по шифру: G12, g12, #12 или просто 12"""
+        self._ensure_loaded()
+        code = code.strip().lstrip("#").upper()
+        prefix = None
+        if code[:1] in TASK_PREFIXES.values():
+            prefix, code = code[0], code[1:]
+        if not code.isdigit():
+            return None
+        task = self.tasks.get(int(code))
+        if task is None or (prefix and TASK_PREFIXES[task["category"]] != prefix):
+            return None
+        return task
+
+    def _open_for(self, data) -> OpenTasks:
+        open_tasks = self._open.get(data["user_id"])
+        if open_tasks is None:
+            open_tasks = OpenTasks(self.by_category, set(data.get("tasks_done") or ()))
+            self._open[data["user_id"]] = open_tasks
+        return open_tasks
+
+    def draw_daily(self, data, weekend: bool, rng=random) -> list:
+        """Цели на день в пропорции TASK_MIX. Вчерашние невыполненные
+        засчитываются как пропущенные."""
+        self._ensure_loaded()
+        settings = get_settings()
+        if weekend:
+            count = settings.get("weekend_tasks_count") or WEEKEND_TASKS_COUNT
+        else:
+            count = settings.get("weekday_tasks_count") or WEEKDAY_TASKS_COUNT
+
+        stats = data.get("task_stats") or {}
+        done = set(data.get("tasks_done") or ())
+        for task_id in data.get("tasks_today") or ():
+            if task_id not in done:
+                stats.setdefault(str(task_id), [0, 0])[1] += 1
+
+        total = sum(TASK_MIX.values())
+        quotas = {category: count * share // total for category, share in TASK_MIX.items()}
+        quotas[next(iter(quotas))] += count - sum(quotas.values())
+
+        open_tasks = self._open_for(data)
+        taken = set()
+        drawn = []
+        for category, quota in quotas.items():
+            drawn += open_tasks.draw(category, quota, stats, rng, taken)
+        # Категория исчерпана — добираем из остальных
+        for category in quotas:
+            if len(drawn) >= count:
+                break
+            drawn += open_tasks.draw(category, count - len(drawn), stats, rng, taken)
+        rng.shuffle(drawn)
+
+        for task_id in drawn:
+            stats.setdefault(str(task_id), [0, 0])[0] += 1
+        data["task_stats"] = stats
+        data.touch("task_stats")
+        data["tasks_today"] = drawn
+        return drawn
+
+    def mark_done(self, data, task: dict) -> bool:
+        """Закрывает задачу пользователя; False — если уже была закрыта"""
+        done = data.get("tasks_done") or []
+        if task["id"] in done:
+            return False
+        self._open_for(data).remove(task["id"], task["category"])
+        data["tasks_done"] = done + [task["id"]]
+        return True
+
+
+TASKS = TaskPool()
+
+
+# ============== СЧЁТ И ДОБЫЧА ==============
+def add_score(data, points: int, moment: datetime):
+    """Добавляет очки к итогам дня и недели — O(1), история не пересчитывается"""
+    day = moment.strftime("%Y-%m-%d")
+    week = moment.strftime("%G-W%V")
+    if data.get("score_date") != day:
+        data["score_date"] = day
+        data["score_day"] = 0
+    if data.get("score_week_id") != week:
+        data["score_week_id"] = week
+        data["score_week"] = 0
+    data["score_day"] = data["score_day"] + points
+    data["score_week"] = data["score_week"] + points
+
+
+def current_scores(data, moment: datetime) -> tuple:
+    """(очки за день, очки за неделю) на момент moment"""
+    day = data.get("score_day", 0) if data.get("score_date") == moment.strftime("%Y-%m-%d") else 0
+    week = data.get("score_week", 0) if data.get("score_week_id") == moment.strftime("%G-W%V") else 0
+    return day, week
+
+
+class ScoreBoard:
+    """Таблицы добычи и наград из settings.json, animals.json и rewards.json.
+
+    Пороги разложены в отсортированные списки: зверь и уровень награды
+    по сумме очков — один bisect. Награды выдаются из мешка пользователя
+    без повторов, пока мешок не опустеет."""
+
+    REWARD_TIERS = ("low", "mid", "high")
+
+    def __init__(self):
+        self.loaded = False
+        self.loot_bounds = []
+        self.animals = []
+        self.reward_bounds = []
+        self.rewards = {}  # уровень -> id наград
+        self.reward_text = {}
+        self.summary_hour = SLEEP_HOUR
+        self.summary_minute = SLEEP_MINUTE
+
+    def load(self):
+        settings = get_settings()
+        try:
+            animals = sorted(read_catalog("animals") or [], key=lambda animal: animal["level"])
+        except (KeyError, TypeError) as e:
+            logger.error(f"Некорректная таблица зверей: {e}")
+            animals = []
+        rewards = read_catalog("rewards") or []
+        
+        loot_bounds = sorted((settings.get("loot_thresholds") or {}).values())
+        if animals and len(animals) != len(loot_bounds) + 1:
+            logger.warning(f"Зверей {len(animals)}, а порогов добычи {len(loot_bounds)} — лишние не используются")
+            loot_bounds = loot_bounds[:len(animals) - 1]
+        self.loot_bounds = loot_bounds
+        self.animals = animals
+        self.reward_bounds = [
+            settings.get("reward_mid_threshold", 19),
+            settings.get("reward_high_threshold", 32),
+        ]
+        self.rewards = {tier: [] for tier in self.REWARD_TIERS}
+        self.reward_text = {}
+        for reward in rewards:
+            if reward.get("level") in self.rewards:
+                self.rewards[reward["level"]].append(reward["id"])
+                self.reward_text[reward["id"]] = reward["text"]
+        
+        summary_time = settings.get("score_summary_time") or f"{SLEEP_HOUR}:{SLEEP_MINUTE:02d}"
+        hour, _, minute = summary_time.partition(":")
+        self.summary_hour, self.summary_minute = int(hour), int(minute or 0)
+        self.loaded = True
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def summary_time(self) -> tuple:
+        self._ensure_loaded()
+        return self.summary_hour, self.summary_minute
+
+    def animal(self, total: int):
+        """Зверь за день: первый, чей порог (включительно) не меньше суммы"""
+        self._ensure_loaded()
+        if total <= 0 or not self.animals:
+            return None
+        return self.animals[min(bisect.bisect_left(self.loot_bounds, total), len(self.animals) - 1)]
+
+    def tier(self, total: int) -> str:
+        self._ensure_loaded()
+        return self.REWARD_TIERS[bisect.bisect_right(self.reward_bounds, total)]
+
+    def pick_reward(self, data, tier: str, rng=random):
+        """Награда из мешка пользователя: каждая по разу, затем мешок пересыпается.
+        Последняя награда прошлого мешка не идёт первой в новом."""
+        self._ensure_loaded()
+        ids = self.rewards.get(tier)
+        if not ids:
+            return None
+        bags = data.get("reward_bags") or {}
+        bag = bags.setdefault(tier, {"left": [], "last": None})
+        left = [reward_id for reward_id in bag["left"] if reward_id in self.reward_text]
+        if not left:
+            left = list(ids)
+            rng.shuffle(left)
+            if len(left) > 1 and left[-1] == bag["last"]:
+                left[0], left[-1] = left[-1], left[0]
+        reward_id = left.pop()
+        bag["left"] = left
+        bag["last"] = reward_id
+        data["reward_bags"] = bags
+        data.touch("reward_bags")
+        return self.reward_text[reward_id]
+
+
+SCORES = ScoreBoard()
+
+
+# ============== ЧАСЫ ==============
+class SystemClock:
+    """Настоящее время по Москве"""
+
+    def now(self) -> datetime:
+        return datetime.now(TIMEZONE)
+
+
+class VirtualClock:
+    """Время для прогонов и тестов: двигается только вручную"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def set(self, moment: datetime):
+        self.current = moment
+
+    def advance(self, delta: timedelta):
+        self.current += delta
+
+
+CLOCK = SystemClock()
+
+
+def set_clock(clock):
+    """Подменить часы (VirtualClock для ускоренных прогонов)"""
+    global CLOCK
+    CLOCK = clock
+
+
+# ============== ЧАСОВЫЕ ПОЯСА ==============
+DAY_SECONDS = 24 * 3600
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+EPOCH_NAIVE = datetime(1970, 1, 1)
+
+
+class ZoneTable:
+    """Переходы смещения UTC одного пояса, найденные один раз на сезон ± год.
+    
+    «Местные секунды» — время на стенных часах, записанное как будто пояс
+    UTC: местный день — деление на DAY_SECONDS, час — остаток. Перевод
+    в UTC и обратно — bisect по списку переходов, без арифметики tz-aware
+    datetime. Несуществующее (весной) и повторяющееся (осенью) время
+    разрешается как в datetime с fold=0: по смещению до перехода."""
+
+    def __init__(self, zone: ZoneInfo, start: int, end: int):
+        self.zone = zone
+        self.name = zone.key
+        self.start = start
+        self.end = end
+        self.transitions = [start]  # С какого момента UTC действует offsets[i]
+        self.offsets = [self._offset(start)]
+        # Переходы бывают не чаще раза в сутки: шаг в день, внутри — двоичный поиск секунды
+        t = start
+        while t < end:
+            step = min(t + DAY_SECONDS, end)
+            if self._offset(step) != self.offsets[-1]:
+                lo, hi = t, step
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if self._offset(mid) == self.offsets[-1]:
+                        lo = mid
+                    else:
+                        hi = mid
+                self.transitions.append(hi)
+                self.offsets.append(self._offset(hi))
+            t = step
+
+    def _offset(self, ts: float) -> int:
+        return int(datetime.fromtimestamp(ts, self.zone).utcoffset().total_seconds())
+
+    def offset(self, ts: float) -> int:
+        """Смещение UTC в момент ts (секунды эпохи)"""
+        if not self.start <= ts < self.end:
+            return self._offset(ts)
+        return self.offsets[bisect.bisect_right(self.transitions, ts) - 1]
+
+    def local(self, ts: float) -> float:
+        """Секунды эпохи -> местные секунды"""
+        return ts + self.offset(ts)
+
+    def to_utc(self, local: float) -> float:
+        """Местные секунды -> секунды эпохи"""
+        if not self.start + DAY_SECONDS <= local < self.end - DAY_SECONDS:
+            return (EPOCH_NAIVE + timedelta(seconds=local)).replace(tzinfo=self.zone).timestamp()
+        # Смещение за сутки до и через сутки после: если одно и то же, перехода рядом нет
+        before = self.offset(local - DAY_SECONDS)
+        after = self.offset(local + DAY_SECONDS)
+        utc = local - before
+        if before == after:
+            return utc
+        change = self.transitions[bisect.bisect_right(self.transitions, local + DAY_SECONDS) - 1]
+        if utc < change:
+            return utc  # До перехода, осенний повтор — первое из двух
+        later = local - after
+        return later if later >= change else utc  # Весенний пропуск — сдвиг вперёд
+
+
+_zone_tables = {}
+
+
+def zone_table(name: str) -> ZoneTable:
+    """Таблица переходов пояса; строится при первом обращении. KeyError — нет такого пояса"""
+    table = _zone_tables.get(name)
+    if table is None:
+        try:
+            zone = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise KeyError(name) from None
+        table = ZoneTable(
+            zone,
+            int(BOT_START.timestamp()) - ZONE_TABLE_MARGIN,
+            int(BOT_END.timestamp()) + ZONE_TABLE_MARGIN,
+        )
+        _zone_tables[name] = table
+        _zone_tables[zone.key] = table
+    return table
+
+
+def parse_clock(text: str) -> int:
+    """'06:30' -> секунды от полуночи. ValueError, если это не время суток"""
+    hour, sep, minute = text.strip().partition(":")
+    if not sep or not hour.isdigit() or not minute.isdigit() or len(minute) != 2:
+        raise ValueError(text)
+    hour, minute = int(hour), int(minute)
+    if hour > 23 or minute > 59:
+        raise ValueError(text)
+    return hour * 3600 + minute * 60
+
+
+def format_clock(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+class UserSchedule:
+    """Пояс и время подъёма; один объект на всех с одинаковыми настройками"""
+
+    def __init__(self, zone: ZoneTable, weekday_wakeup: int, weekend_wakeup: int):
+        self.zone = zone
+        self.weekday_wakeup = weekday_wakeup
+        self.weekend_wakeup = weekend_wakeup
+
+    def wakeup(self, day: int) -> int:
+        """Подъём (местные секунды от полуночи) в местный день номер day от эпохи"""
+        return self.weekend_wakeup if (day + 3) % 7 >= 5 else self.weekday_wakeup  # 1.1.1970 — четверг
+
+
+_schedules = {}
+
+
+def schedule_defaults() -> tuple:
+    """(пояс, подъём в будни, подъём в выходные) из settings.json"""
+    settings = get_settings()
+    default_wakeup = format_clock(WAKEUP_HOUR * 3600 + WAKEUP_MINUTE * 60)
+    return (
+        settings.get("timezone") or TIMEZONE.key,
+        settings.get("weekday_wakeup") or default_wakeup,
+        settings.get("weekend_wakeup") or default_wakeup,
+    )
+
+
+def schedule_of(data) -> UserSchedule:
+    """Расписание пользователя; пустые поля — значения по умолчанию"""
+    key = (data.get("timezone"), data.get("weekday_wakeup"), data.get("weekend_wakeup"))
+    schedule = _schedules.get(key)
+    if schedule is None:
+        defaults = schedule_defaults()
+        values = [value or default for value, default in zip(key, defaults)]
+        try:
+            zone = zone_table(values[0])
+        except KeyError:
+            logger.warning(f"Неизвестный пояс {values[0]!r}, беру {defaults[0]}")
+            zone = zone_table(defaults[0])
+        wakeups = []
+        for value, default in zip(values[1:], defaults[1:]):
+            try:
+                wakeups.append(parse_clock(value))
+            except ValueError:
+                logger.warning(f"Некорректное время подъёма {value!r}, беру {default}")
+                wakeups.append(parse_clock(default))
+        schedule = UserSchedule(zone, *wakeups)
+        _schedules[key] = schedule
+    return schedule
+
+
+def user_now(data, now: datetime = None) -> datetime:
+    """Текущее (или данное) время на часах пользователя"""
+    return (now or now_msk()).astimezone(schedule_of(data).zone.zone)
+
+
+# ============== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==============
+def now_msk():
+    return CLOCK.now()
+
+
+def today_str(data):
+    """Сегодняшняя дата на часах пользователя"""
+    return user_now(data).strftime("%Y-%m-%d")
+
+
+def is_bot_active():
+    now = now_msk()
+    return BOT_START <= now < BOT_END
+
+
+def reset_daily_if_needed(data, current_date=None):
+    with PROFILER.phase("reset"):
+        current_date = current_date or today_str(data)
+        if data.get("current_date") != current_date:
+            data["current_date"] = current_date
+            data["morning_done"] = False
+            data["hunger_notified"] = False
+            data["last_dopamine_hour"] = None
+            data["goodnight_sent"] = False
+            data["summary_sent"] = False
+            save_data(data)
+        return data
+
+
+def get_hunger_hours(data) -> float:
+    """Сколько часов племя без еды"""
+    last_feed_str = data.get("last_feed_time")
+    if not last_feed_str:
+        return 0
+    
+    last_feed = datetime.fromisoformat(last_feed_str)
+    delta = now_msk() - last_feed
+    return delta.total_seconds() / 3600
+
+
+def get_hunger_mode(data, hours: float = None) -> str:
+    """Определить режим: good, bad, riot"""
+    with PROFILER.phase("hunger"):
+        if hours is None:
+            hours = get_hunger_hours(data)
+        if hours < HUNGER_WARNING_HOURS:
+            return "good"
+        elif hours < HUNGER_RIOT_HOURS:
+            return "bad"
+        else:
+            return "riot"
+
+
+# ============== КАРТИНКИ ==============
+class MediaRegistry:
+    """file_id картинок. Каждая картинка один раз ужимается до размера,
+    удобного Telegram, один раз загружается, дальше отправляется по file_id.
+    
+    file_id привязан к sha256 исходника, а не к mtime: свежий checkout
+    или сборка образа меняют mtime всех файлов, но не их содержимое.
+    Рядом с хешем лежат размер и mtime, при которых он считался: пока они
+    те же, файл заново не читается."""
+
+    def __init__(self, path: Path, assets: dict):
+        self.path = path
+        self.assets = assets
+        self.entries = None  # key -> {"file_id", "sha256", "size", "mtime_ns"}
+        self._upload_locks = {}
+
+    def _source(self, key: str) -> Path:
+        return ASSETS_DIR / self.assets[key]["file"]
+
+    def _fingerprint(self, key: str, known: dict = None):
+        """{"sha256", "size", "mtime_ns"} исходника; None — файла нет.
+        Хеш из known берётся без чтения файла, если размер и mtime совпали"""
+        source = self._source(key)
+        try:
+            st = source.stat()
+        except FileNotFoundError:
+            return None
+        if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+            return {"sha256": known["sha256"], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        digest = hashlib.sha256(source.read_bytes()).hexdigest()
+        return {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def load(self):
+        """Читает реестр; file_id из settings.json и animals.json берутся как стартовые"""
+        entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        settings = get_settings()
+        seeds = {"night": settings.get("night_image_file_id")}
+        for animal in read_catalog("animals") or []:
+            seeds[f"animal_{animal.get('level')}"] = animal.get("image_file_id")
+        touched = False
+        for key in self.assets:
+            entry = entries.get(key)
+            if not entry and not seeds.get(key):
+                continue  # Хеш посчитается при первой загрузке
+            fingerprint = self._fingerprint(key, entry)
+            if entry and entry.get("sha256") != (fingerprint or {}).get("sha256"):
+                logger.info(f"Картинка '{key}' изменилась, загружу заново")
+                entries.pop(key)
+            elif entry and fingerprint and fingerprint["mtime_ns"] != entry.get("mtime_ns"):
+                entry.update(fingerprint)  # Тот же файл с новым mtime: в следующий раз не хешировать
+                touched = True
+            if key not in entries and seeds.get(key):
+                entries[key] = dict(fingerprint or {}, file_id=seeds[key])
+        self.entries = entries
+        if touched:
+            self._save()
+
+    def _save(self):
+        ensure_data_dir()
+        atomic_write_json(self.path, self.entries)
+
+    def prepare(self, key: str):
+        """Сжатая копия картинки (делается один раз). None — исходника нет."""
+        source = self._source(key)
+        if not source.exists():
+            return None
+        target = MEDIA_DIR / f"{key}.jpg"
+        if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            return target
+        try:
+            from PIL import Image
+        except ImportError:
+            return source  # Без Pillow отправляем как есть
+        MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.tmp")
+        with Image.open(source) as image:
+            image = image.convert("RGB")
+            image.thumbnail((MEDIA_MAX_SIDE, MEDIA_MAX_SIDE))
+            image.save(tmp, "JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True)
+        os.replace(tmp, target)
+        logger.info(f"Картинка '{key}': {source.stat().st_size // 1024} КБ → {target.stat().st_size // 1024} КБ")
+        return target
+
+    def _upload_source(self, key: str):
+        path = self.prepare(key)
+        if path is not None:
+            return path.read_bytes()
+        url = self.assets[key].get("url")
+        if url:
+            return url
+        raise FileNotFoundError(f"Нет картинки '{key}'")
+
+    async def send(self, bot, chat_id, key: str, caption=None):
+        if self.entries is None:
+            await asyncio.to_thread(self.load)
+        entry = self.entries.get(key)
+        if entry:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=entry["file_id"], caption=caption)
+            except BadRequest as e:
+                if "file" not in str(e).lower():
+                    raise
+                logger.warning(f"file_id картинки '{key}' не принят, загружу заново: {e}")
+                if self.entries.get(key) is entry:
+                    del self.entries[key]
+        
+        # Первая отправка: загружает кто-то один, остальные ждут его file_id
+        lock = self._upload_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.entries.get(key)
+            if entry:
+                return await bot.send_photo(chat_id=chat_id, photo=entry["file_id"], caption=caption)
+            photo = await asyncio.to_thread(self._upload_source, key)
+            message = await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+            sizes = getattr(message, "photo", None)
+            if sizes:
+                fingerprint = await asyncio.to_thread(self._fingerprint, key)
+                self.entries[key] = dict(fingerprint or {}, file_id=sizes[-1].file_id)
+                await asyncio.to_thread(self._save)
+                logger.info(f"Картинка '{key}' загружена, file_id сохранён")
+            return message
+
+
+MEDIA = MediaRegistry(MEDIA_REGISTRY_FILE, MEDIA_ASSETS)
+
+
+# ============== ОЧЕРЕДЬ ОТПРАВКИ ==============
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill(self.clock())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        self._refill(self.clock())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class OutMessage:
+    __slots__ = ("chat_id", "method", "kwargs", "kind", "expires_at", "fallback", "attempts")
+
+    def __init__(self, chat_id, method, kwargs, kind=None, expires_at=None, fallback=None):
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.kind = kind
+        self.expires_at = expires_at
+        self.fallback = fallback
+        self.attempts = 0
+
+
+class Outbox:
+    """Очередь уведомлений таймера.
+    
+    Порядок внутри чата сохраняется, между сообщениями в чат — не меньше
+    chat_interval, на всех — не больше global_rate в секунду. Готовые
+    сообщения разных чатов уходят сразу, как освобождается место в окне
+    из max_in_flight запросов (не дожидаясь самого медленного в пачке),
+    RetryAfter и сетевые ошибки повторяются с паузой, устаревшие
+    и отменённые уведомления выбрасываются."""
+
+    def __init__(self, global_rate=GLOBAL_SEND_RATE, global_burst=GLOBAL_SEND_BURST,
+                 chat_interval=CHAT_SEND_INTERVAL, max_retries=SEND_MAX_RETRIES,
+                 retry_base=SEND_RETRY_BASE, clock=time.monotonic, max_in_flight=SEND_MAX_IN_FLIGHT):
+        self.bot = None
+        self.clock = clock
+        self.max_in_flight = max_in_flight
+        self._in_flight = set()  # Задачи отправки, ещё не завершившиеся
+        self.bucket = TokenBucket(global_rate, global_burst, clock)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._chats = {}       # chat_id -> deque[OutMessage]
+        self._ready = []       # куча (когда можно слать, seq, chat_id)
+        self._active = set()   # чаты в куче или в процессе отправки
+        self._last_sent = {}
+        self._seq = 0
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = None
+        self.sent = 0
+        self.dropped = 0
+        self.retried = 0
+
+    # --- постановка в очередь ---
+    def send_message(self, chat_id, text, kind=None, ttl=None, delay=0.0, **kwargs):
+        """delay — не раньше чем через столько секунд (если в чат уже есть очередь — после неё)"""
+        kwargs["text"] = text
+        self._submit(OutMessage(chat_id, "send_message", kwargs, kind, self._expiry(ttl)), delay)
+
+    def send_photo(self, chat_id, photo, caption=None, kind=None, ttl=None, fallback_text=None):
+        fallback = None
+        if fallback_text is not None:
+            fallback = OutMessage(chat_id, "send_message", {"text": fallback_text}, kind)
+        self._submit(OutMessage(
+            chat_id, "send_photo", {"photo": photo, "caption": caption}, kind, self._expiry(ttl), fallback
+        ))
+
+    def send_media(self, chat_id, key, caption=None, kind=None, ttl=None, fallback_text=None):
+        """Картинка из MEDIA_ASSETS: по file_id, а в первый раз — загрузкой"""
+        fallback = None
+        if fallback_text is not None:
+            fallback = OutMessage(chat_id, "send_message", {"text": fallback_text}, kind)
+        self._submit(OutMessage(
+            chat_id, "send_media", {"key": key, "caption": caption}, kind, self._expiry(ttl), fallback
+        ))
+
+    def send_live(self, chat_id, text):
+        """Живой статус: правка закреплённого сообщения (или создание, если его нет)"""
+        self._submit(OutMessage(chat_id, "send_live", {"text": text}, "live_status"))
+
+    def cancel(self, chat_id, kinds) -> int:
+        """Выбрасывает ещё не отправленные уведомления чата указанных видов"""
+        queue = self._chats.get(chat_id)
+        if not queue:
+            return 0
+        keep = deque(msg for msg in queue if msg.kind not in kinds)
+        removed = len(queue) - len(keep)
+        self._chats[chat_id] = keep
+        self._done(removed, dropped=True)
+        return removed
+
+    def _expiry(self, ttl):
+        return self.clock() + ttl if ttl is not None else None
+
+    def _submit(self, msg: OutMessage, delay: float = 0.0):
+        self._chats.setdefault(msg.chat_id, deque()).append(msg)
+        self._pending += 1
+        self._idle.clear()
+        if msg.chat_id not in self._active:
+            self._schedule_chat(msg.chat_id, delay=delay)
+        self._wakeup.set()
+
+    def _schedule_chat(self, chat_id, at=None, delay=0.0):
+        if at is None:
+            at = max(self.clock() + delay, self._last_sent.get(chat_id, 0.0) + self.chat_interval)
+        self._seq += 1
+        heapq.heappush(self._ready, (at, self._seq, chat_id))
+        self._active.add(chat_id)
+
+    def _done(self, count=1, dropped=False):
+        if dropped:
+            self.dropped += count
+        self._pending -= count
+        if self._pending <= 0:
+            self._pending = 0
+            self._idle.set()
+
+    # --- отправка ---
+    def _take_batch(self, limit: int) -> list:
+        now = self.clock()
+        batch = []
+        while self._ready and self._ready[0][0] <= now and len(batch) < limit:
+            _, _, chat_id = self._ready[0]
+            queue = self._chats.get(chat_id)
+            while queue and queue[0].expires_at is not None and queue[0].expires_at < now:
+                logger.info(f"Устаревшее уведомление ({queue[0].kind}) для {chat_id} пропущено")
+                SEND_TOTAL.inc(queue[0].kind, "expired")
+                queue.popleft()
+                self._done(dropped=True)
+            if not queue:
+                heapq.heappop(self._ready)
+                self._chats.pop(chat_id, None)
+                self._active.discard(chat_id)
+                continue
+            if not self.bucket.try_take():
+                break
+            heapq.heappop(self._ready)
+            batch.append(queue.popleft())
+        return batch
+
+    async def _deliver(self, msg: OutMessage):
+        chat_id = msg.chat_id
+        retry_at = None
+        started = time.perf_counter()
+        try:
+            with PROFILER.phase("send"):
+                if msg.method == "send_media":
+                    await MEDIA.send(self.bot, chat_id, **msg.kwargs)
+                elif msg.method == "send_live":
+                    await LIVE.deliver(self.bot, chat_id, **msg.kwargs)
+                else:
+                    await getattr(self.bot, msg.method)(chat_id=chat_id, **msg.kwargs)
+            self.sent += 1
+            SEND_TOTAL.inc(msg.kind, "sent")
+            self._done()
+        except RetryAfter as e:
+            SEND_TOTAL.inc(msg.kind, "flood_wait")
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            retry_at = self._retry(msg, retry_after)
+        except NetworkError as e:
+            if isinstance(e, BadRequest):  # BadRequest — подкласс NetworkError, но повтор не поможет
+                self._reject(msg, e)
+            else:
+                logger.warning(f"Сетевая ошибка отправки для {chat_id}: {e}")
+                SEND_TOTAL.inc(msg.kind, "network_error")
+                retry_at = self._retry(msg, self.retry_base * 2 ** msg.attempts)
+        except TelegramError as e:
+            self._reject(msg, e)
+        except Exception as e:
+            self._reject(msg, e)
+        finally:
+            SEND_SECONDS.observe(time.perf_counter() - started, msg.method)
+            self._last_sent[chat_id] = self.clock()
+            if self._chats.get(chat_id):
+                self._schedule_chat(chat_id, retry_at)
+            else:
+                self._chats.pop(chat_id, None)
+                self._active.discard(chat_id)
+
+    def _reject(self, msg: OutMessage, error: Exception):
+        """Ошибка, которую повтор не исправит: шлём запасной вариант или выбрасываем"""
+        logger.error(f"Ошибка отправки ({msg.method}) для {msg.chat_id}: {error}")
+        SEND_TOTAL.inc(msg.kind, "rejected")
+        if msg.fallback is not None:
+            self._chats.setdefault(msg.chat_id, deque()).appendleft(msg.fallback)
+            self._pending += 1
+        self._done(dropped=True)
+
+    def _retry(self, msg: OutMessage, delay: float):
+        msg.attempts += 1
+        if msg.attempts > self.max_retries:
+            logger.error(f"Не удалось отправить {msg.method} для {msg.chat_id} за {self.max_retries} попыток")
+            SEND_TOTAL.inc(msg.kind, "gave_up")
+            self._done(dropped=True)
+            return None
+        self.retried += 1
+        self._chats.setdefault(msg.chat_id, deque()).appendleft(msg)
+        return self.clock() + delay
+
+    def _delivered(self, task):
+        self._in_flight.discard(task)
+        self._wakeup.set()  # Освободилось место в окне
+
+    async def run(self):
+        while True:
+            free = self.max_in_flight - len(self._in_flight)
+            batch = self._take_batch(free) if free > 0 else []
+            for msg in batch:
+                task = asyncio.create_task(self._deliver(msg))
+                self._in_flight.add(task)
+                task.add_done_callback(self._delivered)
+            if batch:
+                continue
+            timeout = None
+            if self._ready and free > 0:
+                timeout = max(self._ready[0][0] - self.clock(), self.bucket.wait_time(), 0.001)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def drain(self, timeout=None):
+        """Дождаться, пока очередь опустеет"""
+        await asyncio.wait_for(self._idle.wait(), timeout)
+
+    async def stop(self, timeout=10):
+        try:
+            await self.drain(timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено уведомлений при остановке: {self._pending}")
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._in_flight:
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+
+OUTBOX = Outbox()
+
+
+# ============== ЖИВОЙ СТАТУС ==============
+STATUS_TEMPLATE = (
+    "📊 СТАТУС ДОБЫТЧИКА {emoji}\n\n"
+    "🍖 Без еды: {{hours:.1f}} ч.\n"
+    "{line}\n"
+    "🏆 Очки: сегодня {{score_day}}, за неделю {{score_week}}\n\n"
+    "Команды:\n"
+    "/done или 'сделал' — Принёс добычу (+12ч)\n"
+    "/tried или 'попробовал' — Попытался (+4ч)"
+)
+# В закрепе — моменты, а не тикающие часы: текст меняется только от команд,
+# смены режима и полуночи (очки за день), поэтому и правок мало
+LIVE_TEMPLATE = (
+    "📌 ПЛЕМЯ {emoji}\n"
+    "🍖 Кормили: {{fed}}\n"
+    "{line}\n"
+    "🏆 Сегодня {{score_day}}, за неделю {{score_week}}"
+)
+LIVE_TIME_FORMAT = "%d.%m %H:%M"
+# Режим -> (эмодзи, строка для /status, строка для закрепа);
+# left — часов до следующего режима (в бунте — сверх нормы), deadline — когда он наступит
+STATUS_MODES = {
+    "good": ("😊", "✅ Племя сыто\n⏳ До голода: {left:.1f} ч.", "✅ Сыто, голод с {deadline}"),
+    "bad": ("😟", "⚠️ Племя голодает!\n⏳ До бунта: {left:.1f} ч.", "⚠️ Голодает, бунт в {deadline}"),
+    "riot": ("😡", "🔥 БУНТ! Голод {left:.1f} ч. сверх нормы!", "🔥 БУНТ с {deadline}!"),
+}
+
+
+def compile_status_templates(template: str, line_index: int) -> dict:
+    """Один шаблон на режим, собранный заранее: при выводе остаётся один format"""
+    return {
+        mode: template.format(emoji=lines[0], line=lines[line_index]).format
+        for mode, lines in STATUS_MODES.items()
+    }
+
+
+STATUS_TEMPLATES = compile_status_templates(STATUS_TEMPLATE, 1)
+LIVE_TEMPLATES = compile_status_templates(LIVE_TEMPLATE, 2)
+
+
+def render_status(templates: dict, data, now: datetime) -> str:
+    hours = get_hunger_hours(data)
+    mode = get_hunger_mode(data, hours)
+    if mode == "good":
+        left = HUNGER_WARNING_HOURS - hours
+        limit = HUNGER_WARNING_HOURS
+    elif mode == "bad":
+        left = HUNGER_RIOT_HOURS - hours
+        limit = HUNGER_RIOT_HOURS
+    else:
+        left = hours - HUNGER_RIOT_HOURS
+        limit = HUNGER_RIOT_HOURS
+    fed = deadline = "—"
+    if data.get("last_feed_time"):
+        zone = schedule_of(data).zone.zone
+        last_feed = datetime.fromisoformat(data["last_feed_time"])  # Фиксированное смещение: сдвиг по UTC
+        fed = last_feed.astimezone(zone).strftime(LIVE_TIME_FORMAT)
+        deadline = (last_feed + timedelta(hours=limit)).astimezone(zone).strftime(LIVE_TIME_FORMAT)
+    score_day, score_week = current_scores(data, user_now(data, now))
+    return templates[mode](hours=hours, left=left, fed=fed, deadline=deadline,
+                           score_day=score_day, score_week=score_week)
+
+
+class LiveStatus:
+    """Закреплённое сообщение со статусом, одно на пользователя.
+    
+    Команды только помечают пользователя; раз в LIVE_STATUS_INTERVAL
+    помеченные пересчитываются (раз в refresh — все, у кого есть закреп),
+    и правка уходит через OUTBOX, только если текст изменился. Несколько
+    команд подряд дают одну правку."""
+
+    def __init__(self, refresh: float = LIVE_STATUS_REFRESH):
+        self.refresh = refresh
+        self.dirty = set()
+        self._last_sweep = None
+
+    def touch(self, user_id: int):
+        self.dirty.add(user_id)
+
+    def show(self, data, now: datetime) -> bool:
+        """Закрепа нет — создать сразу (True). Есть — только пометить: правка
+        уйдёт с ближайшим update вместе с остальными"""
+        if data.get("status_message_id"):
+            self.touch(data["user_id"])
+            return False
+        self.dirty.discard(data["user_id"])
+        OUTBOX.cancel(data["user_id"], ("live_status",))
+        OUTBOX.send_live(data["user_id"], render_status(LIVE_TEMPLATES, data, now))
+        return True
+
+    def _refresh(self, data, now: datetime) -> bool:
+        text = render_status(LIVE_TEMPLATES, data, now)
+        if text == data.get("status_text"):
+            LIVE_STATUS_TOTAL.inc("unchanged")
+            return False
+        OUTBOX.cancel(data["user_id"], ("live_status",))  # В очереди — только последняя версия
+        OUTBOX.send_live(data["user_id"], text)
+        LIVE_STATUS_TOTAL.inc("edit")
+        return True
+
+    def update(self, now: datetime) -> int:
+        """Пересчёт; возвращает число поставленных в очередь правок"""
+        ts = now.timestamp()
+        if self._last_sweep is None or ts - self._last_sweep >= self.refresh:
+            self._last_sweep = ts
+            user_ids = [uid for uid, data in STATE.users.items() if data.get("status_message_id")]
+        else:
+            user_ids = self.dirty
+        self.dirty = set()
+        queued = 0
+        for user_id in user_ids:
+            data = STATE.cached(user_id)
+            if data is not None and data.get("status_message_id"):
+                queued += self._refresh(data, now)
+        return queued
+
+    async def deliver(self, bot, chat_id: int, text: str):
+        """Из OUTBOX: правит закреп; если его удалили — создаёт и закрепляет новый"""
+        data = STATE.cached(chat_id)
+        if data is None:
+            return
+        message_id = data.get("status_message_id")
+        if message_id:
+            try:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+            except BadRequest as e:
+                error = str(e).lower()
+                if "not found" in error or "can't be edited" in error:
+                    logger.info(f"Закреп статуса {chat_id} пропал, создаю заново")
+                    message_id = None
+                elif "not modified" not in error:
+                    raise
+        if not message_id:
+            message = await bot.send_message(chat_id=chat_id, text=text, disable_notification=True)
+            data["status_message_id"] = message.message_id
+            record_event("pin", data, message.message_id)  # Иначе после сбоя появится второй закреп
+            try:
+                await bot.pin_chat_message(chat_id=chat_id, message_id=message.message_id,
+                                           disable_notification=True)
+            except BadRequest as e:
+                logger.warning(f"Не удалось закрепить статус для {chat_id}: {e}")
+        data["status_text"] = text
+        save_data(data)
+
+
+LIVE = LiveStatus()
+
+
+async def live_status_job(context: ContextTypes.DEFAULT_TYPE):
+    if is_bot_active():
+        LIVE.update(now_msk())
+
+
+# ============== ЧЕК-ИНЫ ==============
+_checkin_settings = None
+
+
+def checkin_settings() -> tuple:
+    """(интервал в секундах, конец дня в местных секундах от полуночи) из settings.json"""
+    global _checkin_settings
+    if _checkin_settings is None:
+        settings = get_settings()
+        interval = settings.get("checkin_interval_minutes")
+        if not isinstance(interval, (int, float)) or interval <= 0:
+            interval = CHECKIN_INTERVAL_MINUTES
+        try:
+            end = parse_clock(settings.get("workday_end") or CHECKIN_END)
+        except ValueError:
+            logger.warning(f"Некорректный workday_end, беру {CHECKIN_END}")
+            end = parse_clock(CHECKIN_END)
+        _checkin_settings = (interval * 60, end)
+    return _checkin_settings
+
+
+def checkin_interval(data, anchor: float) -> float:
+    """База × 2^checkin_backoff, ± CHECKIN_JITTER. Разброс — хеш пользователя и минуты,
+    а не random: восстановление из журнала даёт тот же момент"""
+    base, _ = checkin_settings()
+    mix = (data["user_id"] * 2654435761 + int(anchor // 60) * 40503) % 1024 / 1024
+    return base * 2 ** (data.get("checkin_backoff") or 0) * (1 + CHECKIN_JITTER * (2 * mix - 1))
+
+
+def plan_checkin(data, anchor: float):
+    """Следующий чек-ин — через интервал от anchor (секунды эпохи), с точностью до минуты"""
+    due = anchor + checkin_interval(data, anchor)
+    data["checkin_at"] = int(due // 60 * 60)
+
+
+def checkin_activity(data, ts: float):
+    """/done или /tried: пока добытчик отчитывается сам, чек-ины всё реже"""
+    data["checkin_backoff"] = min((data.get("checkin_backoff") or 0) + 1, CHECKIN_MAX_BACKOFF)
+    plan_checkin(data, ts)
+
+
+def checkin_sent(data, ts: float):
+    """Чек-ин ушёл: без ответа интервал возвращается к базовому"""
+    data["checkin_backoff"] = max((data.get("checkin_backoff") or 0) - 1, 0)
+    plan_checkin(data, ts)
+
+
+def checkin_slot(schedule: UserSchedule, ts: float) -> float:
+    """Первый момент не раньше ts, когда чек-ин можно отправить: с подъёма до конца дня"""
+    _, end = checkin_settings()
+    local = schedule.zone.local(ts)
+    day = int(local // DAY_SECONDS)
+    since_midnight = local - day * DAY_SECONDS
+    if since_midnight < schedule.wakeup(day):
+        return schedule.zone.to_utc(day * DAY_SECONDS + schedule.wakeup(day))
+    if since_midnight >= end:
+        return schedule.zone.to_utc((day + 1) * DAY_SECONDS + schedule.wakeup(day + 1))
+    return ts
+
+
+def send_checkin(user_id: int, data, mode: str):
+    """Голодному племени — пинок, сытому — похвала. Отправка — вразброс по минуте,
+    чтобы чек-ины всех, кому выпал этот тик, не уходили одной пачкой"""
+    checkin_sent(data, now_msk().timestamp())
+    save_data(data)
+    record_event("checkin", data)
+    phrase = get_phrase("checkin_motivation" if mode == "good" else "checkin_kick")
+    OUTBOX.send_message(user_id, f"👁 {phrase}", kind="checkin", ttl=CHECKIN_TTL,
+                        delay=random.random() * CHECKIN_SPREAD)
+
+
+# ============== ПЛАНИРОВЩИК СОБЫТИЙ ==============
+def next_due_time(data, since: float):
+    """Ближайший момент (секунды эпохи) не раньше since, когда таймеру есть что сделать.
+    None — для пользователя больше ничего не запланировано.
+    
+    Всё считается в секундах: местные часы пользователя — через таблицу
+    переходов его пояса, без tz-aware datetime."""
+    if since >= BOT_END.timestamp():
+        return None
+    if since < BOT_START.timestamp():
+        return BOT_START.timestamp()
+    schedule = schedule_of(data)
+    zone = schedule.zone
+    local = zone.local(since)
+    day = int(local // DAY_SECONDS)
+    day_start = day * DAY_SECONDS  # Местная полночь, местные секунды
+    
+    # После смены даты флаги будут сброшены в reset_daily_if_needed
+    current_date = data.get("current_date")
+    same_day = bool(current_date) and date.fromisoformat(current_date).toordinal() == day + EPOCH_ORDINAL
+    morning_done = same_day and data.get("morning_done")
+    hunger_notified = same_day and data.get("hunger_notified")
+    last_dopamine_hour = data.get("last_dopamine_hour") if same_day else None
+    goodnight_sent = same_day and data.get("goodnight_sent")
+    summary_sent = same_day and data.get("summary_sent")
+    
+    # Смена суток: сброс флагов (может снова понадобиться предупреждение о голоде)
+    midnight = zone.to_utc(day_start + DAY_SECONDS)
+    candidates = [BOT_END.timestamp(), midnight]
+    
+    # 1. Утреннее сообщение (или сразу, если уже пора)
+    if morning_done:
+        wakeup = zone.to_utc(day_start + DAY_SECONDS + schedule.wakeup(day + 1))
+    else:
+        wakeup = zone.to_utc(day_start + schedule.wakeup(day))
+    candidates.append(max(wakeup, since))
+    
+    # 2. Голод: 12ч — предупреждение, 24ч — бунт по :00/:30 местного времени
+    warn = None
+    last_feed_str = data.get("last_feed_time")
+    if last_feed_str:
+        last_feed = datetime.fromisoformat(last_feed_str).timestamp()
+        warn = last_feed + HUNGER_WARNING_HOURS * 3600
+        riot = last_feed + HUNGER_RIOT_HOURS * 3600
+        if since < warn:
+            candidates.append(warn)
+        elif since < riot and not hunger_notified:
+            candidates.append(since)
+        else:
+            start = zone.local(max(since, riot))
+            candidates.append(zone.to_utc(-(-start // 1800) * 1800))
+    
+    # 3. Дофамин в :55 местного времени, пока племя сыто
+    slot = (local - 55 * 60) // 3600 * 3600 + 55 * 60
+    if slot < local:
+        slot += 3600
+    for _ in range(24):
+        slot_utc = zone.to_utc(slot)
+        if warn is not None and slot_utc >= warn:
+            break
+        hour = int(slot % DAY_SECONDS // 3600)
+        if DOPAMINE_START_HOUR <= hour <= DOPAMINE_END_HOUR:
+            if not (slot // DAY_SECONDS == day and last_dopamine_hour == hour):
+                candidates.append(slot_utc)
+                break
+        slot += 3600
+    
+    # 4. Итог дня
+    if not summary_sent:
+        summary_hour, summary_minute = SCORES.summary_time()
+        summary = zone.to_utc(day_start + summary_hour * 3600 + summary_minute * 60)
+        if summary >= since:
+            candidates.append(summary)
+    
+    # 5. Пожелание сна в 23:00, если племя будет сыто
+    if not goodnight_sent:
+        goodnight = zone.to_utc(day_start + SLEEP_HOUR * 3600 + SLEEP_MINUTE * 60)
+        if goodnight >= since and (warn is None or goodnight < warn):
+            candidates.append(goodnight)
+    
+    # 6. Чек-ин: не раньше checkin_at и только днём (с подъёма до конца рабочего дня)
+    checkin_at = data.get("checkin_at")
+    if checkin_at is not None:
+        candidates.append(checkin_slot(schedule, max(checkin_at, since)))
+    
+    return min(candidates)
+
+
+class BaseScheduler(ABC):
+    """Общее для планировщиков: один run_once на ближайшее событие"""
+
+    def __init__(self):
+        self._job = None
+        self._job_due = None
+
+    @abstractmethod
+    def reschedule(self, data, since: datetime = None):
+        ...
+
+    @abstractmethod
+    def pop_due(self, now: datetime) -> list:
+        ...
+
+    @abstractmethod
+    def peek(self):
+        ...
+
+    def arm(self, job_queue):
+        """Заводит main_timer на ближайшее событие (если оно раньше уже заведённого)"""
+        due = self.peek()
+        if job_queue is None or due is None:
+            return
+        if self._job is not None:
+            if self._job_due <= due:
+                return
+            self._job.schedule_removal()
+        delay = max(0.0, due - now_msk().timestamp())
+        self._job = job_queue.run_once(main_timer, when=delay, name="main_timer")
+        self._job_due = due
+
+    def fired(self):
+        self._job = None
+        self._job_due = None
+
+
+class UserScheduler(BaseScheduler):
+    """Куча (время, user_id) ближайших событий; таймер спит до первого из них"""
+
+    def __init__(self):
+        super().__init__()
+        self._heap = []
+        self._due = {}  # user_id -> актуальное время события
+
+    def reschedule(self, data, since: datetime = None):
+        user_id = data["user_id"]
+        ts = next_due_time(data, (since or now_msk()).timestamp())
+        if ts is None:
+            self._due.pop(user_id, None)
+            return
+        if self._due.get(user_id) == ts:
+            return
+        self._due[user_id] = ts
+        heapq.heappush(self._heap, (ts, user_id))
+
+    def pop_due(self, now: datetime) -> list:
+        """Забирает всех пользователей, чьё событие уже наступило"""
+        now_ts = now.timestamp()
+        due_users = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            ts, user_id = heapq.heappop(self._heap)
+            if self._due.get(user_id) == ts:  # Устаревшие записи пропускаем
+                del self._due[user_id]
+                due_users.append(user_id)
+        return due_users
+
+    def peek(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+np = None  # numpy подгружается только для колоночного планировщика
 
 
-# ============== РАБОТА С ДАННЫМИ ==============
-def ensure_data_dir():
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+class HungerIndex(BaseScheduler):
+    """Колоночный индекс пользователей на массивах NumPy.
+    
+    Время кормления хранится в секундах эпохи, флаги — в типизированных
+    массивах. Время следующего события пересчитывается векторно и только
+    для строк, чьё состояние изменилось; тик — одно сравнение массива
+    со временем, поэтому его стоимость почти не зависит от числа пользователей.
+    Логика та же, что в next_due_time.
+    
+    Переходы смещений всех поясов лежат в одном отсортированном массиве
+    с ключом «номер пояса × _ZONE_SPAN + момент», поэтому местное время
+    для строк из любых поясов — один searchsorted на всех."""
 
+    _ZONE_SPAN = float(1 << 36)  # Больше любого момента в секундах эпохи
 
-def load_data():
-    default = {
-        "user_id": None,
-        "current_date": None,
-        "morning_done": False,
-        "last_feed_time": None,
-        "hunger_notified": False,  # Отправлено ли уведомление о режиме "Нехорошо"
-        "last_dopamine_hour": None,  # Последний час когда отправлен дофамин
-        "goodnight_sent": False,  # Отправлено ли пожелание сна сегодня
+    _COLUMNS = {
+        "user_ids": ("int64", 0),
+        "last_feed": ("float64", float("nan")),
+        "day": ("int32", -1),
+        "morning_done": ("bool", False),
+        "hunger_notified": ("bool", False),
+        "goodnight_sent": ("bool", False),
+        "summary_sent": ("bool", False),
+        "last_dopamine_hour": ("int8", -1),
+        "zone": ("int16", 0),
+        "weekday_wakeup": ("int32", 0),
+        "weekend_wakeup": ("int32", 0),
+        "checkin_at": ("float64", float("inf")),
+        "not_before": ("float64", 0.0),
+        "next_due": ("float64", float("inf")),
     }
-    try:
-        if DATA_FILE.exists():
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                for key, value in default.items():
-                    if key not in data:
-                        data[key] = value
-                return data
-        return default
-    except Exception as e:
-        logger.error(f"Ошибка загрузки данных: {e}")
-        return default
 
+    def __init__(self, capacity: int = 1024):
+        global np
+        import numpy as np
+        super().__init__()
+        self.rows = {}       # user_id -> номер строки
+        self.size = 0
+        self.capacity = capacity
+        for name, (dtype, fill) in self._COLUMNS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        self._stale = set()  # строки, для которых нужно пересчитать next_due
+        self.zones = {}      # ZoneTable -> номер пояса
+        self._zone_keys = self._zone_offsets = self._zone_changes = self._zone_first = None
 
-def save_data(data):
-    try:
-        ensure_data_dir()
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения: {e}")
-
-
-def load_phrases():
-    default = {
-        "hunter_morning": [
-            "Вставай, Добытчик. Племя ждёт.",
-            "Новый день. Новая охота.",
-            "Солнце встало. Пора на охоту."
-        ],
-        "tribe_fed": [
-            "Племя сыто. Ты — молодец.",
-            "Еда есть. Племя благодарит.",
-            "Добыча принята. Все сыты."
-        ],
-        "tribe_tried": [
-            "Попытка засчитана. +4 часа.",
-            "Не вышло, но ты пытался.",
-            "Племя видит твои усилия."
-        ],
-        "tribe_hungry_warning": [
-            "Племя голодает. Где еда?",
-            "12 часов без добычи. Неси еду!",
-            "Люди ждут. Охотник, действуй!"
-        ],
-        "tribe_riot": [
-            "БУНТ! Племя в ярости!",
-            "24 часа голода! Люди злятся!",
-            "Охотник провалился! БУНТ!"
-        ],
-        "dopamine_common": [
-            "☀️ Момент покоя. Ты справляешься.",
-            "🌿 Вдохни. Всё идёт как надо.",
-            "💪 Племя сыто. Ты — хороший добытчик."
-        ],
-        "dopamine_rare": [
-            "🌟 Редкая удача! Найден мёд диких пчёл!",
-            "🎯 Твой бросок точен. Племя гордится.",
-            "🔥 Огонь горит ярко. Всё хорошо."
-        ],
-        "dopamine_legendary": [
-            "⚡ ЛЕГЕНДА! Духи предков улыбаются тебе!",
-            "🏆 Великий охотник! Песни сложат о тебе!",
-            "✨ Невероятно! Такое бывает раз в жизни!"
-        ],
-        "goodnight": [
-            "Спокойной ночи, охотник."
-        ],
-        "bot_end": [
-            "Сезон охоты окончен. Пора делать нового бота."
-        ]
-    }
-    try:
-        if PHRASES_FILE.exists():
-            with open(PHRASES_FILE, "r", encoding="utf-8") as f:
-                phrases = json.load(f)
-                for key, value in default.items():
-                    if key not in phrases:
-                        phrases[key] = value
-                return phrases
-        ensure_data_dir()
-        with open(PHRASES_FILE, "w", encoding="utf-8") as f:
-            json.dump(default, f, ensure_ascii=False, indent=2)
-        return default
-    except Exception as e:
-        logger.error(f"Ошибка загрузки фраз: {e}")
-        return default
+    def _row(self, user_id: int) -> int:
+        row = self.rows.get(user_id)
+        if row is None:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.rows[user_id] = row
+            self.user_ids[row] = user_id
+        return row
 
+    def _grow(self):
+        old = self.capacity
+        self.capacity *= 2
+        for name, (dtype, fill) in self._COLUMNS.items():
+            column = np.full(self.capacity, fill, dtype=dtype)
+            column[:old] = getattr(self, name)
+            setattr(self, name, column)
 
-def get_phrase(category: str) -> str:
-    phrases = load_phrases()
-    if category in phrases and phrases[category]:
-        return random.choice(phrases[category])
-    return "..."
+    def reschedule(self, data, since: datetime = None):
+        row = self._row(data["user_id"])
+        last_feed = data.get("last_feed_time")
+        current_date = data.get("current_date")
+        last_dopamine_hour = data.get("last_dopamine_hour")
+        self.last_feed[row] = datetime.fromisoformat(last_feed).timestamp() if last_feed else np.nan
+        self.day[row] = datetime.strptime(current_date, "%Y-%m-%d").toordinal() if current_date else -1
+        self.morning_done[row] = bool(data.get("morning_done"))
+        self.hunger_notified[row] = bool(data.get("hunger_notified"))
+        self.goodnight_sent[row] = bool(data.get("goodnight_sent"))
+        self.summary_sent[row] = bool(data.get("summary_sent"))
+        self.last_dopamine_hour[row] = -1 if last_dopamine_hour is None else last_dopamine_hour
+        schedule = schedule_of(data)
+        self.zone[row] = self._zone_id(schedule.zone)
+        self.weekday_wakeup[row] = schedule.weekday_wakeup
+        self.weekend_wakeup[row] = schedule.weekend_wakeup
+        checkin_at = data.get("checkin_at")
+        self.checkin_at[row] = np.inf if checkin_at is None else checkin_at
+        self.not_before[row] = (since or now_msk()).timestamp()
+        self._stale.add(row)
 
+    def _refresh(self, now_ts: float):
+        if self._stale:
+            rows = np.fromiter(self._stale, dtype=np.int64, count=len(self._stale))
+            self.next_due[rows] = self._compute(rows, now_ts)
+            self._stale.clear()
 
-def get_dopamine_phrase() -> str:
-    """Получить дофаминовую фразу с учётом редкости"""
-    phrases = load_phrases()
-    roll = random.randint(1, 100)
-    
-    # 70% - обычные, 25% - редкие, 5% - легендарные
-    if roll <= 70:
-        category = "dopamine_common"
-    elif roll <= 95:
-        category = "dopamine_rare"
-    else:
-        category = "dopamine_legendary"
-    
-    if category in phrases and phrases[category]:
-        return random.choice(phrases[category])
-    return "☀️ Хороший момент."
+    def _zone_id(self, table: ZoneTable) -> int:
+        zone_id = self.zones.get(table)
+        if zone_id is None:
+            zone_id = self.zones[table] = len(self.zones)
+            keys, offsets, changes, first = [], [], [], []
+            for zone_table, base in sorted(self.zones.items(), key=lambda item: item[1]):
+                first.append(len(keys))
+                keys += [base * self._ZONE_SPAN + ts for ts in zone_table.transitions]
+                offsets += zone_table.offsets
+                changes += zone_table.transitions
+            self._zone_keys = np.array(keys)
+            self._zone_offsets = np.array(offsets, dtype=np.float64)
+            self._zone_changes = np.array(changes, dtype=np.float64)
+            self._zone_first = np.array(first)
+        return zone_id
 
+    def _transition(self, zones, ts):
+        """Номер действующего в момент ts перехода (в общем массиве) для каждой строки"""
+        index = np.searchsorted(self._zone_keys, zones * self._ZONE_SPAN + ts, side="right") - 1
+        return np.maximum(index, self._zone_first[zones])
 
-# ============== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==============
-def now_msk():
-    return datetime.now(TIMEZONE)
+    def _local(self, zones, ts):
+        return ts + self._zone_offsets[self._transition(zones, ts)]
 
+    def _to_utc(self, zones, local):
+        """Векторная ZoneTable.to_utc; вне таблиц — смещение ближайшего края"""
+        before = self._zone_offsets[self._transition(zones, local - DAY_SECONDS)]
+        index = self._transition(zones, local + DAY_SECONDS)
+        after = self._zone_offsets[index]
+        change = self._zone_changes[index]
+        utc = local - before
+        later = local - after
+        return np.where((before == after) | (utc < change) | (later < change), utc, later)
 
-def today_str():
-    return now_msk().strftime("%Y-%m-%d")
+    def _compute(self, rows, now_ts: float):
+        """Векторная версия next_due_time для выбранных строк (секунды эпохи)"""
+        zones = self.zone[rows].astype(np.int64)
+        since = np.maximum(now_ts, self.not_before[rows])
+        local = self._local(zones, since)
+        day = np.floor(local / DAY_SECONDS)
+        day_start = day * DAY_SECONDS  # Местная полночь, местные секунды
+        
+        same_day = self.day[rows] == day + EPOCH_ORDINAL
+        morning_done = same_day & self.morning_done[rows]
+        hunger_notified = same_day & self.hunger_notified[rows]
+        goodnight_sent = same_day & self.goodnight_sent[rows]
+        summary_sent = same_day & self.summary_sent[rows]
+        last_dopamine_hour = np.where(same_day, self.last_dopamine_hour[rows], -1)
+        
+        # Смена суток и утреннее сообщение (в выходные — своё время подъёма)
+        midnight = self._to_utc(zones, day_start + DAY_SECONDS)
+        weekday_wakeup = self.weekday_wakeup[rows]
+        weekend_wakeup = self.weekend_wakeup[rows]
+        wakeup_day = np.where(morning_done, day + 1, day)
+        wakeup = np.where((wakeup_day + 3) % 7 >= 5, weekend_wakeup, weekday_wakeup)
+        wakeup = np.maximum(self._to_utc(zones, wakeup_day * DAY_SECONDS + wakeup), since)
+        
+        # Голод: 12ч — предупреждение, 24ч — бунт по :00/:30 местного времени
+        feed = self.last_feed[rows]
+        has_feed = ~np.isnan(feed)
+        warn = np.where(has_feed, feed + HUNGER_WARNING_HOURS * 3600, np.inf)
+        riot = np.where(has_feed, feed + HUNGER_RIOT_HOURS * 3600, np.inf)
+        riot_start = np.maximum(since, riot)
+        riot_slot = self._to_utc(zones, np.ceil(self._local(zones, riot_start) / 1800) * 1800)
+        hunger = np.where(
+            since < warn, warn, np.where((since < riot) & ~hunger_notified, since, riot_slot)
+        )
+        
+        # Дофамин: первый слот :55 в разрешённые часы, пока племя сыто
+        first = np.floor((local - 55 * 60) / 3600) * 3600 + 55 * 60
+        first = np.where(first < local, first + 3600, first)
+        slots = first[None, :] + np.arange(24)[:, None] * 3600.0  # Местное время
+        slots_utc = self._to_utc(np.broadcast_to(zones, slots.shape), slots)
+        hours = (slots % DAY_SECONDS) // 3600
+        allowed = (
+            (slots_utc < warn)
+            & (hours >= DOPAMINE_START_HOUR)
+            & (hours <= DOPAMINE_END_HOUR)
+            & ~((np.floor(slots / DAY_SECONDS) == day) & (hours == last_dopamine_hour))
+        )
+        dopamine = np.where(
+            allowed.any(axis=0), slots_utc[allowed.argmax(axis=0), np.arange(len(rows))], np.inf
+        )
+        
+        # Пожелание сна, если племя будет сыто
+        goodnight = self._to_utc(zones, day_start + SLEEP_HOUR * 3600 + SLEEP_MINUTE * 60)
+        goodnight = np.where(
+            ~goodnight_sent & (goodnight >= since) & (goodnight < warn), goodnight, np.inf
+        )
+        
+        # Итог дня
+        summary_hour, summary_minute = SCORES.summary_time()
+        summary = self._to_utc(zones, day_start + summary_hour * 3600 + summary_minute * 60)
+        summary = np.where(~summary_sent & (summary >= since), summary, np.inf)
+        
+        # Чек-ин: не раньше checkin_at, вне дня — к следующему подъёму
+        _, checkin_end = checkin_settings()
+        checkin_at = self.checkin_at[rows]
+        planned = np.isfinite(checkin_at)
+        checkin = np.where(planned, np.maximum(checkin_at, since), since)
+        checkin_local = self._local(zones, checkin)
+        checkin_day = np.floor(checkin_local / DAY_SECONDS)
+        since_midnight = checkin_local - checkin_day * DAY_SECONDS
+        today = np.where((checkin_day + 3) % 7 >= 5, weekend_wakeup, weekday_wakeup)
+        tomorrow = np.where((checkin_day + 4) % 7 >= 5, weekend_wakeup, weekday_wakeup)
+        checkin = np.where(
+            since_midnight < today,
+            self._to_utc(zones, checkin_day * DAY_SECONDS + today),
+            np.where(
+                since_midnight >= checkin_end,
+                self._to_utc(zones, (checkin_day + 1) * DAY_SECONDS + tomorrow),
+                checkin,
+            ),
+        )
+        checkin = np.where(planned, checkin, np.inf)
+        
+        due = np.minimum.reduce([
+            np.full(len(rows), BOT_END.timestamp()), midnight, wakeup, hunger, dopamine, summary, goodnight,
+            checkin,
+        ])
+        due = np.where(since < BOT_START.timestamp(), BOT_START.timestamp(), due)
+        return np.where(since >= BOT_END.timestamp(), np.inf, due)
 
+    def pop_due(self, now: datetime) -> list:
+        now_ts = now.timestamp()
+        self._refresh(now_ts)
+        rows = np.flatnonzero(self.next_due[:self.size] <= now_ts)
+        self.next_due[rows] = np.inf
+        return self.user_ids[rows].tolist()
 
-def is_bot_active():
-    now = now_msk()
-    return BOT_START <= now < BOT_END
+    def peek(self):
+        if not self.size:
+            return None
+        self._refresh(now_msk().timestamp())
+        due = float(self.next_due[:self.size].min())
+        return None if due == float("inf") else due
 
 
-def reset_daily_if_needed(data):
-    current_date = today_str()
-    if data.get("current_date") != current_date:
-        data["current_date"] = current_date
-        data["morning_done"] = False
-        data["hunger_notified"] = False
-        data["last_dopamine_hour"] = None
-        data["goodnight_sent"] = False
-        save_data(data)
-    return data
+def make_scheduler() -> BaseScheduler:
+    if SCHEDULER_MODE == "columnar":
+        return HungerIndex()
+    return UserScheduler()
 
 
-def get_hunger_hours(data) -> float:
-    """Сколько часов племя без еды"""
-    last_feed_str = data.get("last_feed_time")
-    if not last_feed_str:
-        return 0
-    
-    last_feed = datetime.fromisoformat(last_feed_str)
-    delta = now_msk() - last_feed
-    return delta.total_seconds() / 3600
+SCHEDULER = make_scheduler()
 
 
-def get_hunger_mode(data) -> str:
-    """Определить режим: good, bad, riot"""
-    hours = get_hunger_hours(data)
-    if hours < HUNGER_WARNING_HOURS:
-        return "good"
-    elif hours < HUNGER_RIOT_HOURS:
-        return "bad"
-    else:
-        return "riot"
+def reschedule_user(context: ContextTypes.DEFAULT_TYPE, data):
+    """Пересчитать событие пользователя после изменения его состояния"""
+    SCHEDULER.reschedule(data)
+    SCHEDULER.arm(context.job_queue)
 
 
 # ============== ГЛАВНЫЙ ТАЙМЕР ==============
+@profiled("timer")
 async def main_timer(context: ContextTypes.DEFAULT_TYPE):
-    """Срабатывает каждую минуту"""
+    """Обрабатывает наступившие события и засыпает до следующего"""
+    started = time.perf_counter()
+    SCHEDULER.fired()
+    now = now_msk()
+    with PROFILER.phase("schedule"):
+        due_users = SCHEDULER.pop_due(now)
+    TICK_USERS.inc(amount=len(due_users))
+    
     if not is_bot_active():
-        await check_bot_end(context)
+        check_bot_end()
+        SCHEDULER.arm(context.job_queue)
+        TICK_SECONDS.observe(time.perf_counter() - started)
         return
     
-    data = load_data()
-    user_id = data.get("user_id")
-    if not user_id:
-        logger.info("⏰ Таймер: нет user_id")
-        return
+    # Проверки идут поминутно, поэтому следующее событие — не раньше следующей минуты
+    since = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    for user_id in due_users:
+        async with user_lock(user_id):
+            try:
+                data = await process_user(context, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка таймера для {user_id}: {e}")
+                data = await aload_data(user_id)
+            with PROFILER.phase("schedule"):
+                SCHEDULER.reschedule(data, since)
     
-    data = reset_daily_if_needed(data)
-    now = now_msk()
+    await flush_state()
+    SCHEDULER.arm(context.job_queue)
+    elapsed = time.perf_counter() - started
+    TICK_SECONDS.observe(elapsed)
+    logger.debug(f"Тик {now:%H:%M}: пользователей {len(due_users)}, {elapsed * 1e3:.1f} мс")
+
+
+async def process_user(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Проверки таймера для одного добытчика (под user_lock)"""
+    data = await aload_data(user_id)
+    schedule = schedule_of(data)
+    now = user_now(data)  # Все проверки — по часам пользователя
+    data = reset_daily_if_needed(data, now.strftime("%Y-%m-%d"))
     current_hour = now.hour
     current_minute = now.minute
     
-    logger.info(f"⏰ Таймер сработал: {current_hour}:{current_minute:02d} МСК")
+    logger.debug(f"⏰ Таймер сработал: {current_hour}:{current_minute:02d} ({schedule.zone.name})")
     
-    # 1. Утреннее сообщение (после 5:30)
-    if current_hour >= WAKEUP_HOUR:
-        if current_hour == WAKEUP_HOUR and current_minute < WAKEUP_MINUTE:
-            pass  # Ещё рано
-        elif not data.get("morning_done"):
-            logger.info("📨 Отправляю утренние задачи")
-            await send_morning_tasks(context, user_id, data)
-            data = load_data()  # Перезагружаем
+    # 1. Утреннее сообщение (после подъёма: в будни и выходные — своё время)
+    wakeup = schedule.wakeup(now.toordinal() - EPOCH_ORDINAL)
+    if current_hour * 3600 + current_minute * 60 >= wakeup and not data.get("morning_done"):
+        logger.info("📨 Отправляю утренние задачи")
+        await send_morning_tasks(context, user_id, data, now)
     
     # 2. Проверка голода
     mode = get_hunger_mode(data)
-    logger.info(f"🍖 Режим голода: {mode}")
+    logger.debug(f"🍖 Режим голода: {mode}")
     
     if mode == "bad":
         # Режим "Нехорошо" — одно уведомление
@@ -277,21 +3317,17 @@ async def main_timer(context: ContextTypes.DEFAULT_TYPE):
             logger.info("⚠️ Отправляю предупреждение о голоде")
             data["hunger_notified"] = True
             save_data(data)
+            record_event("warning", data)
             phrase = get_phrase("tribe_hungry_warning")
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"🍖⚠️ {phrase}"
-            )
+            OUTBOX.send_message(user_id, f"🍖⚠️ {phrase}", kind="hunger")
     
     elif mode == "riot":
         # Режим "Бунт" — каждые 30 минут
         if current_minute in [0, 30]:
             logger.info("🔥 Отправляю сообщение о бунте")
+            record_event("riot", data)
             phrase = get_phrase("tribe_riot")
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"🔥🔥🔥 {phrase}"
-            )
+            OUTBOX.send_message(user_id, f"🔥🔥🔥 {phrase}", kind="hunger", ttl=RIOT_TTL)
     
     elif mode == "good":
         # Режим "Хорошо" — сбрасываем флаг уведомления
@@ -300,51 +3336,67 @@ async def main_timer(context: ContextTypes.DEFAULT_TYPE):
             save_data(data)
         
         # Дофаминовый подарок в :55 (с 6:55 до 22:55)
-        logger.info(f"🎁 Проверка дофамина: минута={current_minute}, час={current_hour}, last_dopamine_hour={data.get('last_dopamine_hour')}")
+        logger.debug(f"🎁 Проверка дофамина: минута={current_minute}, час={current_hour}, last_dopamine_hour={data.get('last_dopamine_hour')}")
         if current_minute == 55:
-            logger.info(f"🎁 Минута 55! Проверяю диапазон часов: {DOPAMINE_START_HOUR} <= {current_hour} <= {DOPAMINE_END_HOUR}")
+            logger.debug(f"🎁 Минута 55! Проверяю диапазон часов: {DOPAMINE_START_HOUR} <= {current_hour} <= {DOPAMINE_END_HOUR}")
             if DOPAMINE_START_HOUR <= current_hour <= DOPAMINE_END_HOUR:
-                logger.info(f"🎁 Час подходит! Проверяю last_dopamine_hour: {data.get('last_dopamine_hour')} != {current_hour}")
+                logger.debug(f"🎁 Час подходит! Проверяю last_dopamine_hour: {data.get('last_dopamine_hour')} != {current_hour}")
                 if data.get("last_dopamine_hour") != current_hour:
                     logger.info("🎁✅ ОТПРАВЛЯЮ ДОФАМИНОВУЮ НАГРАДУ!")
                     data["last_dopamine_hour"] = current_hour
                     save_data(data)
+                    record_event("dopamine", data, current_hour)
                     phrase = get_dopamine_phrase()
-                    await context.bot.send_message(chat_id=user_id, text=phrase)
+                    OUTBOX.send_message(user_id, phrase, kind="dopamine", ttl=DOPAMINE_TTL)
                 else:
-                    logger.info(f"🎁❌ Уже отправлял в этом часу (last={data.get('last_dopamine_hour')})")
+                    logger.debug(f"🎁❌ Уже отправлял в этом часу (last={data.get('last_dopamine_hour')})")
             else:
-                logger.info(f"🎁❌ Час не подходит для дофамина")
+                logger.debug(f"🎁❌ Час не подходит для дофамина")
         else:
-            logger.info(f"🎁 Не 55 минута, пропускаю")
+            logger.debug(f"🎁 Не 55 минута, пропускаю")
+    
+    # 3. Итог дня: добыча и награда (score_summary_time, до пожелания сна)
+    if (current_hour, current_minute) == SCORES.summary_time() and not data.get("summary_sent"):
+        logger.info("🏕 Отправляю итог дня")
+        data["summary_sent"] = True
+        save_data(data)
+        send_summary(user_id, data, now)
     
-    # 3. Пожелание сна (23:00, только в режиме "Хорошо")
+    # 4. Пожелание сна (23:00, только в режиме "Хорошо")
     if current_hour == SLEEP_HOUR and current_minute == 0:
         if not data.get("goodnight_sent") and mode == "good":
             logger.info("🌙 Отправляю пожелание сна")
             data["goodnight_sent"] = True
             save_data(data)
+            record_event("goodnight", data)
             await send_goodnight(context, user_id)
+    
+    # 5. Чек-ин: когда подошёл его срок, с подъёма до конца рабочего дня
+    checkin_at = data.get("checkin_at")
+    if checkin_at is not None and now.timestamp() >= checkin_at:
+        _, checkin_end = checkin_settings()
+        if wakeup <= current_hour * 3600 + current_minute * 60 < checkin_end:
+            logger.debug(f"👁 Чек-ин ({mode})")
+            send_checkin(user_id, data, mode)
+    
+    return data
 
 
 # ============== УТРЕННЕЕ СООБЩЕНИЕ ==============
-async def send_morning_tasks(context: ContextTypes.DEFAULT_TYPE, user_id: int, data: dict):
+async def send_morning_tasks(context: ContextTypes.DEFAULT_TYPE, user_id: int, data: dict, now: datetime):
+    """now — время на часах пользователя: от него зависит, будни сегодня или выходной"""
     data["morning_done"] = True
     
     # Если первый запуск — устанавливаем время кормления
     if not data.get("last_feed_time"):
         data["last_feed_time"] = now_msk().isoformat()
     
+    plan_checkin(data, now.timestamp())  # Первый чек-ин дня — через интервал после подъёма
     save_data(data)
+    record_event("morning", data)
     
-    # Генерируем 4 шифра: 2G, 1P, 1M
-    g1 = f"G{random.randint(1, 20)}"
-    g2 = f"G{random.randint(21, 40)}"
-    p1 = f"P{random.randint(1, 20)}"
-    m1 = f"M{random.randint(1, 20)}"
-    
-    tasks_list = [g1, g2, p1, m1]
-    random.shuffle(tasks_list)
+    task_ids = TASKS.draw_daily(data, weekend=now.weekday() >= 5)
+    save_data(data)
     
     phrase = get_phrase("hunter_morning")
     hours = get_hunger_hours(data)
@@ -352,40 +3404,65 @@ async def send_morning_tasks(context: ContextTypes.DEFAULT_TYPE, user_id: int, d
     
     text = f"☀️ {phrase}\n\n"
     text += f"🏹 Твои цели на сегодня:\n"
-    for task in tasks_list:
-        text += f"• `{task}`\n"
+    for task_id in task_ids:
+        task_text = escape_markdown(TASKS.tasks[task_id]["text"], version=1)
+        text += f"• `{TASKS.code(task_id)}` {task_text}\n"
+    if not task_ids:
+        text += "• Свободная охота — цель выбирай сам\n"
+    text += f"\nЗакрыть цель: /done шифр"
     text += f"\n⏳ До голода: {time_left:.1f} ч."
     
-    await context.bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown")
+    OUTBOX.send_message(user_id, text, kind="morning", parse_mode="Markdown")
     logger.info("Утренние задачи выданы")
 
 
+# ============== ИТОГ ДНЯ ==============
+def send_summary(user_id: int, data, now: datetime):
+    """Зверь и награда по очкам дня — из уже накопленных итогов"""
+    day, week = current_scores(data, now)
+    record_event("summary", data, day)
+    text = f"🏕 Итог дня: {day} ч. сытости (за неделю: {week})\n\n"
+    animal = SCORES.animal(day)
+    if animal is None:
+        text += "Сегодня без добычи. Племя ложится спать голодным."
+        OUTBOX.send_message(user_id, text, kind="summary")
+        return
+    text += f"🏹 Добыча: {animal['name']}\n{animal['description']}\n\n«{animal['verdict']}»"
+    reward = SCORES.pick_reward(data, SCORES.tier(day))
+    if reward:
+        text += f"\n\n🎁 Награда: {reward}"
+    OUTBOX.send_media(user_id, f"animal_{animal['level']}", caption=text, kind="summary", fallback_text=text)
+
+
 # ============== ПОЖЕЛАНИЕ СНА ==============
 async def send_goodnight(context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    try:
-        await context.bot.send_photo(
-            chat_id=user_id,
-            photo=NIGHT_IMAGE,
-            caption="🌙 " + get_phrase("goodnight")
-        )
-    except Exception as e:
-        logger.error(f"Ошибка отправки картинки: {e}")
-        await context.bot.send_message(
-            chat_id=user_id,
-            text="🌙 " + get_phrase("goodnight")
-        )
-    logger.info("Пожелание сна отправлено")
+    # Если картинка не отправится — очередь пошлёт текст
+    OUTBOX.send_media(
+        user_id,
+        "night",
+        caption="🌙 " + get_phrase("goodnight"),
+        kind="goodnight",
+        fallback_text="🌙 " + get_phrase("goodnight"),
+    )
+    logger.info("Пожелание сна поставлено в очередь")
 
 
 # ============== КОМАНДЫ ==============
+@instrumented
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    data = load_data()
-    data["user_id"] = user_id
-    data["current_date"] = today_str()
-    if not data.get("last_feed_time"):
-        data["last_feed_time"] = now_msk().isoformat()
-    save_data(data)
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        data["current_date"] = today_str(data)
+        if not data.get("last_feed_time"):
+            data["last_feed_time"] = now_msk().isoformat()
+        if data.get("checkin_at") is None:
+            plan_checkin(data, now_msk().timestamp())
+        save_data(data)
+        record_event("start", data)
+        reschedule_user(context, data)
+        if LIVE_STATUS and is_bot_active():
+            LIVE.show(data, now_msk())
     
     if not is_bot_active():
         if now_msk() >= BOT_END:
@@ -402,58 +3479,90 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Твоя задача: кормить племя.\n\n"
         f"Команды:\n"
         f"/done или напиши 'сделал' — Принёс добычу (+12ч)\n"
+        f"/done G12 — Закрыть цель из утреннего списка\n"
         f"/tried или напиши 'попробовал' — Попытался, отложил (+4ч)\n"
-        f"/status — Проверить статус\n\n"
+        f"/status — Проверить статус\n"
+        f"/timezone, /wakeup — Свой часовой пояс и время подъёма\n\n"
         f"⏳ До голода: {time_left:.1f} ч.\n\n"
         f"Бот работает до 14.02.2026"
     )
 
 
+@instrumented
 async def cmd_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Сделал дело — +12 часов сытости"""
+    """Сделал дело — +12 часов сытости. /done G12 заодно закрывает цель"""
     if not is_bot_active():
         await update.message.reply_text("Бот неактивен.")
         return
     
-    data = load_data()
+    task = None
+    args = getattr(context, "args", None)
+    if args:
+        task = TASKS.find(args[0])
+        if task is None:
+            await update.message.reply_text(f"Не знаю цели «{args[0]}». Шифр — как в утреннем списке, например G12.")
+            return
     
-    # Добавляем 12 часов к текущему времени
-    data["last_feed_time"] = now_msk().isoformat()
-    data["hunger_notified"] = False
-    save_data(data)
+    user_id = update.effective_user.id
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        
+        # Добавляем 12 часов к текущему времени
+        feed_time = now_msk()
+        data["last_feed_time"] = feed_time.isoformat()
+        data["hunger_notified"] = False
+        record_event("done", data, feed_time.timestamp())
+        add_score(data, DONE_POINTS, user_now(data, feed_time))
+        checkin_activity(data, feed_time.timestamp())
+        task_closed = task is not None and TASKS.mark_done(data, task)
+        if task_closed:
+            record_event("task_done", data, task["id"])
+        save_data(data)
+        reschedule_user(context, data)
+        OUTBOX.cancel(user_id, ("hunger", "checkin"))  # Бунт и чек-ин уже неактуальны
+        LIVE.touch(user_id)
     
     phrase = get_phrase("tribe_fed")
+    text = f"✅ {phrase}\n\n"
+    if task_closed:
+        text += f"🎯 Цель {TASKS.code(task['id'])} закрыта: {task['text']}\n"
+    text += f"🍖 +12 часов сытости\n⏳ До голода: 12.0 ч."
     
-    await update.message.reply_text(
-        f"✅ {phrase}\n\n"
-        f"🍖 +12 часов сытости\n"
-        f"⏳ До голода: 12.0 ч."
-    )
+    await update.message.reply_text(text)
 
 
+@instrumented
 async def cmd_tried(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Попробовал, но отложил — +4 часа сытости"""
     if not is_bot_active():
         await update.message.reply_text("Бот неактивен.")
         return
     
-    data = load_data()
-    
-    # ПРАВИЛЬНАЯ ЛОГИКА: уменьшаем текущий голод на 4 часа
-    # Если племя было голодно 2 часа, после /tried будет "голодно" -2 часа (т.е. в кредите!)
-    current_hunger_hours = get_hunger_hours(data)
-    new_hunger_hours = current_hunger_hours - 4  # Может быть отрицательным!
-    
-    # Устанавливаем время последнего кормления
-    # Если new_hunger_hours отрицательный, то last_feed_time окажется в будущем (кредит)
-    new_feed_time = now_msk() - timedelta(hours=new_hunger_hours)
-    
-    data["last_feed_time"] = new_feed_time.isoformat()
-    data["hunger_notified"] = False
-    save_data(data)
-    
-    # Пересчитываем после сохранения
-    hours = get_hunger_hours(data)
+    user_id = update.effective_user.id
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        
+        # ПРАВИЛЬНАЯ ЛОГИКА: уменьшаем текущий голод на 4 часа
+        # Если племя было голодно 2 часа, после /tried будет "голодно" -2 часа (т.е. в кредите!)
+        current_hunger_hours = get_hunger_hours(data)
+        new_hunger_hours = current_hunger_hours - 4  # Может быть отрицательным!
+        
+        # Устанавливаем время последнего кормления
+        # Если new_hunger_hours отрицательный, то last_feed_time окажется в будущем (кредит)
+        new_feed_time = now_msk() - timedelta(hours=new_hunger_hours)
+        
+        data["last_feed_time"] = new_feed_time.isoformat()
+        data["hunger_notified"] = False
+        record_event("tried", data, new_feed_time.timestamp())
+        add_score(data, TRIED_POINTS, user_now(data))
+        checkin_activity(data, now_msk().timestamp())
+        save_data(data)
+        reschedule_user(context, data)
+        OUTBOX.cancel(user_id, ("hunger", "checkin"))  # Бунт и чек-ин уже неактуальны
+        LIVE.touch(user_id)
+        
+        # Пересчитываем после сохранения
+        hours = get_hunger_hours(data)
     time_left = max(0, HUNGER_WARNING_HOURS - hours)
     
     phrase = get_phrase("tribe_tried")
@@ -465,47 +3574,86 @@ async def cmd_tried(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@instrumented
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    data = reset_daily_if_needed(data)
-    
-    hours = get_hunger_hours(data)
-    mode = get_hunger_mode(data)
-    
-    if mode == "good":
-        time_left = HUNGER_WARNING_HOURS - hours
-        status_text = f"✅ Племя сыто\n⏳ До голода: {time_left:.1f} ч."
-        status_emoji = "😊"
-    elif mode == "bad":
-        time_left = HUNGER_RIOT_HOURS - hours
-        status_text = f"⚠️ Племя голодает!\n⏳ До бунта: {time_left:.1f} ч."
-        status_emoji = "😟"
-    else:
-        overtime = hours - HUNGER_RIOT_HOURS
-        status_text = f"🔥 БУНТ! Голод {overtime:.1f} ч. сверх нормы!"
-        status_emoji = "😡"
-    
-    await update.message.reply_text(
-        f"📊 СТАТУС ДОБЫТЧИКА {status_emoji}\n\n"
-        f"🍖 Без еды: {hours:.1f} ч.\n"
-        f"{status_text}\n\n"
-        f"Команды:\n"
-        f"/done или 'сделал' — Принёс добычу (+12ч)\n"
-        f"/tried или 'попробовал' — Попытался (+4ч)"
-    )
+    user_id = update.effective_user.id
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        data = reset_daily_if_needed(data)
+        if LIVE_STATUS and is_bot_active():
+            # Ответ — сам закреп: создаётся или правится в общей пачке, без нового сообщения
+            LIVE.show(data, now_msk())
+            return
+        text = render_status(STATUS_TEMPLATES, data, now_msk())
+    await update.message.reply_text(text)
+
+
+def describe_schedule(data) -> str:
+    schedule = schedule_of(data)
+    return (f"🕰 Пояс: {schedule.zone.name}, сейчас {user_now(data):%H:%M}\n"
+            f"☀️ Подъём: будни {format_clock(schedule.weekday_wakeup)}, "
+            f"выходные {format_clock(schedule.weekend_wakeup)}")
+
+
+@instrumented
+async def cmd_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone Europe/Berlin — свой часовой пояс; без аргумента — текущие настройки"""
+    user_id = update.effective_user.id
+    args = getattr(context, "args", None)
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        if args:
+            try:
+                data["timezone"] = zone_table(args[0]).name
+            except KeyError:
+                await update.message.reply_text(
+                    f"Не знаю пояса «{args[0]}». Нужно имя IANA, например Europe/Moscow или Asia/Almaty."
+                )
+                return
+            save_data(data)
+            await flush_state()  # Строку в журнал не записать — сразу в хранилище
+            reschedule_user(context, data)
+            LIVE.touch(user_id)
+        text = describe_schedule(data)
+    await update.message.reply_text(text + "\n\nСменить: /timezone Asia/Almaty, /wakeup 06:30 08:00")
+
+
+@instrumented
+async def cmd_wakeup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/wakeup 06:30 [08:00] — подъём в будни и (необязательно) в выходные"""
+    user_id = update.effective_user.id
+    args = list(getattr(context, "args", None) or ())
+    try:
+        wakeups = [format_clock(parse_clock(value)) for value in args[:2]]
+    except ValueError:
+        wakeups = []
+    if not wakeups:
+        await update.message.reply_text("Формат: /wakeup 06:30 — подъём в будни, /wakeup 06:30 08:00 — и в выходные")
+        return
+    async with user_lock(user_id):
+        data = await aload_data(user_id)
+        data["weekday_wakeup"] = wakeups[0]
+        if len(wakeups) > 1:
+            data["weekend_wakeup"] = wakeups[1]
+        save_data(data)
+        await flush_state()  # Мимо журнала, как и пояс
+        reschedule_user(context, data)
+        text = describe_schedule(data)
+    await update.message.reply_text(text)
 
 
 async def cmd_test_dopamine(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ДИАГНОСТИКА: Проверка дофаминовой системы"""
-    data = load_data()
-    now = now_msk()
+    user_id = update.effective_user.id
+    data = await aload_data(user_id)
+    now = user_now(data)
     current_hour = now.hour
     current_minute = now.minute
     mode = get_hunger_mode(data)
     
     # Информация о состоянии
     info = f"🔍 ДИАГНОСТИКА ДОФАМИНА\n\n"
-    info += f"⏰ Текущее время: {now.strftime('%H:%M:%S')} МСК\n"
+    info += f"⏰ Текущее время: {now.strftime('%H:%M:%S')} ({schedule_of(data).zone.name})\n"
     info += f"📅 Дата: {now.strftime('%Y-%m-%d')}\n"
     info += f"🕐 Час: {current_hour}\n"
     info += f"🕐 Минута: {current_minute}\n\n"
@@ -538,52 +3686,674 @@ async def cmd_test_dopamine(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"🧪 ТЕСТ:\n{phrase}")
     
     # Сбрасываем last_dopamine_hour для повторного теста
-    data["last_dopamine_hour"] = None
-    save_data(data)
+    async with user_lock(user_id):
+        data["last_dopamine_hour"] = None
+        save_data(data)
+        reschedule_user(context, data)
+
+
+async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Только для ADMIN_IDS: /broadcast текст — объявление всем; без текста — ход рассылок.
+    Имя рассылки — от текста, поэтому повторная команда с тем же текстом не шлёт второй раз"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    text = update.message.text.partition(" ")[2].strip()
+    prefix = f"Шард {SHARD_INDEX}: " if SHARD_COUNT > 1 else ""
+    if text:
+        name = f"announce-{campaign_id(text):08x}"
+        if BROADCASTS.launch(name, text):
+            await update.message.reply_text(f"{prefix}рассылка {name} запущена")
+        else:
+            await update.message.reply_text(f"{prefix}такая рассылка уже была")
+        return
+    lines = [
+        f"{name}: {'готово' if c['done'] else 'идёт'}, доставлено {c['sent']}, не доставлено {c['failed']}"
+        for name, c in BROADCASTS.campaigns.items()
+    ]
+    await update.message.reply_text(prefix + ("\n".join(lines) or "Рассылок не было"))
+
+
+async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Только для ADMIN_IDS: /profile timer|handlers N [phases|sample|cprofile] — замер
+    следующих N тиков или вызовов обработчиков, сводка придёт сообщением;
+    /profile stop — закончить раньше; без аргументов — что сейчас идёт"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    args = context.args or []
+    if not args:
+        if PROFILER.target is None:
+            await update.message.reply_text("Профилирование выключено")
+        else:
+            await update.message.reply_text(
+                f"Профилирование {PROFILER.target} ({PROFILER.mode}): осталось {PROFILER.left}")
+        return
+    if args[0] == "stop":
+        PROFILER.chat_id = None  # Сводка уйдёт ответом, а не через очередь
+        await update.message.reply_text(PROFILER.finish()[:TELEGRAM_TEXT_LIMIT])
+        return
+    mode = args[2] if len(args) > 2 else "phases"
+    if args[0] not in ("timer", "handlers") or len(args) < 2 or not args[1].isdigit() or mode not in Profiler.MODES:
+        await update.message.reply_text("/profile timer|handlers N [phases|sample|cprofile], /profile stop")
+        return
+    PROFILER.start(args[0], int(args[1]), mode, update.effective_chat.id)
+    await update.message.reply_text(f"Профилирую {args[0]}: {args[1]}, режим {mode}")
 
 
 # ============== ОБРАБОТЧИК ТЕКСТОВЫХ СООБЩЕНИЙ ==============
+@instrumented
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает текстовые сообщения для русских команд"""
-    text = update.message.text.lower().strip()
+    """Обрабатывает текстовые сообщения для русских команд (синонимы — в intents.json)"""
+    # Без обёртки instrumented: сообщение — один замер handle_text, а не два
+    handlers = {
+        "done": cmd_done.__wrapped__,
+        "tried": cmd_tried.__wrapped__,
+        "status": cmd_status.__wrapped__,
+    }
+    handler = handlers.get(INTENTS.classify(update.message.text))
+    if handler is not None:
+        await handler(update, context)
+
+
+# ============== РАССЫЛКИ ==============
+def campaign_id(name: str) -> int:
+    """Номер рассылки для отметок в записи и в журнале"""
+    return zlib.crc32(name.encode("utf-8"))
+
+
+def mark_broadcast(data, cid: int):
+    delivered = data.get("broadcasts") or []
+    if cid not in delivered:
+        data["broadcasts"] = delivered + [cid]
+
+
+class Broadcaster:
+    """Рассылка всем пользователям хранилища — каждому ровно один раз.
     
-    # Проверяем на русские команды
-    if "сделал" in text or "сделала" in text:
-        await cmd_done(update, context)
-    elif "попробовал" in text or "попробовала" in text:
-        await cmd_tried(update, context)
-    # Можно добавить другие варианты:
-    # elif "статус" in text:
-    #     await cmd_status(update, context)
+    Курсор идёт по user_id по возрастанию страницами по BROADCAST_PAGE.
+    Каждая доставка сразу пишется в журнал (событие broadcast) и отмечается
+    в записи пользователя; после страницы курсор, отметки и позиция журнала
+    ложатся в хранилище одной транзакцией. После перезапуска рассылка
+    продолжается с записанного курсора, а уже доставленные внутри страницы
+    пропускаются по отметкам, восстановленным из журнала.
+    
+    Скорость ограничивает общее с OUTBOX ведро токенов, параллельность —
+    семафор. RetryAfter приостанавливает всю рассылку."""
+
+    def __init__(self, page: int = BROADCAST_PAGE, concurrency: int = BROADCAST_CONCURRENCY,
+                 max_retries: int = SEND_MAX_RETRIES, retry_base: float = SEND_RETRY_BASE):
+        self.bot = None
+        self.page = page
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.campaigns = {}  # имя -> {"text", "phrase", "cursor", "done", "sent", "failed"}
+        self._tasks = {}
+        self._paused_until = 0.0
+        self._stopping = False
+
+    def start(self, bot, campaigns: dict = None):
+        """Продолжает незаконченные рассылки (campaigns — из meta хранилища)"""
+        self.bot = bot
+        self._stopping = False
+        self.campaigns = campaigns or {}
+        for name, campaign in self.campaigns.items():
+            if not campaign["done"]:
+                logger.info(f"Рассылка {name}: продолжаю с user_id > {campaign['cursor']}")
+                self._run(name)
+
+    def launch(self, name: str, text: str, phrase: str = None) -> bool:
+        """Новая рассылка. text с phrase — шаблон «...{phrase}...», фраза своя у каждого.
+        Повторный запуск с тем же именем ничего не делает"""
+        if name in self.campaigns:
+            return False
+        self.campaigns[name] = {
+            "text": text, "phrase": phrase, "cursor": 0, "done": False, "sent": 0, "failed": 0,
+        }
+        logger.info(f"Рассылка {name}: старт")
+        self._run(name)
+        return True
+
+    def _run(self, name: str):
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            self._tasks[name] = asyncio.create_task(self._broadcast(name))
+
+    def _snapshot(self) -> dict:
+        return {"broadcasts": {name: dict(campaign) for name, campaign in self.campaigns.items()}}
+
+    async def _broadcast(self, name: str):
+        campaign = self.campaigns[name]
+        cid = campaign_id(name)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await flush_state(self._snapshot())  # Новые пользователи — в хранилище, рассылка — в meta
+        while not self._stopping:
+            user_ids = await run_io(get_store().user_ids_after, campaign["cursor"], self.page)
+            if not user_ids:
+                campaign["done"] = True
+                break
+            results = await asyncio.gather(*(
+                self._deliver(campaign, cid, user_id, semaphore) for user_id in user_ids
+            ))
+            campaign["sent"] += results.count("sent")
+            campaign["failed"] += sum(result not in ("sent", "skipped", "stopped") for result in results)
+            if "stopped" not in results:
+                campaign["cursor"] = user_ids[-1]
+            await flush_state(self._snapshot())
+        if campaign["done"]:
+            await flush_state(self._snapshot())
+            logger.info(f"Рассылка {name} завершена: доставлено {campaign['sent']}, "
+                        f"не доставлено {campaign['failed']}")
+
+    async def _deliver(self, campaign: dict, cid: int, user_id: int, semaphore) -> str:
+        async with semaphore:
+            if self._stopping:
+                return "stopped"
+            data = await aload_data(user_id)
+            if cid in (data.get("broadcasts") or ()):
+                return "skipped"
+            text = campaign["text"]
+            if campaign["phrase"]:
+                text = text.format(phrase=get_phrase(campaign["phrase"]))
+            result = await self._send(user_id, text)
+        # Отметка и при отказе (бот заблокирован и т.п.): повтор не поможет
+        record_event("broadcast", data, cid)
+        mark_broadcast(data, cid)
+        save_data(data)
+        return result
+
+    async def _send(self, chat_id: int, text: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                elif OUTBOX.bucket.try_take():
+                    break
+                else:
+                    await asyncio.sleep(OUTBOX.bucket.wait_time())
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                SEND_TOTAL.inc("broadcast", "sent")
+                return "sent"
+            except RetryAfter as e:
+                SEND_TOTAL.inc("broadcast", "flood_wait")
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            except NetworkError as e:
+                if isinstance(e, BadRequest):
+                    logger.warning(f"Рассылка для {chat_id} отвергнута: {e}")
+                    SEND_TOTAL.inc("broadcast", "rejected")
+                    return "rejected"
+                SEND_TOTAL.inc("broadcast", "network_error")
+                await asyncio.sleep(self.retry_base * 2 ** attempt)
+            except TelegramError as e:
+                logger.warning(f"Рассылка для {chat_id} отвергнута: {e}")
+                SEND_TOTAL.inc("broadcast", "rejected")
+                return "rejected"
+            finally:
+                SEND_SECONDS.observe(time.perf_counter() - started, "send_message")
+        logger.error(f"Рассылка для {chat_id}: не удалось за {self.max_retries} попыток")
+        SEND_TOTAL.inc("broadcast", "gave_up")
+        return "gave_up"
+
+    async def drain(self):
+        """Дождаться окончания всех запущенных рассылок"""
+        while any(not task.done() for task in self._tasks.values()):
+            await asyncio.gather(*self._tasks.values())
+
+    async def stop(self, timeout: float = 10):
+        """Дослать начатые запросы и сохранить прогресс; остальное — после перезапуска"""
+        self._stopping = True
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Рассылки прерваны при остановке: {len(pending)}")
+
+
+BROADCASTS = Broadcaster()
 
 
 # ============== ПРОВЕРКА ОКОНЧАНИЯ ==============
-async def check_bot_end(context: ContextTypes.DEFAULT_TYPE):
+def check_bot_end() -> bool:
+    """Сезон окончен — одна рассылка всем; повторные вызовы ничего не делают"""
     if now_msk() >= BOT_END:
-        data = load_data()
-        user_id = data.get("user_id")
-        if user_id:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"🏁 {get_phrase('bot_end')}"
+        return BROADCASTS.launch("season_end", "🏁 {phrase}", phrase="bot_end")
+    return False
+
+
+# ============== ВЕБХУК ==============
+def webhook_secret_ok(headers: dict) -> bool:
+    secret = headers.get("x-telegram-bot-api-secret-token", "")
+    return hmac.compare_digest(secret.encode("utf-8"), WEBHOOK_SECRET.encode("utf-8"))
+
+
+async def webhook_update(app: Application, headers: dict, body: bytes):
+    """POST от Telegram: проверка секрета и постановка обновления в очередь приложения"""
+    if not webhook_secret_ok(headers):
+        WEBHOOK_TOTAL.inc("forbidden")
+        return "403 Forbidden", b""
+    try:
+        update = Update.de_json(json.loads(body), app.bot)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Некорректное обновление в вебхуке: {e}")
+        WEBHOOK_TOTAL.inc("bad_request")
+        return "400 Bad Request", b""
+    await app.update_queue.put(update)
+    WEBHOOK_TOTAL.inc("accepted")
+    return "200 OK", b""
+
+
+async def feed_from_webhook(app: Application):
+    """Источник обновлений режима вебхука: свой HTTP-сервер + setWebhook"""
+    server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT, {
+        ("POST", WEBHOOK_PATH): functools.partial(webhook_update, app),
+    })
+    await server.start()
+    try:
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES,
+                max_connections=UPDATE_CONCURRENCY,
             )
+        else:
+            logger.warning("WEBHOOK_URL не задан: вебхук не зарегистрирован, принимаю только локальные POST")
+        await asyncio.Future()  # До остановки приложения
+    finally:
+        await server.stop()
+
+
+async def run_application(app: Application, feed):
+    """Жизненный цикл приложения без Updater — как run_polling, но обновления
+    приносит feed(app). Остановка — по сигналу или когда feed закончился"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        feeder = asyncio.create_task(feed(app))
+        feeder.add_done_callback(lambda _: stop.set())
+        try:
+            await stop.wait()
+        finally:
+            feeder.cancel()
+            (error,) = await asyncio.gather(feeder, return_exceptions=True)
+            if isinstance(error, Exception):
+                logger.error(f"Источник обновлений остановился с ошибкой: {error!r}")
+            await app.stop()  # Обработает то, что уже лежит в update_queue
+            await app.post_stop(app)
+    await app.post_shutdown(app)
+
+
+# ============== ШАРДЫ ==============
+SHARD_UPDATES = METRICS.add(Counter(
+    "stoyanka_shard_updates_total", "Обновления, отданные фронтом воркерам", ("shard",)))
+SHARD_RESTARTS = METRICS.add(Counter(
+    "stoyanka_shard_restarts_total", "Перезапуски упавших воркеров", ("shard",)))
+
+
+FANOUT_COMMANDS = ("/broadcast",)  # Каждый воркер рассылает своим пользователям
+
+
+def shard_of(user_id: int, count: int) -> int:
+    return user_id % count
+
+
+def owns_user(user_id: int) -> bool:
+    """Пользователь принадлежит этому процессу (без шардов — всегда)"""
+    return shard_of(user_id, SHARD_COUNT) == SHARD_INDEX
+
+
+def update_user_id(update: dict) -> int:
+    """user_id из сырого обновления: отправитель, иначе чат"""
+    for value in update.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("chat") or {}
+            if "id" in sender:
+                return sender["id"]
+    return 0
+
+
+def update_command(update: dict) -> str:
+    """Команда сообщения без @имени бота ("/broadcast"); "" — не команда"""
+    text = (update.get("message") or {}).get("text") or ""
+    if not text.startswith("/"):
+        return ""
+    return text.split(maxsplit=1)[0].split("@", 1)[0]
+
+
+def configure_shard(index: int, count: int):
+    """Воркер index из count: своя база, журнал, доля общего лимита отправки
+    и порт метрик. Вызывается до первого обращения к хранилищу"""
+    global SHARD_INDEX, SHARD_COUNT, STATE_DB_FILE, STATE_JSON_FILE, JOURNAL, OUTBOX
+    SHARD_INDEX, SHARD_COUNT = index, count
+    STATE_DB_FILE = DATA_DIR / f"stoyanka-{index}.db"
+    STATE_JSON_FILE = DATA_DIR / f"stoyanka_data-{index}.json"
+    JOURNAL = EventJournal(DATA_DIR / f"journal-{index}")
+    OUTBOX = Outbox(global_rate=GLOBAL_SEND_RATE / count,
+                    global_burst=max(1, GLOBAL_SEND_BURST // count))
+    if METRICS_PORT:
+        METRICS_SERVER.port = METRICS_PORT + 1 + index
+
+
+async def feed_from_stdin(app: Application):
+    """Источник обновлений воркера: JSON построчно от фронта. EOF — фронт остановился"""
+    reader = asyncio.StreamReader(limit=HttpServer.max_body)
+    loop = asyncio.get_running_loop()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    while line := await reader.readline():
+        try:
+            update = Update.de_json(json.loads(line), app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Шард {SHARD_INDEX}: некорректное обновление: {e}")
+            continue
+        await app.update_queue.put(update)
+
+
+class ShardRouter:
+    """Фронт: держит count процессов-воркеров и пишет каждому в stdin
+    обновления его пользователей. Один пользователь — всегда один воркер
+    и одна труба, поэтому порядок его обновлений сохраняется."""
+
+    restart_delay = 1.0
+
+    def __init__(self, count: int, command: list, env: dict = None):
+        self.count = count
+        self.command = command
+        self.env = env or {}
+        self.workers = [None] * count
+        self._watchers = [None] * count
+        self._stopping = False
+
+    async def start(self):
+        for index in range(self.count):
+            await self._spawn(index)
+
+    async def _spawn(self, index: int):
+        env = dict(os.environ, **self.env, SHARD_INDEX=str(index), SHARDS=str(self.count))
+        proc = await asyncio.create_subprocess_exec(
+            *self.command, stdin=asyncio.subprocess.PIPE, env=env)
+        self.workers[index] = proc
+        self._watchers[index] = asyncio.create_task(self._watch(index, proc))
+        logger.info(f"Воркер {index} запущен (pid {proc.pid})")
+
+    async def _watch(self, index: int, proc):
+        code = await proc.wait()
+        if self._stopping:
+            return
+        logger.error(f"Воркер {index} завершился с кодом {code}, перезапуск")
+        SHARD_RESTARTS.inc(str(index))
+        await asyncio.sleep(self.restart_delay)
+        if not self._stopping:
+            await self._spawn(index)
+
+    async def route(self, update: dict, raw: bytes = None) -> int:
+        """Отдаёт обновление воркеру; raw — исходное тело, чтобы не сериализовать заново.
+        Команды на всех пользователей (FANOUT_COMMANDS) получают все воркеры"""
+        index = shard_of(update_user_id(update), self.count)
+        if raw is None or b"\n" in raw:
+            raw = json.dumps(update, ensure_ascii=False).encode("utf-8")
+        targets = range(self.count) if update_command(update) in FANOUT_COMMANDS else (index,)
+        for target in targets:
+            proc = self.workers[target]
+            try:
+                proc.stdin.write(raw + b"\n")
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                logger.error(f"Воркер {target} недоступен, обновление {update.get('update_id')} потеряно")
+                continue
+            SHARD_UPDATES.inc(str(target))
+        return index
+
+    async def stop(self, timeout: float = 30):
+        """Закрывает stdin воркеров: каждый дообрабатывает очередь и выходит сам"""
+        self._stopping = True
+        for proc in self.workers:
+            if proc is not None and proc.returncode is None:
+                proc.stdin.close()
+        for proc in self.workers:
+            if proc is None:
+                continue
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                proc.terminate()
+                await proc.wait()
+        for watcher in self._watchers:
+            if watcher is not None:
+                watcher.cancel()
+
+
+async def front_webhook(router: ShardRouter, headers: dict, body: bytes):
+    """Вебхук фронта: объекты PTB не создаются, только поиск user_id"""
+    if not webhook_secret_ok(headers):
+        WEBHOOK_TOTAL.inc("forbidden")
+        return "403 Forbidden", b""
+    try:
+        update = json.loads(body)
+    except ValueError as e:
+        logger.warning(f"Некорректное обновление в вебхуке: {e}")
+        WEBHOOK_TOTAL.inc("bad_request")
+        return "400 Bad Request", b""
+    await router.route(update, body)
+    WEBHOOK_TOTAL.inc("accepted")
+    return "200 OK", b""
+
+
+async def bot_api(client, method: str, **params):
+    """Прямой вызов Bot API для фронта; None при ошибке (уже записанной в лог)"""
+    try:
+        response = await client.post(f"{BOT_API_URL}{BOT_TOKEN}/{method}", json=params)
+        answer = response.json()
+    except Exception as e:
+        logger.warning(f"{method}: {e}")
+        return None
+    if not answer.get("ok"):
+        logger.error(f"{method}: {answer.get('description')}")
+        return None
+    return answer["result"]
+
+
+async def front_polling(router: ShardRouter, client, stop: asyncio.Event):
+    """getUpdates фронта: сырые словари сразу уходят воркерам.
+    При остановке offset подтверждается, иначе после перезапуска Telegram
+    отдаст последнюю пачку ещё раз"""
+    await bot_api(client, "deleteWebhook")
+    offset = 0
+    delay = 1
+    try:
+        while not stop.is_set():
+            updates = await bot_api(client, "getUpdates", offset=offset, timeout=POLL_TIMEOUT,
+                                    allowed_updates=ALLOWED_UPDATES)
+            if updates is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            delay = 1
+            for update in updates:
+                await router.route(update)
+                offset = update["update_id"] + 1
+    finally:
+        if offset:
+            await bot_api(client, "getUpdates", offset=offset, timeout=0, limit=1)
+
+
+async def run_front(count: int):
+    """Фронт-процесс: принимает обновления (polling или webhook) и раздаёт
+    их count воркерам. Состояния и таймеров у фронта нет"""
+    import httpx
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    router = ShardRouter(count, [sys.executable, os.path.abspath(__file__)])
+    await router.start()
+    await start_metrics_server()
+    async with httpx.AsyncClient(timeout=POLL_TIMEOUT + 10) as client:
+        if UPDATE_MODE == "webhook":
+            server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT, {
+                ("POST", WEBHOOK_PATH): functools.partial(front_webhook, router),
+            })
+            await server.start()
+            if WEBHOOK_URL:
+                await bot_api(client, "setWebhook", url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET,
+                              allowed_updates=ALLOWED_UPDATES, max_connections=UPDATE_CONCURRENCY)
+            else:
+                logger.warning("WEBHOOK_URL не задан: вебхук не зарегистрирован, принимаю только локальные POST")
+            await stop.wait()
+            await server.stop()
+        else:
+            poller = asyncio.create_task(front_polling(router, client, stop))
+            await stop.wait()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+    await router.stop()
+    await METRICS_SERVER.stop()
+
+
+# ============== ТРАНСПОРТ BOT API ==============
+# Профили HTTP: у отправки и у getUpdates свои пулы — долгий опрос не занимает
+# соединение, нужное всплеску уведомлений в 5:30 и :55. None — как в PTB по умолчанию
+# (пул 256 / 1, таймауты 5 с, ожидание свободного соединения 1 с, keep-alive 5 с)
+HTTP_PROFILES = {
+    "ptb": None,
+    # Соединение на каждого одновременного отправителя: окно Outbox, рассылка, ответы на команды
+    "tuned": {
+        "send": {"pool": SEND_MAX_IN_FLIGHT + BROADCAST_CONCURRENCY + UPDATE_CONCURRENCY,
+                 "connect": 5.0, "read": 15.0, "write": 15.0, "pool_wait": 10.0, "keepalive": 60.0},
+        "poll": {"pool": 1, "connect": 5.0, "read": 10.0, "write": 5.0, "pool_wait": 5.0, "keepalive": 60.0},
+    },
+    # Слабая машина: мало сокетов, остальные ждут в пуле, а не падают с TimedOut
+    "lean": {
+        "send": {"pool": 8, "connect": 5.0, "read": 15.0, "write": 15.0, "pool_wait": 30.0, "keepalive": 30.0},
+        "poll": {"pool": 1, "connect": 5.0, "read": 10.0, "write": 5.0, "pool_wait": 5.0, "keepalive": 30.0},
+    },
+}
+
+
+def http2_enabled() -> bool:
+    """HTTP2=auto — только для api.telegram.org: свой сервер Bot API и заглушки
+    отвечают лишь по HTTP/1.1. HTTP2=1 — включить и для своего BOT_API_URL"""
+    if HTTP2 == "0":
+        return False
+    if HTTP2 != "1" and BOT_API_URL != TELEGRAM_API_URL:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if HTTP2 == "1":
+            logger.warning("HTTP2=1, но пакет h2 не установлен (python-telegram-bot[http2]) — работаю по HTTP/1.1")
+        return False
+    return True
+
+
+def make_request(role: str, profile: str = None):
+    """HTTPXRequest для роли "send" или "poll" по профилю из HTTP_PROFILES.
+    None — профиль PTB по умолчанию: запрос построит сам ApplicationBuilder"""
+    name = profile or HTTP_PROFILE
+    if name not in HTTP_PROFILES:
+        logger.warning(f"Неизвестный HTTP_PROFILE={name!r}, беру ptb")
+        name = "ptb"
+    settings = HTTP_PROFILES[name]
+    if settings is None:
+        return None
+    import httpx
+    from telegram.request import HTTPXRequest
+
+    p = settings[role]
+    # HTTP/2 — только отправке: много запросов по одному соединению; getUpdates — один долгий запрос
+    http2 = role == "send" and http2_enabled()
+    return HTTPXRequest(
+        connection_pool_size=p["pool"],
+        connect_timeout=p["connect"],
+        read_timeout=p["read"],
+        write_timeout=p["write"],
+        pool_timeout=p["pool_wait"],
+        http_version="2" if http2 else "1.1",
+        httpx_kwargs={"limits": httpx.Limits(
+            max_connections=p["pool"], max_keepalive_connections=p["pool"], keepalive_expiry=p["keepalive"],
+        )},
+    )
 
 
 # ============== MAIN ==============
-def main():
-    ensure_data_dir()
-    if not BOT_TOKEN:
-        logger.error("No BOT_TOKEN!")
-        return
-    
-    app = Application.builder().token(BOT_TOKEN).build()
+async def on_startup(app: Application):
+    """Планирует ближайшее событие каждого пользователя и заводит таймер"""
+    await asyncio.to_thread(load_catalogs)
+    users = await run_io(STATE.preload)
+    replayed = await run_io(recover_from_journal)
+    if replayed:
+        logger.info(f"Из журнала догнано событий: {replayed}")
+        users = list(STATE.users.values())
+    for data in users:
+        SCHEDULER.reschedule(data)
+    SCHEDULER.arm(app.job_queue)
+    OUTBOX.start(app.bot)
+    BROADCASTS.start(app.bot, await run_io(get_store().get_meta, "broadcasts"))
+    check_bot_end()  # Бот мог быть выключен в момент окончания сезона
+    await start_metrics_server()
+    logger.info(f"Запланировано пользователей: {len(users)}")
+
+
+async def on_stop(app: Application):
+    """Досылает очередь уведомлений, пока бот ещё подключён"""
+    await BROADCASTS.stop()
+    await OUTBOX.stop()
+
+
+async def on_shutdown(app: Application):
+    """Сбрасывает несохранённые изменения перед выходом"""
+    await METRICS_SERVER.stop()
+    await flush_state()
+    await run_io(get_store().close)
+    await run_io(JOURNAL.close)
+    logger.info("Состояние сохранено")
+
+
+def build_application(updater: bool = True, request=None) -> Application:
+    """Приложение со всеми обработчиками и фоновыми задачами.
+    updater=False — обновления приносит run_application (вебхук, воркер шарда)"""
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(UPDATE_CONCURRENCY)  # Порядок внутри пользователя держит user_lock
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    if request is None:
+        request = make_request("send")
+        if request is not None:
+            builder = builder.get_updates_request(make_request("poll"))
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.base_url(BOT_API_URL).build()
     
     # Команды на английском
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("status", cmd_status))
     app.add_handler(CommandHandler("done", cmd_done))
     app.add_handler(CommandHandler("tried", cmd_tried))
+    app.add_handler(CommandHandler("timezone", cmd_timezone))
+    app.add_handler(CommandHandler("wakeup", cmd_wakeup))
     app.add_handler(CommandHandler("test_dopamine", cmd_test_dopamine))  # Диагностика
+    app.add_handler(CommandHandler("broadcast", cmd_broadcast))  # Только ADMIN_IDS
+    app.add_handler(CommandHandler("profile", cmd_profile))  # Только ADMIN_IDS
     
     # Обработчик текстовых сообщений для русских команд
     app.add_handler(MessageHandler(
@@ -591,11 +4361,41 @@ def main():
         handle_text
     ))
     
-    # Главный таймер — каждую минуту
-    app.job_queue.run_repeating(main_timer, interval=60, first=10)
+    # Отложенная запись изменений состояния
+    app.job_queue.run_repeating(flush_state_job, interval=STATE_FLUSH_INTERVAL)
+    
+    # Проверка phrases.json на изменения — раз в минуту
+    app.job_queue.run_repeating(reload_catalogs, interval=PHRASES_RELOAD_INTERVAL)
+    
+    # Правки закреплённого статуса — пачкой, не чаще раза в интервал
+    if LIVE_STATUS:
+        app.job_queue.run_repeating(live_status_job, interval=LIVE_STATUS_INTERVAL)
+    return app
+
+
+def main():
+    ensure_data_dir()
+    if not BOT_TOKEN:
+        logger.error("No BOT_TOKEN!")
+        return
     
-    logger.info("Бот Добытчик v4.3 запускается...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WORKER_INDEX is not None:
+        configure_shard(int(WORKER_INDEX), SHARDS)
+        logger.info(f"Воркер шарда {SHARD_INDEX}/{SHARD_COUNT} запускается...")
+        asyncio.run(run_application(build_application(updater=False), feed_from_stdin))
+    elif SHARDS > 1:
+        problem = check_shard_layout(SHARDS)
+        if problem:
+            logger.error(problem)
+            return
+        logger.info(f"Бот Добытчик v4.3 запускается ({UPDATE_MODE}, шардов: {SHARDS})...")
+        asyncio.run(run_front(SHARDS))
+    elif UPDATE_MODE == "webhook":
+        logger.info(f"Бот Добытчик v4.3 запускается ({UPDATE_MODE})...")
+        asyncio.run(run_application(build_application(updater=False), feed_from_webhook))
+    else:
+        logger.info(f"Бот Добытчик v4.3 запускается ({UPDATE_MODE})...")
+        build_application().run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Общее для тестов: бот импортируется с временным DATA_DIR (копия data/*.json),
+рабочие данные не трогаются. FakeBot — та же заглушка Bot API, что у бенчей"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="stoyanka-tests-")
+for source in (ROOT / "data").glob("*.json"):
+    shutil.copy(source, os.environ["DATA_DIR"])
+
+import storoz_bot as bot  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(os.environ["DATA_DIR"], ignore_errors=True)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Свой DATA_DIR на тест: хранилище, журнал, кэш, задачи и очередь — заново.
+    Справочники остаются общими (копия data/*.json)"""
+    monkeypatch.setattr(bot, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(bot, "DATA_FILE", tmp_path / "stoyanka_data.json")
+    monkeypatch.setattr(bot, "STATE_DB_FILE", tmp_path / "stoyanka.db")
+    monkeypatch.setattr(bot, "STATE_JSON_FILE", tmp_path / "stoyanka_data.json")
+    monkeypatch.setattr(bot, "JOURNAL", bot.EventJournal(tmp_path / "journal"))
+    monkeypatch.setattr(bot, "STATE", bot.StateCache())
+    monkeypatch.setattr(bot, "TASKS", bot.TaskPool())
+    monkeypatch.setattr(bot, "OUTBOX", bot.Outbox(global_rate=1e9, global_burst=1e9, chat_interval=0))
+    monkeypatch.setattr(bot, "LIVE", bot.LiveStatus())
+    monkeypatch.setattr(bot, "BROADCASTS", bot.Broadcaster())
+    monkeypatch.setattr(bot, "CLOCK", bot.CLOCK)
+    monkeypatch.setattr(bot, "SHARD_INDEX", 0)
+    monkeypatch.setattr(bot, "SHARD_COUNT", 1)
+    monkeypatch.setattr(bot, "_store", None)
+    yield tmp_path
+    bot.JOURNAL.close()
+    if bot._store is not None:
+        bot._store.close()
+
+
+def restart():
+    """Как новый процесс после kill: кэш и журнал заново, снимок + хвост журнала"""
+    bot.JOURNAL.close()
+    bot._store.close()
+    bot._store = None
+    bot.STATE = bot.StateCache()
+    bot.TASKS = bot.TaskPool()
+    bot.JOURNAL = bot.EventJournal(bot.JOURNAL.path)
+    bot.STATE.preload()
+    return bot.recover_from_journal()
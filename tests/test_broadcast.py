@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Рассылка конца сезона: падение посередине и продолжение — ровно один раз"""
+
+import asyncio
+from collections import Counter
+
+from conftest import restart
+from fake_bot import FakeBot
+
+import storoz_bot as bot
+
+USERS = 300
+
+
+def test_resume_after_crash_sends_exactly_once(data_dir):
+    async def run():
+        bot.set_clock(bot.VirtualClock(bot.BOT_END))
+        fake_bot = FakeBot(latency=0.001)
+        bot.OUTBOX.start(fake_bot)
+        bot.BROADCASTS = bot.Broadcaster(concurrency=16)
+        bot.BROADCASTS.start(fake_bot)
+        now = bot.BOT_END.isoformat()
+        bot.get_store().put_many([
+            dict(bot.DEFAULT_USER_STATE, user_id=user_id, last_feed_time=now)
+            for user_id in range(1, USERS + 1)
+        ])
+
+        assert bot.check_bot_end()
+        task = bot.BROADCASTS._tasks["season_end"]
+        while len(fake_bot.sent) < USERS // 2 + 7:  # Посреди страницы
+            await asyncio.sleep(0.001)
+        task.cancel()  # Падение: без stop() и без flush
+        await asyncio.gather(task, return_exceptions=True)
+        sent_before = len(fake_bot.sent)
+
+        assert restart() > 0
+        bot.BROADCASTS = bot.Broadcaster(concurrency=16)
+        bot.BROADCASTS.start(fake_bot, bot.get_store().get_meta("broadcasts"))
+        await bot.BROADCASTS.drain()
+        relaunched = bot.check_bot_end()
+        await bot.BROADCASTS.drain()
+        await bot.OUTBOX.stop()
+        return fake_bot, sent_before, relaunched
+
+    fake_bot, sent_before, relaunched = asyncio.run(run())
+    assert sent_before < USERS
+    assert not relaunched
+    per_chat = Counter(chat_id for _, _, chat_id, _ in fake_bot.sent)
+    assert set(per_chat) == set(range(1, USERS + 1))
+    assert max(per_chat.values()) == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Распознавание команд свободным текстом"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import storoz_bot as bot
+
+
+@pytest.fixture
+def matcher():
+    matcher = bot.IntentMatcher(bot.INTENTS_FILE)
+    matcher.refresh()
+    return matcher
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Сделал!", "done"),
+    ("всё готово, принёс добычу", "done"),
+    ("Задача готова", "done"),
+    ("попробовал, но не сделал", "tried"),
+    ("не получилось сегодня", "tried"),
+    ("покажи статус", "status"),
+    ("я не готов", None),
+    ("ничего не сделал", None),
+    ("какой статус у задачи", None),
+    ("доброе утро, племя", None),
+    ("", None),
+])
+def test_classify(matcher, text, intent):
+    assert matcher.classify(text) == intent
+
+
+def test_every_phrase_is_its_own_intent(matcher):
+    with open(bot.INTENTS_FILE, encoding="utf-8") as f:
+        raw = json.load(f)
+    for intent, phrases in raw["intents"].items():
+        for phrase in phrases:
+            assert matcher.classify(phrase) == intent, phrase
+            assert matcher.classify(phrase.upper() + "!!") == intent, phrase
+
+
+def test_missing_file_falls_back_to_defaults(tmp_path):
+    matcher = bot.IntentMatcher(tmp_path / "intents.json")
+    assert matcher.refresh() is False  # Файла нет с самого начала — остаются умолчания
+    assert set(matcher.priority) == set(bot.DEFAULT_INTENTS["intents"])
+    assert matcher.classify("сделал") == "done"
+    assert matcher.classify("покажи статус") is None
+
+
+def test_reload_and_broken_file(tmp_path):
+    path = tmp_path / "intents.json"
+    shutil.copy(bot.INTENTS_FILE, path)
+    matcher = bot.IntentMatcher(path)
+    assert matcher.refresh() is True
+    assert matcher.classify("покажи статус") == "status"
+
+    path.write_text("{ битый", encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    assert matcher.refresh() is False
+    assert matcher.classify("покажи статус") == "status"  # Прежние команды на месте
+
+    path.unlink()
+    assert matcher.refresh() is True
+    assert matcher.classify("покажи статус") is None
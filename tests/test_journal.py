@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Журнал событий: запись и чтение, битый хвост, сегменты, восстановление"""
+
+import asyncio
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+
+from conftest import restart
+from fake_bot import FakeBot
+
+import storoz_bot as bot
+
+
+def test_append_and_read_across_segments(tmp_path):
+    journal = bot.EventJournal(tmp_path, segment_bytes=bot.EVENT_SIZE * 3)
+    for i in range(10):
+        assert journal.append("done", 7, 1000.0 + i, 2000.0 + i) == i + 1
+    journal.close()
+    assert len(list(tmp_path.glob("*.log"))) == 4
+    events = list(journal.read(0))
+    assert [seq for seq, *_ in events] == list(range(1, 11))
+    assert events[0] == (1, 1000.0, 7, "done", 2000.0)
+    assert [seq for seq, *_ in journal.read(6)] == [7, 8, 9, 10]
+
+
+def test_torn_tail_is_cut_and_writing_continues(tmp_path):
+    journal = bot.EventJournal(tmp_path)
+    for i in range(3):
+        journal.append("tried", 1, float(i))
+    journal.close()
+    segment = next(tmp_path.glob("*.log"))
+    with open(segment, "ab") as f:
+        f.write(b"\x01" * (bot.EVENT_SIZE // 2))  # Запись, оборванная падением
+
+    reopened = bot.EventJournal(tmp_path)
+    reopened.open()
+    assert reopened.seq == 3
+    assert segment.stat().st_size == 3 * bot.EVENT_SIZE
+    assert reopened.append("done", 1, 9.0) == 4
+    reopened.close()
+    assert [seq for seq, *_ in reopened.read(0)] == [1, 2, 3, 4]
+
+
+def test_bad_crc_record_is_dropped(tmp_path):
+    journal = bot.EventJournal(tmp_path)
+    for i in range(3):
+        journal.append("done", 1, float(i))
+    journal.close()
+    segment = next(tmp_path.glob("*.log"))
+    raw = bytearray(segment.read_bytes())
+    raw[-1] ^= 0xFF
+    segment.write_bytes(bytes(raw))
+
+    reopened = bot.EventJournal(tmp_path)
+    reopened.open()
+    assert reopened.seq == 2
+
+
+def test_compact_keeps_uncovered_segments(tmp_path):
+    journal = bot.EventJournal(tmp_path, segment_bytes=bot.EVENT_SIZE * 2, keep_segments=1)
+    for i in range(8):
+        journal.append("done", 1, float(i))
+    journal.snapshot_seq = 6
+    journal.compact()
+    journal.close()
+    # Сегменты 1-2, 3-4, 5-6 вошли в снимок; остаётся последний из них и хвост
+    assert [seq for seq, *_ in journal.read(4)] == [5, 6, 7, 8]
+    assert len(list(tmp_path.glob("*.log"))) == 2
+
+
+def test_sync_survives_concurrent_rotation(tmp_path):
+    journal = bot.EventJournal(tmp_path, segment_bytes=bot.EVENT_SIZE)
+    journal.open()
+    errors = []
+    done = threading.Event()
+
+    def sync_loop():
+        while not done.is_set():
+            try:
+                journal.sync()
+            except OSError as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=sync_loop)
+    thread.start()
+    try:
+        for i in range(2000):
+            journal.append("done", 1, float(i))
+    finally:
+        done.set()
+        thread.join()
+        journal.close()
+    assert errors == []
+
+
+def command(user_id):
+    async def reply_text(text, **kwargs):
+        pass
+
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id),
+                           message=SimpleNamespace(reply_text=reply_text))
+
+
+def test_state_is_snapshot_plus_journal_tail(data_dir):
+    """Всё, что изменили команды и закреп после последнего flush, восстанавливается из журнала"""
+    async def run():
+        moment = bot.BOT_START + timedelta(days=3, hours=9)
+        bot.set_clock(bot.VirtualClock(moment))
+        fake_bot = FakeBot()
+        bot.OUTBOX.start(fake_bot)
+        context = SimpleNamespace(bot=fake_bot, job_queue=None, args=None)
+        user_id = 5
+
+        await bot.cmd_start(command(user_id), context)
+        await bot.OUTBOX.drain()
+        data = bot.STATE.cached(user_id)
+        bot.TASKS.draw_daily(data, weekend=False)
+        bot.save_data(data)
+        await bot.flush_state()  # Снимок: цели дня в журнал не пишутся
+
+        bot.CLOCK.set(moment + timedelta(minutes=5))
+        context.args = [bot.TASKS.code(data["tasks_today"][0])]
+        await bot.cmd_done(command(user_id), context)
+        context.args = None
+        data["status_message_id"] = None  # Закреп удалили — живой статус создаст новый
+        bot.LIVE.show(data, bot.now_msk())
+        await bot.OUTBOX.drain()
+        await bot.OUTBOX.stop()
+        return dict(data)
+
+    before = asyncio.run(run())
+    assert restart() > 0  # Падение без flush
+    after = bot.STATE.cached(before["user_id"])
+    for key in ("last_feed_time", "score_day", "score_week", "tasks_done", "status_message_id",
+                "checkin_at", "current_date"):
+        assert after[key] == before[key], key
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Профилирование обработчиков: один замер на сообщение, перезапуск посреди замера"""
+
+import asyncio
+from types import SimpleNamespace
+
+from fake_bot import FakeBot
+
+import storoz_bot as bot
+
+
+def text_update(user_id, text):
+    async def reply_text(text, **kwargs):
+        pass
+
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id),
+                           message=SimpleNamespace(text=text, reply_text=reply_text))
+
+
+def test_text_command_is_one_unit(data_dir, monkeypatch):
+    monkeypatch.setattr(bot, "PROFILE_DIR", data_dir / "profiles")
+    profiler = bot.Profiler()
+    monkeypatch.setattr(bot, "PROFILER", profiler)
+
+    async def run():
+        fake_bot = FakeBot()
+        bot.OUTBOX.start(fake_bot)
+        context = SimpleNamespace(bot=fake_bot, job_queue=None, args=None)
+        profiler.start("handlers", 3)
+        for text in ("сделал", "попробовал", "доброе утро"):
+            await bot.handle_text(text_update(1, text), context)
+        await bot.OUTBOX.stop()
+
+    asyncio.run(run())
+    assert profiler.target is None  # Три сообщения — три замера, профиль закончен
+    assert profiler.units == 3
+    summary = next((data_dir / "profiles").glob("handlers-*.txt")).read_text(encoding="utf-8")
+    assert "handle_text" in summary
+    assert "cmd_done" not in summary and "cmd_tried" not in summary
+
+
+def test_restart_ignores_units_of_previous_run(data_dir, monkeypatch):
+    monkeypatch.setattr(bot, "PROFILE_DIR", data_dir / "profiles")
+    profiler = bot.Profiler()
+    profiler.start("timer", 2)
+    stale = profiler.begin("timer", "main_timer")
+    profiler.start("timer", 1)  # Перезапуск, пока первый тик ещё идёт
+    unit = profiler.begin("timer", "main_timer")
+    profiler.end(stale)
+    assert profiler.target == "timer" and profiler.units == 0
+    profiler.end(unit)
+    assert profiler.target is None and profiler.units == 1
+    assert profiler.begin("timer", "main_timer") is None
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Шарды: перенос из общего хранилища, смена SHARDS, маршрутизация фронта"""
+
+import asyncio
+import json
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import storoz_bot as bot
+
+LEGACY_USER = 2
+
+
+def start_worker(index, count):
+    """Как новый процесс воркера: хранилище открывается заново"""
+    if bot._store is not None:
+        bot._store.close()
+        bot._store = None
+    bot.configure_shard(index, count)
+    return bot.get_store()
+
+
+def seed_unsharded(users):
+    """Общий stoyanka.db со свежими записями и старый однопользовательский файл"""
+    fresh = (bot.BOT_START + timedelta(days=3)).isoformat()
+    shared = bot.SQLiteStateStore(bot.DATA_DIR / "stoyanka.db")
+    shared.put_many([
+        dict(bot.DEFAULT_USER_STATE, user_id=user_id, last_feed_time=fresh)
+        for user_id in range(1, users + 1)
+    ])
+    shared.close()
+    stale = dict(bot.DEFAULT_USER_STATE, user_id=LEGACY_USER, last_feed_time=bot.BOT_START.isoformat())
+    with open(bot.DATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(stale, f)
+    return fresh
+
+
+@pytest.mark.parametrize("restart", [False, True])
+def test_import_unsharded_wins_over_legacy_file(data_dir, restart):
+    fresh = seed_unsharded(6)
+    for _ in range(2 if restart else 1):
+        for index in range(2):
+            store = start_worker(index, 2)
+            assert sorted(store.user_ids()) == [u for u in range(1, 7) if u % 2 == index]
+            for user_id in store.user_ids():
+                assert store.get(user_id)["last_feed_time"] == fresh
+            assert store.get_meta("unsharded_imported") is True
+            assert store.get_meta("shard_count") == 2
+
+
+def test_import_is_not_repeated(data_dir):
+    seed_unsharded(4)
+    store = start_worker(0, 2)
+    store.put(dict(store.get(2), last_feed_time="changed"))
+    store = start_worker(0, 2)
+    assert store.get(2)["last_feed_time"] == "changed"
+
+
+def test_changed_shard_count_is_refused(data_dir):
+    seed_unsharded(6)
+    for index in range(2):
+        start_worker(index, 2)
+    assert bot.check_shard_layout(2) is None
+    assert "SHARDS=2" in bot.check_shard_layout(4)
+    assert bot.check_shard_layout(1) is not None
+    with pytest.raises(RuntimeError):
+        start_worker(0, 3)
+
+
+class FakeWorker:
+    def __init__(self):
+        self.lines = []
+        self.stdin = SimpleNamespace(write=self.lines.append, drain=self._drain)
+
+    async def _drain(self):
+        pass
+
+
+def message(user_id, text):
+    return {"update_id": 1, "message": {"from": {"id": user_id}, "chat": {"id": user_id}, "text": text}}
+
+
+@pytest.mark.parametrize("text, fanout", [
+    ("/broadcast Сбор у костра", True),
+    ("/broadcast@StoyankaBot Сбор", True),
+    ("/broadcastfoo", False),
+    ("/done", False),
+    ("broadcast", False),
+])
+def test_router_fans_out_exact_command(text, fanout):
+    router = bot.ShardRouter(3, [])
+    router.workers = [FakeWorker() for _ in range(3)]
+    asyncio.run(router.route(message(4, text)))
+    got = [len(worker.lines) for worker in router.workers]
+    assert got == ([1, 1, 1] if fanout else [0, 1, 0])
+
+
+class FakeClient:
+    """Bot API для front_polling: отдаёт пачки обновлений и пишет вызовы"""
+
+    def __init__(self, batches, stop):
+        self.batches = list(batches)
+        self.stop = stop
+        self.calls = []
+
+    async def post(self, url, json):
+        method = url.rsplit("/", 1)[1]
+        self.calls.append((method, json))
+        result = True
+        if method == "getUpdates" and json.get("timeout"):
+            result = self.batches.pop(0) if self.batches else []
+            if not self.batches:
+                self.stop.set()
+        return SimpleNamespace(json=lambda: {"ok": True, "result": result})
+
+
+def test_front_polling_confirms_offset_on_stop():
+    async def run():
+        stop = asyncio.Event()
+        client = FakeClient([[message(1, "a") | {"update_id": 10}, message(2, "b") | {"update_id": 11}]], stop)
+        routed = []
+        router = SimpleNamespace(route=lambda update: asyncio.sleep(0, routed.append(update["update_id"])))
+        await bot.front_polling(router, client, stop)
+        return routed, client.calls
+
+    routed, calls = asyncio.run(run())
+    assert routed == [10, 11]
+    method, params = calls[-1]
+    assert method == "getUpdates" and params["offset"] == 12 and params["timeout"] == 0
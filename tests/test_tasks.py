@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Цели дня: пропорции, закрытые задачи, пропуски"""
+
+import random
+from collections import Counter
+
+import pytest
+
+import storoz_bot as bot
+
+
+@pytest.fixture
+def pool():
+    pool = bot.TaskPool()
+    pool.load()
+    return pool
+
+
+def user(user_id=1, **fields):
+    data = bot.UserState(bot.DEFAULT_USER_STATE)
+    data["user_id"] = user_id
+    data.update(fields)
+    return data
+
+
+@pytest.mark.parametrize("weekend, count", [(False, 4), (True, 8)])
+def test_draw_follows_task_mix(pool, weekend, count):
+    rng = random.Random(7)
+    total = sum(bot.TASK_MIX.values())
+    for user_id in range(50):
+        drawn = pool.draw_daily(user(user_id), weekend, rng)
+        assert len(drawn) == len(set(drawn)) == count
+        categories = Counter(pool.tasks[task_id]["category"] for task_id in drawn)
+        assert categories == {category: count * share // total for category, share in bot.TASK_MIX.items()}
+
+
+def test_closed_tasks_are_not_drawn(pool):
+    rng = random.Random(1)
+    data = user()
+    closed = set()
+    for _ in range(30):
+        for task_id in pool.draw_daily(data, weekend=False, rng=rng)[:2]:
+            assert task_id not in closed
+            assert pool.mark_done(data, pool.tasks[task_id])
+            assert not pool.mark_done(data, pool.tasks[task_id])
+            closed.add(task_id)
+    assert set(data["tasks_done"]) == closed
+
+
+def test_done_from_previous_session_is_respected(pool):
+    done = [task_id for task_id in pool.by_category["papa"]][:-1]
+    data = user(tasks_done=done)
+    rng = random.Random(3)
+    for _ in range(20):
+        drawn = pool.draw_daily(data, weekend=True, rng=rng)
+        assert not set(drawn) & set(done)
+        assert len(drawn) == 8  # Категория почти исчерпана — добор из остальных
+
+
+def test_unfinished_tasks_count_as_skipped(pool):
+    data = user()
+    rng = random.Random(5)
+    first = pool.draw_daily(data, weekend=False, rng=rng)
+    pool.mark_done(data, pool.tasks[first[0]])
+    pool.draw_daily(data, weekend=False, rng=rng)
+    stats = data["task_stats"]
+    assert stats[str(first[0])][1] == 0
+    for task_id in first[1:]:
+        assert stats[str(task_id)][1] == 1
+    assert "task_stats" in data.dirty
+
+
+def test_open_tasks_remove_keeps_positions():
+    open_tasks = bot.OpenTasks({"hero": [1, 2, 3, 4, 5]}, done={2})
+    for task_id in (1, 5, 5, 3):
+        open_tasks.remove(task_id, "hero")
+    assert sorted(open_tasks.ids["hero"]) == [4]
+    for task_id, i in open_tasks.pos.items():
+        assert open_tasks.ids["hero"][i] == task_id
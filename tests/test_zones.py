@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Таблицы переходов часовых поясов против zoneinfo"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import storoz_bot as bot
+
+DST_ZONES = ("Europe/Berlin", "America/New_York", "America/St_Johns", "America/Santiago",
+             "Australia/Lord_Howe", "Pacific/Chatham")
+ZONES = DST_ZONES + ("Europe/Moscow", "Asia/Kathmandu")
+STEP = 3 * 3600 + 17 * 60  # Неровный шаг, чтобы попадать в разные минуты часа
+
+
+def expected_utc(table, local):
+    return (bot.EPOCH_NAIVE + timedelta(seconds=local)).replace(tzinfo=table.zone).timestamp()
+
+
+@pytest.mark.parametrize("name", ZONES)
+def test_table_matches_zoneinfo(name):
+    table = bot.zone_table(name)
+    for ts in range(table.start, table.end, STEP):
+        assert table.offset(ts) == datetime.fromtimestamp(ts, table.zone).utcoffset().total_seconds()
+        assert table.to_utc(ts) == expected_utc(table, ts)
+
+
+@pytest.mark.parametrize("name", DST_ZONES)
+def test_around_every_transition(name):
+    table = bot.zone_table(name)
+    assert len(table.transitions) > 1
+    for change in table.transitions[1:]:
+        for local in range(change - 3 * 3600, change + 3 * 3600, 600):
+            assert table.to_utc(local) == expected_utc(table, local)
+
+
+def local_seconds(*args):
+    return (datetime(*args) - bot.EPOCH_NAIVE).total_seconds()
+
+
+def test_berlin_gap_and_repeat():
+    table = bot.zone_table("Europe/Berlin")
+    # 29.03.2026 02:30 не существует: как datetime с fold=0, по смещению до перехода (+1)
+    assert table.to_utc(local_seconds(2026, 3, 29, 2, 30)) == \
+        datetime(2026, 3, 29, 1, 30, tzinfo=timezone.utc).timestamp()
+    # 26.10.2025 02:30 бывает дважды: берётся первое, ещё летнее (+2)
+    assert table.to_utc(local_seconds(2025, 10, 26, 2, 30)) == \
+        datetime(2025, 10, 26, 0, 30, tzinfo=timezone.utc).timestamp()
+
+
+def test_unknown_zone():
+    with pytest.raises(KeyError):
+        bot.zone_table("Mars/Olympus")